@@ -0,0 +1,167 @@
+from operator import attrgetter
+
+import numpy as np
+
+from Classes import _TYPE_CODES
+
+# type codes of the type column, as in Appointment.
+CONSULTATION = _TYPE_CODES['consultation']
+EMERGENCY = _TYPE_CODES['emergency']
+
+
+class Columns:
+    """
+    Appointments of a schedule as equal-length NumPy arrays, one per field:
+    days (ordinal day), staff (staff id), types (type code), patients
+    (patient id) and minutes (time as minutes after midnight, -1 for a
+    whole-day appointment). requested holds the ordinal day each
+    appointment was requested on, or is None if it is not known.
+    A staff id is the position of the professional in staff_list and a
+    patient id the position of the patient in patient_list.
+    """
+
+    def __init__(self, days, staff, types, patients, minutes, staff_list,
+                 patient_list, requested=None):
+        self.days = days
+        self.staff = staff
+        self.types = types
+        self.patients = patients
+        self.minutes = minutes
+        self.staff_list = staff_list
+        self.patient_list = patient_list
+        self.requested = requested
+
+    def __repr__(self):
+        return f"Columns({len(self)} appointments)"
+
+    def __len__(self):
+        return len(self.days)
+
+
+def to_columns(appointments, requested=None):
+    """
+    Exports the appointments (e.g. schedule.appointments) to Columns. This is
+    the only loop over the appointments; the reports below work on the
+    arrays. requested can give the date ('%Y-%m-%d') or the ordinal day each
+    appointment was requested on, in the same order, for lead_time().
+    """
+    appointments = list(appointments)
+    count = len(appointments)
+    staff = {}
+    for appointment in appointments:
+        staff.setdefault(appointment.staff.emp_num, appointment.staff)
+    staff_ids = {emp_num: number for number, emp_num in enumerate(staff)}
+    patient_ids = {}
+    columns = Columns(
+        np.fromiter(map(attrgetter('a_ordinal'), appointments), np.int32,
+                    count),
+        np.fromiter((staff_ids[i.staff.emp_num] for i in appointments),
+                    np.int32, count),
+        np.fromiter(map(attrgetter('_type'), appointments), np.int8, count),
+        np.fromiter((patient_ids.setdefault(i.patient, len(patient_ids))
+                     for i in appointments), np.int32, count),
+        np.fromiter((-1 if i.a_minute is None else i.a_minute
+                     for i in appointments), np.int16, count),
+        list(staff.values()), list(patient_ids))
+    if requested is not None:
+        requested = list(requested)
+        if requested and isinstance(requested[0], str):
+            # NumPy dates count days from 1970-01-01.
+            columns.requested = (np.array(requested, 'datetime64[D]')
+                                 .astype(np.int32) + _EPOCH)
+        else:
+            columns.requested = np.array(requested, np.int32)
+    return columns
+
+
+# ordinal day of 1970-01-01.
+_EPOCH = 719163
+
+
+def week_starts(days):
+    """Returns the ordinal day of the Monday of the week of every day."""
+    # ordinal day 1 (0001-01-01) was a Monday.
+    return days - (days - 1) % 7
+
+
+def utilisation(columns, slots_per_day=1, days_per_week=7):
+    """
+    Returns the utilisation of every professional in every week they have
+    appointments in, as a dict of equal-length arrays: staff (staff id),
+    week (ordinal day of the Monday), booked (slots taken) and utilisation
+    (booked slots over the slots_per_day * days_per_week available). A
+    whole-day appointment takes all slots_per_day slots of its day.
+    """
+    weeks = week_starts(columns.days.astype(np.int64))
+    first_week = weeks.min() if len(weeks) else 0
+    week_numbers = (weeks - first_week) // 7
+    span = int(week_numbers.max()) + 1 if len(week_numbers) else 1
+    # every (staff, week) pair is a single integer, so the group-by is one
+    # bincount over staff * weeks counters rather than a sort.
+    taken = np.where(columns.minutes < 0, slots_per_day, 1)
+    booked = np.bincount(columns.staff.astype(np.int64) * span + week_numbers,
+                         weights=taken,
+                         minlength=len(columns.staff_list) * span)
+    keys = np.flatnonzero(booked)
+    booked = booked[keys].astype(np.int64)
+    return {
+        'staff': (keys // span).astype(np.int32),
+        'week': (keys % span * 7 + first_week).astype(np.int32),
+        'booked': booked,
+        'utilisation': booked / (slots_per_day * days_per_week),
+    }
+
+
+def emergency_share(columns):
+    """
+    Returns the share of emergencies among the appointments of every
+    professional, as a dict of arrays indexed by staff id: appointments,
+    emergencies and share. The share of the whole clinic is
+    emergencies.sum() / appointments.sum().
+    """
+    size = len(columns.staff_list)
+    appointments = np.bincount(columns.staff, minlength=size)
+    emergencies = np.bincount(columns.staff,
+                              weights=columns.types == EMERGENCY,
+                              minlength=size).astype(np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        share = emergencies / appointments
+    return {'appointments': appointments, 'emergencies': emergencies,
+            'share': share}
+
+
+def lead_time(columns):
+    """
+    Returns the lead time, in days from the request to the appointment, of
+    each appointment type as a dict: type code -> count, mean, median and
+    90th percentile (the first day by which half, or 90%, of the
+    appointments had taken place). It needs the requested column (see
+    to_columns).
+    """
+    if columns.requested is None:
+        raise ValueError('Request dates are not known')
+    lead = columns.days.astype(np.int64) - columns.requested
+    report = {}
+    if not len(lead):
+        return report
+    # lead times are whole days in a small range, so a histogram of each
+    # type gives the percentiles without sorting.
+    low = lead.min()
+    span = int(lead.max() - low) + 1
+    # types is int8, so it is widened before the multiplication overflows
+    # it once lead times span more than 127 days.
+    histograms = np.bincount(columns.types.astype(np.int64) * span
+                             + (lead - low),
+                             minlength=2 * span).reshape(2, span)
+    for code in (CONSULTATION, EMERGENCY):
+        histogram = histograms[code]
+        count = int(histogram.sum())
+        if count:
+            cumulative = np.cumsum(histogram)
+            median, ninetieth = np.searchsorted(
+                cumulative, [count * 0.5, count * 0.9]) + low
+            report[code] = {
+                'count': count,
+                'mean': float(histogram @ np.arange(span) / count + low),
+                'median': int(median), 'p90': int(ninetieth)}
+    return report
@@ -0,0 +1,750 @@
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import math
+import platform
+import random
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import zip_longest
+
+from Classes import Appointment, AppointmentSchedule, Doctor, Nurse, Patient, \
+    Receptionist, _minutes_time, _time_minutes, check_availability
+from Database import SqliteSchedule
+from Journal import DurableSchedule
+from Service import BookingService
+from Sharding import ShardedSchedule
+
+FIRST_DAY = datetime.date(2022, 6, 1).toordinal()
+
+
+def make_staff(staff_count):
+    """Returns staff_count professionals, every other one a nurse."""
+    return [Doctor(f'doctor{i}', f'd{i:04d}') if i % 2 == 0 else
+            Nurse(f'nurse{i}', f'n{i:04d}') for i in range(staff_count)]
+
+
+def make_patients(patient_count):
+    return [Patient(f'patient{i}', f'{i} Street', f'07{i:09d}')
+            for i in range(patient_count)]
+
+
+def random_date(rng, days):
+    """Returns a random date among the days days from FIRST_DAY."""
+    return str(datetime.date.fromordinal(FIRST_DAY + rng.randrange(days)))
+
+
+def stress_concurrent_booking(threads=8, staff_count=20, patient_count=200,
+                              requests_per_thread=2000, days=60, seed=0,
+                              switch_interval=1e-5):
+    """
+    Several receptionists book, and sometimes cancel, appointments in one
+    concurrent AppointmentSchedule from a thread pool. A very short thread
+    switch interval makes the threads interleave as often as possible. It
+    returns the throughput and the number of double bookings (same
+    professional on the same day), which has to be 0.
+    """
+    rng = random.Random(seed)
+    staff = make_staff(staff_count)
+    patients = make_patients(patient_count)
+    workloads = []
+    for worker in range(threads):
+        workload = []
+        for _ in range(requests_per_thread):
+            a_date = random_date(rng, days)
+            a_type = 'emergency' if rng.random() < 0.2 else 'consultation'
+            workload.append((rng.random() < 0.1, a_type, rng.choice(staff),
+                             rng.choice(patients), a_date))
+        workloads.append((Receptionist(f'receptionist{worker}',
+                                       f'r{worker:03d}'), workload))
+    schedule = AppointmentSchedule(concurrent=True)
+
+    def work(receptionist, workload):
+        for cancel, a_type, professional, patient, a_date in workload:
+            if cancel:
+                receptionist.cancel_appointment(a_type, professional, patient,
+                                                schedule, a_date)
+            else:
+                receptionist.make_appointment(a_type, professional, patient,
+                                              schedule, a_date)
+
+    old_interval = sys.getswitchinterval()
+    sys.setswitchinterval(switch_interval)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for future in [pool.submit(work, *i) for i in workloads]:
+                future.result()
+        seconds = time.perf_counter() - start
+    finally:
+        sys.setswitchinterval(old_interval)
+    slots = Counter((i.staff.emp_num, i.a_ordinal)
+                    for i in schedule.appointments)
+    operations = threads * requests_per_thread
+    return {
+        'threads': threads,
+        'operations': operations,
+        'seconds': seconds,
+        'operations_per_second': operations / seconds,
+        'appointments': len(schedule.appointments),
+        'double_bookings': sum(count - 1 for count in slots.values()),
+    }
+
+
+def async_booking_load(clients=1000, requests_per_client=10, staff_count=50,
+                       patient_count=500, days=365, window=0.001, seed=0):
+    """
+    Load generator for BookingService: clients coroutines run in one event
+    loop, each making requests_per_client bookings (some of them lookups and
+    cancellations) one after another. It returns the throughput and how many
+    requests were coalesced into a batch on average.
+    """
+    rng = random.Random(seed)
+    staff = make_staff(staff_count)
+    patients = make_patients(patient_count)
+    workloads = [[(rng.random(), rng.choice(staff), rng.choice(patients),
+                   random_date(rng, days))
+                  for _ in range(requests_per_client)]
+                 for _ in range(clients)]
+    service = BookingService(AppointmentSchedule(), window=window)
+
+    async def client(workload):
+        for draw, professional, patient, a_date in workload:
+            if draw < 0.1:
+                await service.cancel_appointment('consultation', professional,
+                                                 patient, a_date)
+            elif draw < 0.2:
+                await service.find_next_available('consultation',
+                                                  professional, patient,
+                                                  a_date)
+            else:
+                a_type = 'emergency' if draw < 0.3 else 'consultation'
+                await service.make_appointment(a_type, professional, patient,
+                                               a_date)
+
+    async def run():
+        await asyncio.gather(*(client(i) for i in workloads))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    seconds = time.perf_counter() - start
+    return {
+        'clients': clients,
+        'requests': service.requests,
+        'seconds': seconds,
+        'requests_per_second': service.requests / seconds,
+        'batches': service.batches,
+        'requests_per_batch': service.requests / service.batches,
+        'appointments': len(service.schedule.appointments),
+    }
+
+
+def sharded_bulk_booking(shards=2, requests=100000, staff_count=200,
+                         patient_count=5000, days=365, seed=0):
+    """
+    Books requests patient's requests in bulk into a ShardedSchedule with
+    shards worker processes. With shards=0 a single AppointmentSchedule in
+    this process is used, as a baseline. It returns the throughput.
+    """
+    rng = random.Random(seed)
+    staff = make_staff(staff_count)
+    patients = make_patients(patient_count)
+    batch = [rng.choice(patients).request_appointment(
+        'emergency' if rng.random() < 0.2 else 'consultation',
+        rng.choice(staff), random_date(rng, days)) for _ in range(requests)]
+    schedule = ShardedSchedule(shards) if shards else AppointmentSchedule()
+    try:
+        start = time.perf_counter()
+        Receptionist.make_appointments_bulk(batch, schedule)
+        seconds = time.perf_counter() - start
+    finally:
+        if shards:
+            schedule.close()
+    return {
+        'shards': shards,
+        'requests': requests,
+        'seconds': seconds,
+        'requests_per_second': requests / seconds,
+    }
+
+
+def appointment_memory(count=100000, staff_count=50, patient_count=1000,
+                       days=365, seed=0):
+    """
+    Creates count appointments as a receptionist would (from date strings)
+    and returns the memory they take, measured with tracemalloc, without
+    the staff and patients they refer to. A dict-backed Appointment took
+    136 bytes; the slotted one takes 72.
+    """
+    rng = random.Random(seed)
+    staff = make_staff(staff_count)
+    patients = make_patients(patient_count)
+    dates = [str(datetime.date.fromordinal(FIRST_DAY + i))
+             for i in range(days)]
+    choices = [(rng.random() < 0.2, rng.randrange(staff_count),
+                rng.randrange(patient_count), rng.randrange(days))
+               for _ in range(count)]
+    # parse the dates once, so their cache is not counted.
+    for a_date in dates:
+        Appointment('consultation', staff[0], patients[0], a_date)
+    gc.collect()
+    tracemalloc.start()
+    appointments = [Appointment('emergency' if emergency else 'consultation',
+                                staff[professional], patients[patient],
+                                dates[day])
+                    for emergency, professional, patient, day in choices]
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the list holding them is not part of an appointment.
+    allocated -= sys.getsizeof(appointments)
+    return {
+        'appointments': len(appointments),
+        'bytes': allocated,
+        'bytes_per_appointment': allocated / count,
+    }
+
+
+class ReferenceSchedule:
+    """
+    The schedule as it was before any optimisation, kept frozen as the
+    reference of differential_fuzz(): a plain list of appointments sorted
+    after every change, where every check, search and cancellation is a
+    linear scan. It has one fix over the original: find_next_available
+    never returns a day before starting_date, which the original pairwise
+    walk could. Time slots (slot_minutes, day_start, day_end) are supported
+    by the same scans; other options of the optimised schedules are
+    ignored. Only bookings to a particular professional are supported.
+    """
+
+    def __init__(self, slot_minutes=None, day_start='09:00', day_end='17:00',
+                 **options):
+        self.appointments = []
+        self.slot_minutes = slot_minutes
+        # minutes after midnight at which the slots start.
+        if slot_minutes:
+            start = _time_minutes(day_start)
+            self.slots = list(range(start, _time_minutes(day_end)
+                                    - slot_minutes + 1, slot_minutes))
+        else:
+            self.slots = []
+
+    def __repr__(self):
+        return f"ReferenceSchedule({self.slot_minutes})"
+
+    def staff_lock(self, staff):
+        return nullcontext()
+
+    def add_appointment(self, appointment):
+        """This function adds the appointment to the schedule's list."""
+        self.appointments.append(appointment)
+        self.sort()
+        return appointment
+
+    def cancel_appointment(self, appointment):
+        """This function removes an appointment form the schedule's list."""
+        for index, i in enumerate(self.appointments):
+            if appointment == i:
+                return self.appointments.pop(index)
+        return None
+
+    def sort(self):
+        """This function sorts appointments in the schedule's list by date."""
+        self.appointments.sort(key=lambda appointment: appointment.a_date)
+
+    def is_available(self, staff, a_date, a_time=None):
+        if a_date is None:
+            return True
+        taken = self._taken(staff, a_date)
+        if not self.slot_minutes:
+            return not taken
+        if a_time is None:
+            return any(self._free(taken, minute) for minute in self.slots)
+        minute = _time_minutes(a_time)
+        if minute not in self.slots:
+            raise ValueError('Wrong time')
+        return self._free(taken, minute)
+
+    def find_next_available(self, a_type, staff, patient, starting_date,
+                            starting_time=None):
+        """
+        This function finds next available slot to make an appointment to
+        a particular healthcare specialist, looking at one day after another
+        from starting_date. With time slots, the first day is looked at from
+        starting_time.
+        """
+        a_date = starting_date
+        first = 0 if starting_time is None else _time_minutes(starting_time)
+        while True:
+            taken = self._taken(staff, a_date)
+            if not self.slot_minutes:
+                if not taken:
+                    return Appointment(a_type, staff, patient, a_date)
+            else:
+                for minute in self.slots:
+                    if minute >= first and self._free(taken, minute):
+                        return Appointment(a_type, staff, patient, a_date,
+                                           _minutes_time(minute))
+            a_date = str(datetime.date.fromisoformat(a_date)
+                         + datetime.timedelta(days=1))
+            first = 0
+
+    def book(self, a_type, staff, patient, a_date, a_time=None):
+        """This function books an appointment as Receptionist.make_appointment
+        originally did."""
+        if a_type == 'consultation':
+            new_appointment = Appointment(a_type, staff, patient, a_date,
+                                          a_time)
+            if check_availability(new_appointment, self) is True:
+                if a_time is None and self.slot_minutes:
+                    new_appointment = self.find_next_available(
+                        a_type, staff, patient, a_date)
+                return self.add_appointment(new_appointment)
+            return self.find_next_available(a_type, staff, patient, a_date,
+                                            a_time)
+        return self.add_appointment(self.find_next_available(
+            a_type, staff, patient, a_date, a_time))
+
+    def appointments_between(self, staff, start_date, end_date):
+        return iter([i for i in self.appointments
+                     if staff.emp_num == i.staff.emp_num and
+                     start_date <= i.a_date <= end_date])
+
+    def _taken(self, staff, a_date):
+        """Returns the minutes of the slots the professional has taken on
+        a_date. None stands for an appointment taking the whole day."""
+        return {i.a_minute if self.slot_minutes else None
+                for i in self.appointments
+                if staff.emp_num == i.staff.emp_num and i.a_date == a_date}
+
+    @staticmethod
+    def _free(taken, minute):
+        return minute not in taken and None not in taken
+
+
+def differential_fuzz(candidate, operations=10000, staff_count=6,
+                      patient_count=20, days=40, seed=0,
+                      reference=ReferenceSchedule, **options):
+    """
+    Runs the same seeded random sequence of make_appointment,
+    cancel_appointment, find_next_available, check_availability and
+    appointments_between calls against a reference schedule
+    (ReferenceSchedule) and a candidate engine, side by side, and
+    compares every result. candidate and reference are called with options
+    (e.g. slot_minutes) to make the schedules. A few staff over a few days
+    make long runs of booked days, and most cancellations hit a booked
+    appointment, so the gap search is exercised.
+    It returns the number of calls made, the first divergence (None if
+    there was none: the call number, the call and both results) and the
+    time each schedule spent in the calls, with the candidate's speedup.
+    Once the calls agree the final appointments are compared too, and the
+    first position where they differ is reported.
+    """
+    rng = random.Random(seed)
+    staff = make_staff(staff_count)
+    patients = make_patients(patient_count)
+    receptionist = Receptionist('Fuzzer', 'r000')
+    schedules = (reference(**options), candidate(**options))
+    seconds = [0.0, 0.0]
+    clock = time.perf_counter
+    divergence = None
+    made = 0
+    try:
+        for made in range(1, operations + 1):
+            call = _fuzz_call(rng, staff, patients, days, schedules[0],
+                              options.get('slot_minutes'))
+            results = []
+            for engine, schedule in enumerate(schedules):
+                start = clock()
+                try:
+                    result = _fuzz_outcome(_FUZZ_CALLS[call[0]](
+                        receptionist, schedule, *call[1:]))
+                except Exception as error:
+                    result = ('error', type(error).__name__)
+                seconds[engine] += clock() - start
+                results.append(result)
+            if results[0] != results[1]:
+                divergence = {'call': made, 'operation': _fuzz_outcome(call),
+                              'expected': results[0], 'actual': results[1]}
+                break
+        else:
+            final = [_fuzz_outcome(list(i.appointments)) for i in schedules]
+            for position, (expected, actual) in enumerate(
+                    zip_longest(*final)):
+                if expected != actual:
+                    divergence = {'call': None,
+                                  'operation': ('appointments', position),
+                                  'expected': expected, 'actual': actual}
+                    break
+    finally:
+        for schedule in schedules:
+            if hasattr(schedule, 'close'):
+                schedule.close()
+    return {
+        'calls': made,
+        'divergence': divergence,
+        'reference_seconds': seconds[0],
+        'candidate_seconds': seconds[1],
+        'speedup': seconds[0] / seconds[1] if seconds[1] else None,
+    }
+
+
+def _fuzz_call(rng, staff, patients, days, reference, slot_minutes):
+    """Returns a random call: its name and arguments."""
+    professional = rng.choice(staff)
+    a_date = random_date(rng, days)
+    a_time = None
+    if slot_minutes and rng.random() < 0.7:
+        a_time = f"{rng.randrange(8, 18):02d}:{rng.choice((0, 30)):02d}"
+    draw = rng.random()
+    if draw < 0.55:
+        a_type = 'emergency' if draw < 0.2 else 'consultation'
+        return ('make', a_type, professional, rng.choice(patients), a_date,
+                a_time)
+    if draw < 0.7:
+        booked = reference.appointments
+        if booked and rng.random() < 0.7:
+            appointment = booked[rng.randrange(len(booked))]
+            return ('cancel', appointment.a_type, appointment.staff,
+                    appointment.patient, appointment.a_date,
+                    appointment.a_time)
+        return ('cancel', 'consultation', professional, rng.choice(patients),
+                a_date, a_time)
+    if draw < 0.85:
+        return ('find', rng.choice(('consultation', 'emergency')),
+                professional, rng.choice(patients), a_date, a_time)
+    if draw < 0.95:
+        return ('available', professional, rng.choice(patients), a_date,
+                a_time)
+    return ('between', professional, a_date,
+            random_date(rng, days))
+
+
+_FUZZ_CALLS = {
+    'make': lambda receptionist, schedule, *arguments:
+        receptionist.make_appointment(*arguments[:3], schedule,
+                                      *arguments[3:]),
+    'cancel': lambda receptionist, schedule, *arguments:
+        receptionist.cancel_appointment(*arguments[:3], schedule,
+                                        *arguments[3:]),
+    'find': lambda receptionist, schedule, *arguments:
+        schedule.find_next_available(*arguments),
+    'available': lambda receptionist, schedule, *arguments:
+        check_availability(Appointment('consultation', *arguments),
+                           schedule),
+    'between': lambda receptionist, schedule, *arguments:
+        list(schedule.appointments_between(*arguments)),
+}
+
+
+def _fuzz_outcome(value):
+    """Returns a comparable form of a call, a result or a list of them, in
+    which staff and patients are their emp_num and name."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_fuzz_outcome(i) for i in value)
+    if isinstance(value, Appointment):
+        return (value.a_type, value.staff.emp_num, value.patient.name,
+                value.a_date, value.a_time)
+    if isinstance(value, (Doctor, Nurse)):
+        return value.emp_num
+    if isinstance(value, Patient):
+        return value.name
+    return value
+
+
+class Clinic:
+    """
+    A synthetic clinic made by generate_clinic(): its staff, patients and
+    appointments, spread over days days from FIRST_DAY.
+    """
+
+    def __init__(self, staff, patients, appointments, days):
+        self.staff = staff
+        self.patients = patients
+        self.appointments = appointments
+        self.days = days
+
+    def __repr__(self):
+        return f"Clinic({len(self.staff)} staff, {len(self.patients)} " \
+               f"patients, {len(self.appointments)} appointments, " \
+               f"{self.days} days)"
+
+
+def generate_clinic(appointments, staff_count=None, patient_count=None,
+                    density=0.8, emergency_share=0.2, seed=0):
+    """
+    Generates a clinic with the given number of appointments. density is
+    the share of staff-days that are booked and emergency_share the share of
+    emergencies among the appointments. By default there is a professional
+    for every 500 appointments and a patient for every 4. The same seed
+    always gives the same clinic.
+    """
+    rng = random.Random(seed)
+    staff_count = staff_count or max(2, appointments // 500)
+    patient_count = patient_count or max(10, appointments // 4)
+    days = max(1, math.ceil(appointments / (staff_count * density)))
+    if appointments > staff_count * days:
+        raise ValueError('Too many appointments for the staff and density')
+    staff = make_staff(staff_count)
+    patients = make_patients(patient_count)
+    types = ('consultation', 'emergency')
+    new_appointment = Appointment.from_ordinal
+    booked = [new_appointment(types[rng.random() < emergency_share],
+                              staff[slot % staff_count],
+                              patients[rng.randrange(patient_count)],
+                              FIRST_DAY + slot // staff_count)
+              for slot in rng.sample(range(staff_count * days),
+                                     appointments)]
+    return Clinic(staff, patients, booked, days)
+
+
+def _latencies(operation, arguments):
+    """Calls operation with every tuple of arguments and returns the time of
+    each call in nanoseconds."""
+    clock = time.perf_counter_ns
+    output = []
+    for i in arguments:
+        start = clock()
+        operation(*i)
+        output.append(clock() - start)
+    return output
+
+
+def _summary(latencies):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    total = sum(latencies)
+
+    def percentile(share):
+        return latencies[min(count - 1, int(share * count))] / 1000
+
+    return {
+        'calls': count,
+        'operations_per_second': count / (total / 1e9) if total else None,
+        'p50_us': percentile(0.50),
+        'p90_us': percentile(0.90),
+        'p99_us': percentile(0.99),
+        'max_us': latencies[-1] / 1000,
+    }
+
+
+def benchmark_size(appointments, operations=1000, seed=0, trace_memory=False,
+                   **clinic_options):
+    """
+    Builds a schedule of a synthetic clinic of the given size and times
+    operations calls of make_appointment, cancel_appointment,
+    find_next_available and check_availability on it. The calls are drawn
+    with the same seed every run. It returns the latencies and throughput of
+    each operation, the time to build the schedule and its peak memory
+    (traced with tracemalloc if trace_memory is True, which is slow). The
+    highest memory use of the whole process so far is also given; as
+    earlier sizes count towards it, it is only the peak of this size when
+    the size is run in a fresh process.
+    """
+    clinic = generate_clinic(appointments, seed=seed, **clinic_options)
+    rng = random.Random(seed + 1)
+    receptionist = Receptionist('Benchmark', 'r000')
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    schedule = AppointmentSchedule()
+    schedule.add_appointments(clinic.appointments)
+    build_seconds = time.perf_counter() - start
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        peak_memory = None
+
+    def request():
+        return (rng.choice(clinic.staff), rng.choice(clinic.patients),
+                random_date(rng, clinic.days))
+
+    makes = []
+    for _ in range(operations):
+        staff, patient, a_date = request()
+        makes.append(('consultation', staff, patient, schedule, a_date))
+    cancels = [(i.a_type, i.staff, i.patient, schedule, i.a_date)
+               for i in rng.sample(clinic.appointments,
+                                   min(operations, appointments))]
+    finds = []
+    checks = []
+    for _ in range(operations):
+        staff, patient, a_date = request()
+        finds.append(('emergency', staff, patient, a_date))
+        checks.append((Appointment('consultation', staff, patient, a_date),
+                       schedule))
+    gc.collect()
+    results = {
+        'make_appointment': _latencies(receptionist.make_appointment, makes),
+        'cancel_appointment': _latencies(receptionist.cancel_appointment,
+                                         cancels),
+        'find_next_available': _latencies(schedule.find_next_available,
+                                          finds),
+        'check_availability': _latencies(check_availability, checks),
+    }
+    return {
+        'appointments': appointments,
+        'staff': len(clinic.staff),
+        'patients': len(clinic.patients),
+        'days': clinic.days,
+        'build_seconds': build_seconds,
+        'build_appointments_per_second': appointments / build_seconds,
+        'peak_traced_bytes': peak_memory,
+        'process_peak_rss_kb': _process_peak_rss_kb(),
+        'operations': {name: _summary(latencies)
+                       for name, latencies in results.items()},
+    }
+
+
+def _process_peak_rss_kb():
+    """Returns the highest memory use of the process so far in kilobytes,
+    or None where there is no resource module (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_suite(sizes=(10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7),
+              operations=1000, seed=0, output=None, trace_memory=False,
+              **clinic_options):
+    """
+    Runs benchmark_size() for every size and returns the results together
+    with the settings and the Python version. If output is given they are
+    also written there as JSON, to be compared with compare_results().
+    """
+    results = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': seed,
+        'operations': operations,
+        'clinic_options': clinic_options,
+        'sizes': [],
+    }
+    for size in sizes:
+        results['sizes'].append(benchmark_size(
+            size, operations, seed, trace_memory, **clinic_options))
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+def compare_results(old, new):
+    """
+    Compares two results of run_suite() (or the JSON files they were written
+    to). For every size both have and every operation it returns the ratio
+    of new to old p50 latency and throughput, so a p50 ratio above 1 is a
+    slowdown.
+    """
+    if isinstance(old, str):
+        with open(old) as file:
+            old = json.load(file)
+    if isinstance(new, str):
+        with open(new) as file:
+            new = json.load(file)
+    old_sizes = {i['appointments']: i for i in old['sizes']}
+    output = []
+    for size in new['sizes']:
+        before = old_sizes.get(size['appointments'])
+        if before is None:
+            continue
+        for name, after in size['operations'].items():
+            previous = before['operations'][name]
+            output.append({
+                'appointments': size['appointments'],
+                'operation': name,
+                'p50_ratio': after['p50_us'] / previous['p50_us'],
+                'throughput_ratio': after['operations_per_second'] /
+                previous['operations_per_second'],
+            })
+    return output
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks of the appointment schedule.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    suite = commands.add_parser(
+        'suite', help='time schedule operations on synthetic clinics')
+    suite.add_argument('--sizes', type=int, nargs='+',
+                       default=[10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5])
+    suite.add_argument('--operations', type=int, default=1000)
+    suite.add_argument('--seed', type=int, default=0)
+    suite.add_argument('--staff', type=int, dest='staff_count')
+    suite.add_argument('--patients', type=int, dest='patient_count')
+    suite.add_argument('--density', type=float, default=0.8)
+    suite.add_argument('--emergency-share', type=float, default=0.2)
+    suite.add_argument('--trace-memory', action='store_true')
+    suite.add_argument('--output')
+    compare = commands.add_parser('compare',
+                                  help='compare two suite JSON files')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    commands.add_parser('stress', help='threaded booking stress test')
+    commands.add_parser('async', help='asyncio booking service load')
+    commands.add_parser('sharded', help='bulk booking across shards')
+    commands.add_parser('memory', help='memory taken by an appointment')
+    fuzz = commands.add_parser(
+        'fuzz', help='compare an engine with the reference schedule')
+    fuzz.add_argument('candidate',
+                      choices=['memory', 'concurrent', 'durable', 'sqlite',
+                               'sharded'])
+    fuzz.add_argument('--operations', type=int, default=10000)
+    fuzz.add_argument('--seed', type=int, default=0)
+    fuzz.add_argument('--slot-minutes', type=int)
+    options = parser.parse_args(arguments)
+    if options.command == 'suite':
+        clinic_options = {'density': options.density,
+                          'emergency_share': options.emergency_share}
+        if options.staff_count:
+            clinic_options['staff_count'] = options.staff_count
+        if options.patient_count:
+            clinic_options['patient_count'] = options.patient_count
+        results = run_suite(options.sizes, options.operations, options.seed,
+                            options.output, options.trace_memory,
+                            **clinic_options)
+        print(json.dumps(results, indent=2))
+    elif options.command == 'compare':
+        for row in compare_results(options.old, options.new):
+            print(row)
+    elif options.command == 'stress':
+        for threads in (1, 2, 4, 8):
+            print(stress_concurrent_booking(threads=threads))
+    elif options.command == 'async':
+        print(async_booking_load())
+    elif options.command == 'memory':
+        print(appointment_memory())
+    elif options.command == 'fuzz':
+        with tempfile.TemporaryDirectory() as directory:
+            candidates = {
+                'memory': AppointmentSchedule,
+                'concurrent': lambda **schedule_options: AppointmentSchedule(
+                    concurrent=True, **schedule_options),
+                'durable': lambda **schedule_options: DurableSchedule(
+                    os.path.join(directory, 'journal'), **schedule_options),
+                'sqlite': lambda **schedule_options: SqliteSchedule(
+                    os.path.join(directory, 'schedule.db'),
+                    **schedule_options),
+                'sharded': ShardedSchedule,
+            }
+            print(differential_fuzz(candidates[options.candidate],
+                                    options.operations, seed=options.seed,
+                                    slot_minutes=options.slot_minutes))
+    else:
+        for shards in (0, 1, 2, 4):
+            print(sharded_bulk_booking(shards))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,14 @@
 import datetime
-from datetime import timedelta
+import threading
+import time
+from heapq import heapify, heappop, heappush, heapreplace
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from contextlib import ExitStack, nullcontext
+from functools import lru_cache
+from itertools import islice
+from operator import attrgetter, gt
 
 
 class Receptionist:
@@ -19,7 +28,8 @@ class Receptionist:
         return f"Receptionist({self.name}, {self.emp_num})"
 
     @staticmethod
-    def make_appointment(a_type, staff, patient, schedule, a_date=None):
+    def make_appointment(a_type, staff, patient, schedule, a_date=None,
+                         a_time=None, waitlist=None, preemptions=None):
         """
         This function makes an appointment and adds it to the schedule.
         It accepts either a patient's request for the appointment or it can be
@@ -30,6 +40,18 @@ class Receptionist:
         it is added to the schedule. The search for next available starts form
         alternative_date, which is automatically today's date if a_date has not
         been provided.
+        If the schedule has time slots, a_time ('%H:%M') asks for a particular
+        slot; without it the first free slot of the day is booked.
+        If staff is None, the appointment is made to the healthcare
+        professional who is free first; staff can also be Doctor or Nurse to
+        choose among doctors or nurses only.
+        If a Waitlist is given, a patient who only gets an alternative on a
+        later day for a consultation with a particular professional is put on
+        it, to be booked if an earlier day is canceled.
+        If preemptions (a list, or anything with append) is given, an
+        emergency to a particular professional can take the place of a
+        consultation on the requested day, see AppointmentSchedule.preempt(),
+        and a Preemption is appended to it for every patient moved.
         """
         today = str(datetime.date.today())
         if a_date is None:
@@ -37,37 +59,54 @@ class Receptionist:
         else:
             alternative_date = a_date
 
-        # new_appointment = Appointment(a_type, staff, patient, a_date)
-        if a_type == 'consultation':
-            new_appointment = Appointment(a_type, staff, patient,
-                                          alternative_date)
-            if check_availability(new_appointment, schedule) is True:
-                schedule.add_appointment(new_appointment)
-                return new_appointment
-            else:
-                next_available = schedule.find_next_available(
-                    a_type, staff, patient, alternative_date)
-                return next_available
-        else:
-            next_available = schedule.find_next_available(
-                a_type, staff, patient, alternative_date)
-            schedule.add_appointment(next_available)
-            return next_available
+        if a_type == 'emergency' and preemptions is not None and \
+                isinstance(staff, HealthcareProfessional):
+            new_appointment, moved = schedule.preempt(staff, patient,
+                                                      alternative_date, a_time)
+            for preemption in moved:
+                preemptions.append(preemption)
+            return new_appointment
+        new_appointment = schedule.book(a_type, staff, patient,
+                                        alternative_date, a_time)
+        if waitlist is not None and a_type == 'consultation' and \
+                isinstance(staff, HealthcareProfessional) and \
+                new_appointment.a_date != alternative_date:
+            waitlist.add(Appointment(a_type, staff, patient,
+                                     alternative_date, a_time))
+        return new_appointment
+
+    @staticmethod
+    def make_appointments_bulk(requests, schedule):
+        """
+        This function makes appointments for many patient's requests (as
+        returned by Patient.request_appointment) at once. Each request is
+        handled as make_appointment would handle it if the requests were made
+        one by one in the given order, and the booked or alternative
+        appointments are returned in that order.
+        """
+        today = str(datetime.date.today())
+        return schedule.book_many(requests, today)
 
     @staticmethod
-    def cancel_appointment(a_type, staff, patient, schedule, a_date=None):
+    def cancel_appointment(a_type, staff, patient, schedule, a_date=None,
+                           a_time=None, waitlist=None):
         """
         This method manages canceling appointments form AppointmentSchedule.
         It checks first, whether the requested appointment to
         cancel exists. Next, the appointment is removed form schedule.
         Otherwise returns None.
+        If a Waitlist is given, the freed slot is booked for the patient
+        waiting first for it, see Waitlist.fill().
         """
-        to_cancel = Appointment(a_type, staff, patient, a_date)
-        if check_availability(to_cancel, schedule) is False:
-            canceled_appointment = schedule.cancel_appointment(to_cancel)
-            return canceled_appointment
-        else:
-            return None
+        to_cancel = Appointment(a_type, staff, patient, a_date, a_time)
+        with schedule.staff_lock(staff):
+            if check_availability(to_cancel, schedule) is False:
+                canceled_appointment = schedule.cancel_appointment(to_cancel)
+                if canceled_appointment is not None and waitlist is not None:
+                    waitlist.fill(schedule, canceled_appointment)
+                return canceled_appointment
+            else:
+                return None
 
 
 class HealthcareProfessional:
@@ -75,6 +114,8 @@ class HealthcareProfessional:
     is a parent class for Doctor and Nurse classes. HealthcareProfessional
     class can make a note using consultation method."""
 
+    __slots__ = ('name', 'emp_num')
+
     def __init__(self, name, emp_num):
         self.name = name
         self.emp_num = emp_num
@@ -88,15 +129,21 @@ class Doctor(HealthcareProfessional):
     Appointment as one of its attributes. Doctor class also issues prescriptions
     for patients."""
 
+    __slots__ = ()
+
     def __str__(self):
         return f"Dr {self.name} [{self.emp_num}]"
 
     def __repr__(self):
         return f"Doctor({self.name}, {self.emp_num}"
 
-    def issue_prescription(self, p_type, patient, quantity, dosage):
-        """This function returns a prescription issued by a doctor."""
+    def issue_prescription(self, p_type, patient, quantity, dosage,
+                           registry=None):
+        """This function returns a prescription issued by a doctor. If a
+        PrescriptionRegistry is given, the prescription is added to it."""
         new_prescription = Prescription(p_type, patient, self, quantity, dosage)
+        if registry is not None:
+            registry.add(new_prescription)
         return new_prescription
 
     def accept_request(self, prescription, quantity, dosage):
@@ -107,11 +154,26 @@ class Doctor(HealthcareProfessional):
         prescription.quantity = quantity
         return prescription
 
+    def accept_requests(self, requests, registry=None):
+        """
+        This function accepts many repeated prescriptions at once. requests
+        are (prescription, quantity, dosage) tuples, and the accepted
+        prescriptions are returned in the same order. If the prescriptions
+        are in a PrescriptionRegistry, it has to be given, so that it can
+        move them out of the pending repeats.
+        """
+        if registry is not None:
+            return registry.accept_requests(self, requests)
+        return [self.accept_request(prescription, quantity, dosage)
+                for prescription, quantity, dosage in requests]
+
 
 class Nurse(HealthcareProfessional):
     """It represents a nurse who works in the surgery. This class is added to
     Appointment as one of its attributes."""
 
+    __slots__ = ()
+
     def __str__(self):
         return f"{self.name}, nurse [{self.emp_num}]"
 
@@ -122,12 +184,17 @@ class Nurse(HealthcareProfessional):
 class Patient:
     """It represents a patient who is registered to the surgery. This class is
     added to Appointment as one of its attributes. Patient Class can request
-    an appointment and a repeat prescription."""
+    an appointment and a repeat prescription. patient_id is the patient's
+    stable id in a PatientRegistry, or None if the patient is not
+    registered."""
+
+    __slots__ = ('name', 'address', 'phone', 'patient_id')
 
     def __init__(self, name: str, address: str, phone: str):
         self.name = name
         self.address = address
         self.phone = phone
+        self.patient_id = None
 
     def __str__(self):
         return f"Patient: {self.name}"
@@ -135,16 +202,19 @@ class Patient:
     def __repr__(self):
         return f"Patient({self.name}, {self.address}, {self.phone})"
 
-    def request_repeat(self, doctor: Doctor):
+    def request_repeat(self, doctor: Doctor, registry=None):
         """This function returns a repeated prescription for a patient that has
-        to be approved by a doctor."""
+        to be approved by a doctor. If a PrescriptionRegistry is given, the
+        request is added to it as a pending repeat."""
         new_prescription = Prescription('repeat', self, doctor)
+        if registry is not None:
+            registry.add(new_prescription)
         return new_prescription
 
-    def request_appointment(self, a_type, staff, a_date):
+    def request_appointment(self, a_type, staff, a_date, a_time=None):
         """This function returns an appointment that has to be checked and
         added to the schedule by a receptionist."""
-        new_appointment = Appointment(a_type, staff, self, a_date)
+        new_appointment = Appointment(a_type, staff, self, a_date, a_time)
         return new_appointment
 
 
@@ -152,6 +222,8 @@ class Prescription:
     """It represents a prescription that is issued by a doctor to a patient.
     p_type can be either 'repeat' or 'normal'."""
 
+    __slots__ = ('p_type', 'patient', 'doctor', 'quantity', 'dosage')
+
     def __init__(self, p_type: str, patient: Patient, doctor: Doctor,
                  quantity: int = None, dosage: float = None):
         if p_type == 'repeat' or p_type == 'normal':
@@ -181,44 +253,343 @@ class Prescription:
             return False
 
 
+class PatientRegistry:
+    """
+    It keeps one Patient object per person registered to the surgery. A
+    patient is identified by name, address and phone, compared after
+    normalising them (see normalise_name() and normalise_phone()), and gets
+    a stable patient_id: the position in the registry. Patients are also
+    indexed by phone and by name for lookups at the front desk; several
+    patients can share a phone number or a name.
+    """
+
+    def __init__(self):
+        self._patients = []
+        # (name, address, phone) normalised -> patient.
+        self._keys = {}
+        self._by_phone = {}
+        self._by_name = {}
+
+    def __str__(self):
+        return f"Registry of {len(self)} patients"
+
+    def __repr__(self):
+        return f"PatientRegistry()"
+
+    def __len__(self):
+        return len(self._patients)
+
+    def __iter__(self):
+        return iter(self._patients)
+
+    def __getitem__(self, patient_id):
+        return self._patients[patient_id]
+
+    def __contains__(self, patient):
+        patient_id = patient.patient_id
+        return patient_id is not None and \
+            patient_id < len(self._patients) and \
+            self._patients[patient_id] is patient
+
+    def register(self, name, address, phone):
+        """Returns the registered patient with the given details, creating
+        one if there is none yet."""
+        key = _patient_key(name, address, phone)
+        patient = self._keys.get(key)
+        if patient is None:
+            patient = self._add(Patient(name, address, phone), key)
+        return patient
+
+    def intern(self, patient):
+        """Returns the registered patient with the same details as patient.
+        If there is none, patient itself is registered and returned."""
+        key = _patient_key(patient.name, patient.address, patient.phone)
+        registered = self._keys.get(key)
+        if registered is None:
+            registered = self._add(patient, key)
+        return registered
+
+    def find_by_phone(self, phone):
+        """Returns the patients with the phone number."""
+        return list(self._by_phone.get(normalise_phone(phone), ()))
+
+    def find_by_name(self, name):
+        """Returns the patients with the name, ignoring case and extra
+        spaces."""
+        return list(self._by_name.get(normalise_name(name), ()))
+
+    def _add(self, patient, key):
+        if patient.patient_id is not None:
+            raise ValueError('Patient is registered already')
+        patient.patient_id = len(self._patients)
+        self._patients.append(patient)
+        self._keys[key] = patient
+        name, _, phone = key
+        self._by_phone.setdefault(phone, []).append(patient)
+        self._by_name.setdefault(name, []).append(patient)
+        return patient
+
+
+def normalise_name(name):
+    """Returns the name in lower case with single spaces between words."""
+    return ' '.join(name.split()).casefold()
+
+
+def normalise_phone(phone):
+    """Returns the digits of the phone number, keeping a leading '+'."""
+    if phone.isdigit():
+        return phone
+    digits = ''.join(i for i in phone if i.isdigit())
+    return '+' + digits if phone.strip().startswith('+') else digits
+
+
+def _patient_key(name, address, phone):
+    return normalise_name(name), normalise_name(address), \
+        normalise_phone(phone)
+
+
+class PrescriptionRegistry:
+    """
+    It stores the prescriptions of the surgery, indexed by patient, by
+    doctor and by p_type. A repeat that has no quantity yet is a pending
+    request waiting for a doctor, and pending repeats are indexed by the
+    doctor they were requested from.
+    Each index maps its key to a dict of id(prescription) -> prescription,
+    so looking up, adding and removing a prescription are O(1) and lookups
+    return prescriptions in the order they were added. The patient, doctor
+    and p_type of a stored prescription should only be changed through the
+    registry (e.g. accept_requests()), as the indexes rely on them.
+    """
+
+    def __init__(self):
+        self._prescriptions = {}
+        self._by_patient = {}
+        self._by_doctor = {}
+        self._by_type = {}
+        self._pending = {}
+
+    def __str__(self):
+        return f"Registry of {len(self)} prescriptions"
+
+    def __repr__(self):
+        return f"PrescriptionRegistry()"
+
+    def __len__(self):
+        return len(self._prescriptions)
+
+    def __iter__(self):
+        return iter(list(self._prescriptions.values()))
+
+    def __contains__(self, prescription):
+        return id(prescription) in self._prescriptions
+
+    def add(self, prescription):
+        """Adds the prescription, unless it is already in the registry."""
+        key = id(prescription)
+        if key not in self._prescriptions:
+            self._prescriptions[key] = prescription
+            self._index(key, prescription)
+        return prescription
+
+    def add_prescriptions(self, prescriptions):
+        for prescription in prescriptions:
+            self.add(prescription)
+
+    def remove(self, prescription):
+        """Removes the prescription and returns it, or returns None if it is
+        not in the registry."""
+        key = id(prescription)
+        if self._prescriptions.pop(key, None) is None:
+            return None
+        self._unindex(key, prescription)
+        return prescription
+
+    def for_patient(self, patient):
+        """Returns the prescriptions of the patient."""
+        return list(self._by_patient.get(patient, {}).values())
+
+    def for_doctor(self, doctor):
+        """Returns the prescriptions issued by, or requested from, the
+        doctor."""
+        return list(self._by_doctor.get(doctor, {}).values())
+
+    def of_type(self, p_type):
+        """Returns the 'repeat' or the 'normal' prescriptions."""
+        return list(self._by_type.get(p_type, {}).values())
+
+    def pending_repeats(self, doctor=None):
+        """Returns the repeats requested from the doctor (from any doctor if
+        doctor is None) that have not been accepted yet."""
+        if doctor is None:
+            return [prescription for pending in self._pending.values()
+                    for prescription in pending.values()]
+        return list(self._pending.get(doctor, {}).values())
+
+    def accept_requests(self, doctor, requests):
+        """
+        This function accepts many repeated prescriptions, given as
+        (prescription, quantity, dosage) tuples, by the doctor and returns
+        them in the same order. Each of them is moved from the pending
+        repeats to the prescriptions of the accepting doctor.
+        """
+        accepted = []
+        for prescription, quantity, dosage in requests:
+            key = id(prescription)
+            stored = key in self._prescriptions
+            if stored:
+                self._unindex(key, prescription)
+            doctor.accept_request(prescription, quantity, dosage)
+            if stored:
+                self._index(key, prescription)
+            accepted.append(prescription)
+        return accepted
+
+    def _index(self, key, prescription):
+        self._by_patient.setdefault(prescription.patient, {})[key] = \
+            prescription
+        self._by_doctor.setdefault(prescription.doctor, {})[key] = \
+            prescription
+        self._by_type.setdefault(prescription.p_type, {})[key] = prescription
+        if _is_pending(prescription):
+            self._pending.setdefault(prescription.doctor, {})[key] = \
+                prescription
+
+    def _unindex(self, key, prescription):
+        _discard(self._by_patient, prescription.patient, key)
+        _discard(self._by_doctor, prescription.doctor, key)
+        _discard(self._by_type, prescription.p_type, key)
+        if _is_pending(prescription):
+            _discard(self._pending, prescription.doctor, key)
+
+
+def _is_pending(prescription):
+    return prescription.p_type == 'repeat' and prescription.quantity is None
+
+
+def _discard(index, index_key, key):
+    """Removes key from the dict stored in index under index_key, and drops
+    the dict when it becomes empty."""
+    entries = index[index_key]
+    del entries[key]
+    if not entries:
+        del index[index_key]
+
+
 class Appointment:
     """
     The class represent an appointment to a healthcare professional.
     a_type represents if it is a consultation or an emergency;
     staff represents either a doctor or a nurse;
-    a_date represents a day when the appointment takes place.
+    a_date represents a day when the appointment takes place;
+    a_time ('%H:%M') represents the start of its slot, if the schedule has
+    time slots. An appointment without a_time takes the whole day.
     Appointments are created and managed by receptionist and are stored in
     AppointmentSchedule class.
+    An archive can hold millions of appointments, so they are kept small:
+    there is no __dict__, the type is stored as a code, the date as an
+    ordinal day (a_ordinal) and the time as minutes after midnight
+    (a_minute). a_type, a_date and a_time are made from them when read.
+    This takes an appointment from 136 to 72 bytes on 64-bit CPython (see
+    Benchmarks.appointment_memory()).
     """
 
+    __slots__ = ('_type', 'staff', 'patient', 'a_ordinal', 'a_minute')
+
     def __init__(self, a_type: str, staff: HealthcareProfessional,
-                 patient: Patient, a_date=None):
-        if a_type == 'consultation' or a_type == 'emergency':
-            self.a_type = a_type
-        else:
-            raise ValueError('Wrong type')
+                 patient: Patient, a_date=None, a_time=None):
+        self.a_type = a_type
         self.staff = staff
         self.patient = patient
         self.a_date = a_date
+        self.a_time = a_time
+
+    @classmethod
+    def from_ordinal(cls, a_type, staff, patient, a_ordinal, a_time=None):
+        """Creates an appointment from an ordinal day. It skips parsing a
+        date, so it is meant for loading appointments that were already
+        valid."""
+        appointment = cls.__new__(cls)
+        appointment._type = _TYPE_CODES[a_type]
+        appointment.staff = staff
+        appointment.patient = patient
+        # loaded days are shared, like the days of parsed dates are.
+        appointment.a_ordinal = _days.setdefault(a_ordinal, a_ordinal)
+        appointment.a_minute = None if a_time is None else \
+            _time_minutes(a_time)
+        return appointment
+
+    @property
+    def a_type(self):
+        return _TYPES[self._type]
+
+    @a_type.setter
+    def a_type(self, a_type):
+        code = _TYPE_CODES.get(a_type)
+        if code is None:
+            raise ValueError('Wrong type')
+        self._type = code
+
+    @property
+    def a_date(self):
+        return None if self.a_ordinal is None else \
+            _ordinal_date(self.a_ordinal)
+
+    @a_date.setter
+    def a_date(self, a_date):
+        # a_ordinal is the day as an integer (date.toordinal()). It is used
+        # for comparisons, sorting and date arithmetic, so a_date is parsed
+        # only once.
+        self.a_ordinal = None if a_date is None else _date_ordinal(a_date)
+
+    @property
+    def patient_id(self):
+        """The id of the patient in a PatientRegistry, or None."""
+        return self.patient.patient_id
+
+    @property
+    def a_time(self):
+        return None if self.a_minute is None else _minutes_time(self.a_minute)
+
+    @a_time.setter
+    def a_time(self, a_time):
+        self.a_minute = None if a_time is None else _time_minutes(a_time)
 
     def __eq__(self, other):
-        if self.a_type == other.a_type and self.staff == other.staff and \
-                self.patient == other.patient and self.a_date == other.a_date:
+        if self._type == other._type and self.staff == other.staff and \
+                self.patient == other.patient and \
+                self.a_ordinal == other.a_ordinal and \
+                self.a_minute == other.a_minute:
             return True
         else:
             return False
 
+    def __hash__(self):
+        return hash((self._type, self.staff.emp_num, self.patient,
+                     self.a_ordinal, self.a_minute))
+
+    def key(self):
+        """Returns the (a_type, staff emp_num, patient, ordinal day, minute)
+        tuple the appointment is hashed by. Appointments that are equal have
+        equal keys. The date and time of an appointment in a schedule should
+        not be changed, as the schedule's index relies on them."""
+        return self.a_type, self.staff.emp_num, self.patient, \
+            self.a_ordinal, self.a_minute
+
     def __str__(self):
+        at = '' if self.a_time is None else f" at {self.a_time}"
         if type(self.staff) is Doctor:
             return f"Appointment of {self.patient.name} to Dr " \
-                   f"{self.staff.name} on {self.a_date}"
+                   f"{self.staff.name} on {self.a_date}{at}"
         else:
             return f"Appointment of {self.patient.name} to {self.staff.name} " \
-                   f"on {self.a_date}"
+                   f"on {self.a_date}{at}"
 
     def __repr__(self):
+        if self.a_time is None:
+            return f"<Appointment({self.a_type}, {self.staff}, " \
+                   f"{self.patient}, {self.a_date})>"
         return f"<Appointment({self.a_type}, {self.staff}, {self.patient}, " \
-               f"{self.a_date})>"
+               f"{self.a_date}, {self.a_time})>"
 
 
 class AppointmentSchedule:
@@ -226,10 +597,41 @@ class AppointmentSchedule:
     It represents a schedule of appointments to a doctor. This class is
     managed by a receptionist class that initialize adding, canceling and (if
     it is necessary) find next available methods.
+    If concurrent is True, the schedule can be shared by receptionists
+    working in several threads. Every healthcare professional gets a lock
+    that the receptionist holds from checking a slot to booking it, so
+    bookings to different professionals do not wait for each other, and the
+    clinic-wide list and index are changed under a short schedule lock.
+    By default an appointment takes a healthcare professional's whole day.
+    If slot_minutes is given, the working day from day_start to day_end
+    ('%H:%M') is cut into slots of that many minutes, and appointments are
+    booked to slots (a_time) instead.
+    The results of find_next_available are remembered for the memo_size
+    most recently asked (professional, starting date and time), see
+    memo_info(); a memo_size of 0 turns this off.
     """
 
-    def __init__(self):
-        self.appointments = []
+    def __init__(self, concurrent=False, slot_minutes=None, day_start='09:00',
+                 day_end='17:00', memo_size=1024):
+        self._appointments = []
+        # staff emp_num -> _StaffCalendar with that professional's bookings.
+        self._staff = {}
+        # appointment -> the stored appointments equal to it.
+        self._index = {}
+        # staff emp_num -> appointments loaded by add_columns() that are
+        # not in the index yet (see _index_loaded).
+        self._unindexed = {}
+        # staff emp_num -> lock of the professional (concurrent mode only).
+        self._locks = {} if concurrent else None
+        self._lock = threading.RLock() if concurrent else _NO_LOCK
+        self._slots = _SlotGrid(slot_minutes, day_start, day_end)
+        # staff emp_num -> the professional, for searches across staff.
+        self._roster = {}
+        # kind of professional (class) -> _StaffPool of that kind.
+        self._pools = {}
+        # patient -> the patient's appointments sorted by date.
+        self._by_patient = {}
+        self._memo = _NextAvailableMemo(memo_size, concurrent)
 
     def __str__(self):
         return f"Schedule for the clinic"
@@ -237,148 +639,1344 @@ class AppointmentSchedule:
     def __repr__(self):
         return f"AppointmentSchedule()"
 
+    @property
+    def appointments(self):
+        """Read-only view of all appointments in the clinic, sorted by date."""
+        return AppointmentsView(self._appointments, self)
+
     def add_appointment(self, appointment):
-        """This function adds the appointment to the schedule's list."""
-        self.appointments.append(appointment)
-        self.sort()
+        """
+        This function adds the appointment to the schedule's list. The
+        appointment is inserted at its place by date (after appointments on
+        the same day), so the list never has to be sorted again.
+        """
+        self._slots.check((appointment,))
+        with self.staff_lock(appointment.staff):
+            with self._lock:
+                insort(self._appointments, appointment, key=_appointment_date)
+            self.reserve_appointment(appointment)
         return appointment
 
-    def cancel_appointment(self, appointment):
-        """This function removes an appointment form the schedule's list."""
-        canceled_appointment = None
-        for i in self.appointments:
-            if appointment == i:
-                canceled_appointment = self.appointments.pop(self.appointments.
-                                                             index(i))
-                if self.appointments != []:
+    def add_appointments(self, appointments):
+        """
+        This function adds many appointments to the schedule at once. They
+        end up in the same order as if they were added one by one with
+        add_appointment, but the schedule's list is merged only once.
+        """
+        appointments = sorted(appointments, key=_appointment_date)
+        self._slots.check(appointments)
+        by_staff = {}
+        for appointment in appointments:
+            by_staff.setdefault(appointment.staff.emp_num, []).append(
+                appointment)
+        with self.staff_locks([group[0].staff for group in by_staff.values()]):
+            for group in by_staff.values():
+                self._calendar(group[0].staff).add_sorted(group)
+            with self._lock:
+                if self._unindexed:
+                    for emp_num in by_staff:
+                        self._index_loaded(emp_num)
+                index = self._index
+                add_to_patient = self._add_to_patient
+                for appointment in appointments:
+                    index.setdefault(appointment, []).append(appointment)
+                    add_to_patient(appointment)
+            self.merge_reserved(appointments)
+        return appointments
+
+    def add_columns(self, staff, patients, types, staff_ids, patient_ids,
+                    days, minutes):
+        """
+        This function adds appointments given as columns, the way they are
+        loaded from a file: the i-th appointment has the type code types[i],
+        the professional staff[staff_ids[i]], the patient
+        patients[patient_ids[i]], the ordinal day days[i] and starts
+        minutes[i] minutes after midnight (-1 for a whole day). It returns
+        the appointments, sorted by date.
+        The schedule is built straight from the columns: the staff calendars
+        and the patients' appointments are extended with whole groups, the
+        list is merged once, and the appointments to a professional are only
+        put in the index when the index is first used for that professional.
+        Columns that come after the schedule's appointments (as a saved
+        schedule is loaded in batches) are just appended.
+        """
+        if max(types, default=0) >= len(_TYPES):
+            raise ValueError('Wrong type')
+        times = {minute: None if minute < 0 else minute
+                 for minute in set(minutes)}
+        if self._slots.slot_minutes is not None:
+            for minute in times.values():
+                if minute is not None:
+                    self._slots.slot(minute)
+        if any(map(gt, days, islice(days, 1, None))):
+            order = sorted(range(len(days)), key=days.__getitem__)
+            types, staff_ids, patient_ids, days, minutes = (
+                [column[i] for i in order]
+                for column in (types, staff_ids, patient_ids, days, minutes))
+        appointments = []
+        append = appointments.append
+        new = Appointment.__new__
+        for a_type, professional, patient, day, minute in zip(
+                types, map(staff.__getitem__, staff_ids),
+                map(patients.__getitem__, patient_ids),
+                map(_days.setdefault, days, days), map(times.get, minutes)):
+            appointment = new(Appointment)
+            appointment._type = a_type
+            appointment.staff = professional
+            appointment.patient = patient
+            appointment.a_ordinal = day
+            appointment.a_minute = minute
+            append(appointment)
+        # equal emp_nums (and patients) share a list, so a professional
+        # known under two ids still gets a single calendar.
+        by_staff = {}
+        staff_lists = [by_staff.setdefault(i.emp_num, []) for i in staff]
+        by_patient = {}
+        patient_lists = [by_patient.setdefault(i, []) for i in patients]
+        # every appointment is appended to the list of its professional and
+        # of its patient without a loop in Python.
+        for lists, ids in ((staff_lists, staff_ids),
+                           (patient_lists, patient_ids)):
+            deque(map(list.append, map(lists.__getitem__, ids),
+                      appointments), 0)
+        groups = [group for group in by_staff.values() if group]
+        with self.staff_locks([group[0].staff for group in groups]):
+            for group in groups:
+                self._calendar(group[0].staff).add_sorted(group)
+            with self._lock:
+                unindexed = self._unindexed
+                for group in groups:
+                    emp_num = group[0].staff.emp_num
+                    if emp_num in unindexed:
+                        unindexed[emp_num].extend(group)
+                    else:
+                        unindexed[emp_num] = group
+                for patient, booked in by_patient.items():
+                    if booked:
+                        stored = self._by_patient.get(patient)
+                        if stored is None:
+                            self._by_patient[patient] = booked
+                        else:
+                            in_order = stored[-1].a_ordinal <= \
+                                booked[0].a_ordinal
+                            stored.extend(booked)
+                            if not in_order:
+                                stored.sort(key=_appointment_date)
+            self.merge_reserved(appointments)
+        return appointments
+
+    def _index_loaded(self, emp_num):
+        """Puts the appointments to the professional that were loaded with
+        add_columns() in the index. Loading a schedule does not hash every
+        appointment; each professional's appointments are hashed when the
+        index is first used for them. The caller holds the schedule
+        lock."""
+        loaded = self._unindexed.pop(emp_num, None)
+        if loaded is not None:
+            index = self._index
+            for appointment in loaded:
+                index.setdefault(appointment, []).append(appointment)
+
+    def reserve_appointment(self, appointment):
+        """
+        This function books the appointment in the staff calendar and the
+        index, without putting it in the schedule's sorted list yet. It is
+        used by bulk operations, which have to call merge_reserved() with
+        the reserved appointments before the list is read again. The caller
+        holds the professional's lock.
+        """
+        self._calendar(appointment.staff).add(appointment)
+        with self._lock:
+            if self._unindexed:
+                self._index_loaded(appointment.staff.emp_num)
+            self._index.setdefault(appointment, []).append(appointment)
+            self._add_to_patient(appointment)
+
+    def _add_to_patient(self, appointment):
+        booked = self._by_patient.get(appointment.patient)
+        if booked is None:
+            self._by_patient[appointment.patient] = [appointment]
+        elif booked[-1].a_ordinal <= appointment.a_ordinal:
+            booked.append(appointment)
+        else:
+            insort(booked, appointment, key=_appointment_date)
+
+    def merge_reserved(self, appointments):
+        """Merges reserved appointments, already sorted by date, into the
+        schedule's list. Sorting the two sorted runs is a single merge, and
+        appointments that all come after the list are just appended."""
+        if appointments:
+            with self._lock:
+                in_order = not self._appointments or \
+                    self._appointments[-1].a_ordinal <= \
+                    appointments[0].a_ordinal
+                self._appointments.extend(appointments)
+                if not in_order:
                     self.sort()
+
+    def book(self, a_type, staff, patient, a_date, a_time=None):
+        """
+        This function books an appointment for a receptionist. If it is a
+        consultation and the slot is taken, next available slot is returned,
+        but it is not added to the schedule. An emergency is added on the
+        next available slot from a_date (and a_time). The check and the
+        booking are done under the professional's lock, so two receptionists
+        cannot book the same slot.
+        If staff is None, or a kind of professional such as Doctor or Nurse,
+        the appointment is made to whichever professional (of that kind) is
+        free first, see find_earliest_available().
+        """
+        if staff is None or isinstance(staff, type):
+            return self.__book_earliest(a_type, staff or HealthcareProfessional,
+                                        patient, a_date, a_time)
+        with self.staff_lock(staff):
+            if a_type == 'consultation':
+                new_appointment = Appointment(a_type, staff, patient, a_date,
+                                              a_time)
+                if check_availability(new_appointment, self) is True:
+                    if a_time is None and self._slots.slot_minutes:
+                        new_appointment = self.find_next_available(
+                            a_type, staff, patient, a_date)
+                    self.add_appointment(new_appointment)
+                    return new_appointment
+                else:
+                    next_available = self.find_next_available(
+                        a_type, staff, patient, a_date, a_time)
+                    return next_available
+            else:
+                next_available = self.find_next_available(
+                    a_type, staff, patient, a_date, a_time)
+                self.add_appointment(next_available)
+                return next_available
+
+    def book_many(self, requests, today):
+        """
+        This function books appointments for many requests (Appointment
+        objects) as book() would book them one by one, and returns the
+        results in the same order. Requests without a date are made from
+        today.
+        Requests are grouped by healthcare professional, every booking only
+        updates that professional's calendar and the schedule's sorted list
+        is merged once at the end. If a request has a time that is not the
+        start of a slot, ValueError is raised before anything is booked.
+        """
+        requests = list(requests)
+        self._slots.check(requests)
+        groups = {}
+        for position, request in enumerate(requests):
+            groups.setdefault(request.staff.emp_num, []).append(
+                (position, request))
+        output = [None] * sum(len(group) for group in groups.values())
+        booked = []
+        with self.staff_locks([group[0][1].staff
+                               for group in groups.values()]):
+            for group in groups.values():
+                self._book_group(group, today, output, booked)
+            booked.sort(key=lambda pair: (pair[1].a_ordinal, pair[0]))
+            self.merge_reserved([appointment for _, appointment in booked])
+        return output
+
+    def _book_group(self, group, today, output, booked):
+        for position, request in group:
+            if request.a_date is None:
+                alternative_date = today
+            else:
+                alternative_date = request.a_date
+            if request.a_type == 'consultation' and \
+                    self.is_available(request.staff, alternative_date,
+                                      request.a_time):
+                if request.a_time is None and self._slots.slot_minutes:
+                    new_appointment = self.find_next_available(
+                        request.a_type, request.staff, request.patient,
+                        alternative_date)
+                else:
+                    new_appointment = Appointment(
+                        request.a_type, request.staff, request.patient,
+                        alternative_date, request.a_time)
+            else:
+                new_appointment = self.find_next_available(
+                    request.a_type, request.staff, request.patient,
+                    alternative_date, request.a_time)
+                if request.a_type == 'consultation':
+                    output[position] = new_appointment
+                    continue
+            self.reserve_appointment(new_appointment)
+            booked.append((position, new_appointment))
+            output[position] = new_appointment
+
+    def cancel_appointment(self, appointment):
+        """
+        This function removes an appointment form the schedule's list. The
+        stored appointment is found through the schedule's index, and only
+        the appointments on the same day are looked at to remove it from the
+        sorted list.
+        """
+        with self.staff_lock(appointment.staff):
+            with self._lock:
+                if self._unindexed:
+                    self._index_loaded(appointment.staff.emp_num)
+                stored = self._index.get(appointment)
+                if stored is None:
+                    return None
+                canceled_appointment = stored.pop(0)
+                if not stored:
+                    del self._index[appointment]
+                _remove_stored(self._appointments, canceled_appointment)
+                booked = self._by_patient[canceled_appointment.patient]
+                _remove_stored(booked, canceled_appointment)
+                if not booked:
+                    del self._by_patient[canceled_appointment.patient]
+            calendar = self._staff[appointment.staff.emp_num]
+            calendar.remove(canceled_appointment)
+            with self._lock:
+                for pool in self._pools.values():
+                    pool.refresh(appointment.staff.emp_num, calendar,
+                                 self._next_free_position)
         return canceled_appointment
 
-    def find_next_available(self, a_type, staff, patient, starting_date):
+    def __contains__(self, appointment):
+        if self._unindexed:
+            with self._lock:
+                self._index_loaded(appointment.staff.emp_num)
+        return appointment in self._index
+
+    def is_available(self, staff, a_date, a_time=None):
+        """Returns True if the healthcare professional has no appointment on
+        a_date. With time slots, it returns True if the slot at a_time is
+        free, or if any slot of the day is free when a_time is None."""
+        with self.staff_lock(staff):
+            calendar = self._staff.get(staff.emp_num)
+            if a_date is None:
+                return True
+            day = _date_ordinal(a_date)
+            if a_time is None or not self._slots.slot_minutes:
+                return calendar is None or not calendar.is_booked(day)
+            slot = self._slots.slot(_time_minutes(a_time))
+            return calendar is None or not calendar.bitmap(day) >> slot & 1
+
+    def staff_appointments(self, staff):
+        """Returns the appointments to a healthcare professional sorted by
+        date."""
+        with self.staff_lock(staff):
+            calendar = self._staff.get(staff.emp_num)
+            if calendar is None:
+                return []
+            return calendar.appointments()
+
+    def appointments_between(self, staff, start_date, end_date):
+        """
+        Returns an iterator over the appointments to a healthcare
+        professional from start_date to end_date (both included), sorted by
+        date. The professional's booked days are kept sorted, so the first
+        day is found with a binary search and only the appointments in the
+        range are looked at: O(log n + k). Like the other iterators below,
+        it reads the schedule as it goes, so the schedule should not be
+        changed until it is used up.
+        """
+        calendar = self._staff.get(staff.emp_num)
+        if calendar is None:
+            return iter(())
+        return calendar.between(_date_ordinal(start_date),
+                                _date_ordinal(end_date))
+
+    def appointments_on(self, a_date):
+        """Returns an iterator over all appointments in the clinic on a_date
+        (the day sheet), in the order of the schedule's list."""
+        day = _date_ordinal(a_date)
+        return _islice(self._appointments,
+                       bisect_left(self._appointments, day,
+                                   key=_appointment_date),
+                       bisect_right(self._appointments, day,
+                                    key=_appointment_date))
+
+    def upcoming_appointments(self, patient, from_date=None):
+        """Returns an iterator over the patient's appointments from
+        from_date (today by default) on, sorted by date."""
+        if from_date is None:
+            from_date = str(datetime.date.today())
+        booked = self._by_patient.get(patient)
+        if booked is None:
+            return iter(())
+        return _islice(booked, bisect_left(booked, _date_ordinal(from_date),
+                                           key=_appointment_date),
+                       len(booked))
+
+    def staff_lock(self, staff):
+        """Returns the lock of the healthcare professional. It is a re-entrant
+        lock in concurrent mode and a context manager doing nothing
+        otherwise."""
+        if self._locks is None:
+            return _NO_LOCK
+        return self._emp_num_lock(staff.emp_num)
+
+    def staff_locks(self, staff):
+        """Returns a context manager holding the locks of all the given
+        healthcare professionals. They are taken in emp_num order, so two
+        callers cannot deadlock."""
+        stack = ExitStack()
+        if self._locks is not None:
+            for emp_num in sorted({i.emp_num for i in staff}):
+                stack.enter_context(self._emp_num_lock(emp_num))
+        return stack
+
+    def _emp_num_lock(self, emp_num):
+        lock = self._locks.get(emp_num)
+        if lock is None:
+            with self._lock:
+                lock = self._locks.setdefault(emp_num, threading.RLock())
+        return lock
+
+    def add_staff(self, staff):
+        """Adds healthcare professionals who may have no appointments yet, so
+        that find_earliest_available can choose them. Professionals are
+        added automatically with their first appointment."""
+        for i in staff:
+            self._calendar(i)
+
+    def _calendar(self, staff):
+        calendar = self._staff.get(staff.emp_num)
+        if calendar is None:
+            with self._lock:
+                calendar = self._staff.get(staff.emp_num)
+                if calendar is None:
+                    calendar = self._staff[staff.emp_num] = \
+                        _StaffCalendar(self._slots)
+                    self._roster[staff.emp_num] = staff
+                    for kind, pool in self._pools.items():
+                        if isinstance(staff, kind):
+                            pool.add(staff.emp_num)
+        return calendar
+
+    def find_next_available(self, a_type, staff, patient, starting_date,
+                            starting_time=None):
         """
         This function finds next available slot in appointments list
         to make an appointment to a particular healthcare specialist and
         returns it. It does not add it to appointments list!
+        With time slots, the search starts from the first slot beginning at
+        or after starting_time, and the returned appointment has its a_time.
         """
-        form = '%Y-%m-%d'
-        # selecting appointments based on a particular healthcare specialist.
-        sublist = []
-        for i in self.appointments:
-            if staff.emp_num == i.staff.emp_num:
-                sublist.append(i)
-        # if the sublist is empty, new appointment is made with
-        # starting_date as an a_date
-        if not sublist:
-            new_appointment = Appointment(a_type, staff, patient, starting_date)
-            return new_appointment
-        # if the sublist contains only one appointment and its date is the same
-        # as starting_date, new appointment is made with starting_date + 1 day.
-        elif len(sublist) == 1:
-            if sublist[0].a_date == starting_date:
-                new_date = datetime.datetime.strptime(starting_date,
-                                                      form).date() \
-                           + timedelta(days=1)
-                new_appointment = Appointment(a_type, staff, patient,
-                                              str(new_date))
-                return new_appointment
-            # otherwise, new appointment is made with starting_date as an a_dat.
+        starting_day = _date_ordinal(starting_date)
+        with self.staff_lock(staff):
+            calendar = self._staff.get(staff.emp_num)
+            # the same search is often repeated while talking to a patient,
+            # so a remembered result is used if the calendar has not changed.
+            key = (staff.emp_num, starting_day, starting_time)
+            position = self._memo.get(key, calendar)
+            if position is not None:
+                return self._appointment_at(a_type, staff, patient, position)
+            if self._slots.slot_minutes:
+                output = self.__next_available_slot(a_type, staff, patient,
+                                                     calendar, starting_day,
+                                                     starting_time)
+            # if the healthcare specialist is free on starting_date, new
+            # appointment is made with starting_date as an a_date.
+            elif calendar is None or not calendar.is_booked(starting_day):
+                output = Appointment(a_type, staff, patient, starting_date)
+            # otherwise the helper function __next_available_busy_schedule()
+            # looks for the first gap after starting_date.
             else:
-                new_appointment = Appointment(a_type, staff, patient,
-                                              starting_date)
-                return new_appointment
-        # if the sublist has more than 1 element
-        else:
-            # if there is no appointment where a_date = starting_date
-            is_starting_date_in_sublist = False
-            for i in sublist:
-                if i.a_date == starting_date:
-                    is_starting_date_in_sublist = True
-            if is_starting_date_in_sublist is False:
-                new_appointment = Appointment(a_type, staff, patient,
-                                              starting_date)
-                return new_appointment
-            else:
-                # otherwise the helper function __next_available_busy_schedule()
-                # is going check if there is any gap between appointments in the
-                # sublist. If not, new appointment is added a day after the last
-                # appointment in the sublist.
                 output = self.__next_available_busy_schedule(
-                    a_type, staff, patient, sublist, starting_date)
-                return output
+                    a_type, staff, patient, calendar, starting_day)
+            self._memo.put(key, calendar,
+                           self._position(output.a_ordinal, output.a_time))
+            return output
 
-    def sort(self):
-        """This function sorts appointments in the schedule's list by date."""
-        self.appointments.sort(key=lambda appointment: appointment.a_date)
-
-    def __next_available_busy_schedule(self, a_type, staff, patient, sublist,
-                                       starting_date):
-        """
-        It is a helper function that searches any gap between appointments in
-        the busy schedule (that contains more than one appointment to the
-        healthcare specialist).
-        """
-        form = '%Y-%m-%d'
-        index0 = 0
-        index1 = 1
-        # the search for next available will be form starting_date.
-        # No slots will be found before that.
-        for i in sublist:
-            if datetime.datetime.strptime(i.a_date, form).date() < \
-                    datetime.datetime.strptime(starting_date, form).date():
-                sublist.pop(sublist.index(i))
-
-        while index1 < len(sublist) - 1:
-            date_0 = datetime.datetime.strptime(sublist[index0].a_date,
-                                                form).date()
-            date_1 = datetime.datetime.strptime(sublist[index1].a_date,
-                                                form).date()
-            if int((date_1 - date_0).days) == 1:
-                index0 += 1
-                index1 += 1
-                # no gap is found, so next pair of appointments are
-                # going to be compared.
+    def preempt(self, staff, patient, a_date, a_time=None):
+        """
+        This function books an emergency to the healthcare professional on
+        a_date even if the day is taken. A free slot from a_time (or from
+        the start of the day) is taken first. Otherwise the first slot held
+        only by consultations is taken from them, and each of those patients
+        is moved to the professional's next free slot after it, found with
+        the gap index, so the move takes no search over the schedule. If
+        every slot left that day is held by emergencies, the emergency is
+        booked on the next available slot as book() would.
+        It returns the emergency and a list with a Preemption for every
+        patient moved.
+        """
+        day = _date_ordinal(a_date)
+        slots = self._slots
+        with self.staff_lock(staff):
+            calendar = self._calendar(staff)
+            first = self._position(day, a_time) - day * slots.count
+            free = slots.first_free(calendar.bitmap(day), first) \
+                if first < slots.count else None
+            if free is not None:
+                return self.add_appointment(self._appointment_at(
+                    'emergency', staff, patient,
+                    day * slots.count + free)), []
+            booked = calendar.days.get(day, ())
+            for slot in range(first, slots.count):
+                holders = [i for i in booked if slots.bits(i) >> slot & 1]
+                if all(i.a_type == 'consultation' for i in holders):
+                    break
             else:
-                # a gap between two appointments was found. The new appointment
-                # is going to be added after the appointment with
-                # a_date = date_0.
-                new_date = date_0 + timedelta(days=1)
-                new_appointment = Appointment(a_type, staff, patient,
-                                              str(new_date))
-                return new_appointment
-        date_0 = datetime.datetime.strptime(sublist[index0].a_date,
-                                            form).date()
-        date_1 = datetime.datetime.strptime(sublist[index1].a_date,
-                                            form).date()
-        # Here if the last pair of appointments does not have a gap
-        # between, new appointment is added at the end.
-        if int((date_1 - date_0).days) == 1:
-            new_date = date_1 + timedelta(days=1)
-            new_appointment = Appointment(a_type, staff, patient,
-                                          str(new_date))
-            return new_appointment
-        # otherwise new appointment is added after the penultimate one.
-        else:
-            new_date = date_0 + timedelta(days=1)
-            new_appointment = Appointment(a_type, staff, patient,
-                                          str(new_date))
-            return new_appointment
+                return self.add_appointment(self.find_next_available(
+                    'emergency', staff, patient, a_date, a_time)), []
+            position = day * slots.count + slot
+            emergency = self.add_appointment(self._appointment_at(
+                'emergency', staff, patient, position))
+            preemptions = []
+            for bumped in holders:
+                self.cancel_appointment(bumped)
+            for bumped in holders:
+                moved = self.add_appointment(self._appointment_at(
+                    bumped.a_type, staff, bumped.patient,
+                    self._next_free_position(calendar, position)))
+                preemptions.append(Preemption(emergency, bumped, moved))
+            return emergency, preemptions
+
+    def memo_info(self):
+        """Returns the hits, misses, size and maxsize of the memo of
+        find_next_available results as a dict."""
+        return self._memo.info()
+
+    def sort(self):
+        """This function sorts appointments in the schedule's list by date.
+        The list is kept in order on every change, so it is only needed by
+        callers that want to be sure of it."""
+        self._appointments.sort(key=_appointment_date)
+
+    def __next_available_busy_schedule(self, a_type, staff, patient, calendar,
+                                       starting_day):
+        """
+        It is a helper function that finds the first free day in the busy
+        schedule of the healthcare specialist. The calendar keeps booked days
+        as runs of consecutive days, so the gap after starting_date is the day
+        after the run that contains it.
+        """
+        new_date = _ordinal_date(calendar.next_free_day(starting_day))
+        new_appointment = Appointment(a_type, staff, patient, new_date)
+        return new_appointment
+
+    def __next_available_slot(self, a_type, staff, patient, calendar,
+                              starting_day, starting_time):
+        """
+        It is a helper function that finds the first free slot from
+        starting_time on starting_day. The free slots of a day are found
+        with a bit scan of its bitmap. If the rest of the day is taken, the
+        first day that is not fully booked is found with the gap index, and
+        its first free slot is taken.
+        """
+        position = self._next_free_position(
+            calendar, self._position(starting_day, starting_time))
+        return self._appointment_at(a_type, staff, patient, position)
+
+    def find_earliest_available(self, a_type, kind, patient, starting_date,
+                                starting_time=None):
+        """
+        This function finds the earliest free slot from starting_date (and
+        starting_time) with any healthcare professional of the given kind
+        (HealthcareProfessional, Doctor or Nurse) and returns it as an
+        appointment to that professional, or None if the schedule knows no
+        such professional. It does not add it to appointments list!
+        Professionals are kept in a heap ordered by their next free slot, so
+        the search takes O(log S) for S professionals rather than a search
+        per professional.
+        """
+        position = self._position(_date_ordinal(starting_date), starting_time)
+        with self._lock:
+            pool = self._pools.get(kind)
+            if pool is None:
+                pool = self._pools[kind] = _StaffPool(
+                    [emp_num for emp_num, staff in self._roster.items()
+                     if isinstance(staff, kind)], position)
+            found = pool.earliest(position, self._staff,
+                                  self._next_free_position)
+            if found is None:
+                return None
+            position, emp_num = found
+            return self._appointment_at(a_type, self._roster[emp_num],
+                                        patient, position)
+
+    def __book_earliest(self, a_type, kind, patient, a_date, a_time):
+        """
+        It is a helper function of book() for an appointment to any
+        professional of the kind. A consultation is booked only if somebody
+        is free at the requested time (or on the requested day, if a_time is
+        None). If another receptionist takes the slot between the search
+        and the booking, the search is repeated.
+        """
+        requested = self._position(_date_ordinal(a_date), a_time)
+        while True:
+            found = self.find_earliest_available(a_type, kind, patient, a_date,
+                                                 a_time)
+            if found is None:
+                return None
+            if a_type == 'consultation':
+                if a_time is None or not self._slots.slot_minutes:
+                    taken = found.a_ordinal != requested // self._slots.count
+                else:
+                    taken = self._position(found.a_ordinal,
+                                           found.a_time) != requested
+                if taken:
+                    return found
+            with self.staff_lock(found.staff):
+                if self.is_available(found.staff, found.a_date, found.a_time):
+                    self.add_appointment(found)
+                    return found
+
+    def _position(self, day, a_time):
+        """Returns the slot at or after a_time on the ordinal day as a single
+        integer, counting slots from the first day."""
+        slots = self._slots
+        if a_time is None or not slots.slot_minutes:
+            return day * slots.count
+        return day * slots.count + slots.first_slot(_time_minutes(a_time))
+
+    def _next_free_position(self, calendar, position):
+        """Returns the first position (see _position) from position onwards
+        that is free in the calendar."""
+        if calendar is None:
+            return position
+        slots = self._slots
+        day, slot = divmod(position, slots.count)
+        slot = slots.first_free(calendar.bitmap(day), slot)
+        if slot is None:
+            day = calendar.next_free_day(day + 1)
+            slot = slots.first_free(calendar.bitmap(day))
+        return day * slots.count + slot
+
+    def _appointment_at(self, a_type, staff, patient, position):
+        slots = self._slots
+        day, slot = divmod(position, slots.count)
+        a_time = slots.time(slot) if slots.slot_minutes else None
+        return Appointment(a_type, staff, patient, _ordinal_date(day), a_time)
+
+
+# appointment types, stored in an appointment as their position here.
+_TYPES = ('consultation', 'emergency')
+_TYPE_CODES = {a_type: code for code, a_type in enumerate(_TYPES)}
+
+# kinds of healthcare professional, stored in the journal, the shards'
+# messages and the SQLite database as their position here.
+_STAFF_KINDS = (HealthcareProfessional, Doctor, Nurse)
+_STAFF_CODES = {kind: code for code, kind in enumerate(_STAFF_KINDS)}
+
+# ordinal day -> the int object used for it by loaded appointments.
+_days = {}
+
+# sort key of appointments in the schedule.
+_appointment_date = attrgetter('a_ordinal')
+
+# the lock of a schedule that is not concurrent.
+_NO_LOCK = nullcontext()
+
+
+@lru_cache(maxsize=4096)
+def _date_ordinal(a_date):
+    """Converts a '%Y-%m-%d' string to an ordinal day. Results are cached, as
+    the same few hundred dates are parsed over and over."""
+    return datetime.datetime.strptime(a_date, '%Y-%m-%d').date().toordinal()
+
+
+@lru_cache(maxsize=4096)
+def _ordinal_date(day):
+    """Converts an ordinal day back to a '%Y-%m-%d' string."""
+    return str(datetime.date.fromordinal(day))
+
+
+@lru_cache(maxsize=4096)
+def _time_minutes(a_time):
+    """Converts a '%H:%M' string to minutes after midnight."""
+    time = datetime.datetime.strptime(a_time, '%H:%M')
+    return time.hour * 60 + time.minute
+
+
+@lru_cache(maxsize=2048)
+def _minutes_time(minute):
+    """Converts minutes after midnight back to a '%H:%M' string."""
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def _islice(appointments, start, end):
+    """Yields appointments[start:end] without copying the list or walking
+    its first start items."""
+    for index in range(start, end):
+        yield appointments[index]
+
+
+def _remove_stored(appointments, appointment):
+    """Removes the stored appointment (the very object) from a list sorted
+    by date. Only the appointments on the same day are looked at."""
+    day = appointment.a_ordinal
+    index = bisect_left(appointments, day, key=_appointment_date)
+    end = bisect_right(appointments, day, key=_appointment_date)
+    while index < end:
+        if appointments[index] is appointment:
+            del appointments[index]
+            break
+        index += 1
 
 
 def check_availability(appointment, schedule):
     """
     This function checks if an appointment to a specific healthcare
     professional, can be made and added to schedule by a receptionist for the
-    given date. It returns 'True' or 'False'.
+    given date (and time). It returns 'True' or 'False'.
     """
-    sublist = []
-    # appointments are selected based on a healthcare professional.
-    for i in schedule.appointments:
-        if appointment.staff.emp_num == i.staff.emp_num:
-            sublist.append(i)
-    # finds if there is any free slot for the given date to the particular
-    # professional.
-    output = True
-    for i in sublist:
-        if appointment.a_date == i.a_date:
-            output = False
-    return output
+    return schedule.is_available(appointment.staff, appointment.a_date,
+                                 appointment.a_time)
+
+
+class Waitlist:
+    """
+    Patients waiting for an earlier appointment to a healthcare
+    professional. Every professional has a queue of requested appointments
+    (as made by Patient.request_appointment) ordered by urgency (higher
+    first) and then by the time of the request. The queue is kept as a heap
+    per requested day, so a freed day only looks at the first request of
+    each day up to it, never at the requests for later days.
+    A queue holds at most capacity requests. Requests older than max_age
+    seconds (by clock) are stale: they are dropped when they are met, or
+    all at once when a queue is full. When a full queue has no stale
+    request, a new request takes the place of the last one if it comes
+    first, and is refused otherwise. notify, if given, is called with
+    every appointment booked from the waitlist.
+    """
+
+    def __init__(self, capacity=1000, max_age=7 * 24 * 3600, notify=None,
+                 clock=time.monotonic):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.notify = notify
+        self._clock = clock
+        # emp_num -> _WaitQueue of [-urgency, requested at, sequence,
+        # request] entries.
+        self._queues = {}
+        # (emp_num, patient) -> the entry of the patient's request.
+        self._entries = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"Waitlist of {len(self)} requests"
+
+    def __repr__(self):
+        return f"Waitlist({self.capacity}, {self.max_age})"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, request, urgency=0):
+        """
+        Puts the requested appointment on the waitlist of its professional
+        and returns True, or returns False if the patient is waiting for
+        that professional already or the queue is full.
+        """
+        key = (request.staff.emp_num, request.patient)
+        with self._lock:
+            if key in self._entries:
+                return False
+            now = self._clock()
+            self._sequence += 1
+            entry = [-urgency, now, self._sequence, request]
+            queue = self._queues.get(key[0])
+            if queue is None:
+                queue = self._queues[key[0]] = _WaitQueue()
+            if len(queue) >= self.capacity:
+                for stale in queue.expire(now - self.max_age):
+                    self._forget(stale)
+            if len(queue) >= self.capacity:
+                last = queue.last_entry()
+                if entry > last:
+                    return False
+                queue.remove(last)
+                self._forget(last)
+            queue.push(entry)
+            self._entries[key] = entry
+            return True
+
+    def waiting(self, staff):
+        """Returns the requests waiting for the healthcare professional, in
+        the order they would be booked."""
+        with self._lock:
+            queue = self._queues.get(staff.emp_num)
+            if queue is None:
+                return []
+            return [entry[3] for entry in sorted(queue.entries())]
+
+    def fill(self, schedule, freed):
+        """
+        Books the first patient waiting for the professional of the freed
+        appointment into its day (and time), and returns the new
+        appointment, or None if nobody waiting can take it. Only requests
+        for that day or an earlier one can take it; others stay on the
+        waitlist, and so does the patient if the slot has been taken again
+        in the meantime.
+        """
+        staff = freed.staff
+        with self._lock:
+            queue = self._queues.get(staff.emp_num)
+            if not queue:
+                return None
+            found = queue.pop_first(freed.a_ordinal,
+                                    self._clock() - self.max_age,
+                                    self._forget)
+            if found is None:
+                return None
+            self._forget(found)
+        request = found[3]
+        appointment = Appointment(request.a_type, staff, request.patient,
+                                  freed.a_date, freed.a_time)
+        with schedule.staff_lock(staff):
+            if not schedule.is_available(staff, freed.a_date, freed.a_time):
+                with self._lock:
+                    key = (staff.emp_num, request.patient)
+                    if key not in self._entries:
+                        queue.push(found)
+                        self._entries[key] = found
+                return None
+            schedule.add_appointment(appointment)
+        if self.notify is not None:
+            self.notify(appointment)
+        return appointment
+
+    def _forget(self, entry):
+        request = entry[3]
+        del self._entries[request.staff.emp_num, request.patient]
+
+
+class _WaitQueue:
+    """
+    Waitlist entries of one professional, in a heap per requested day. days
+    holds the requested days that have a heap, sorted, so the heaps of the
+    days up to a freed day are found with a binary search. Two more heaps
+    hold the same entries by priority, last first (last), and by the time
+    they were made (by_time), so evicting the last entry and expiring stale
+    ones take O(log n) each.
+    Removed entries are only taken out of members (by sequence number) and
+    are skipped when they reach the top of a heap. The heaps are rebuilt
+    from the live entries once they hold twice as many entries as that.
+    """
+
+    def __init__(self):
+        self.days = []
+        self.heaps = {}
+        self.last = []
+        self.by_time = []
+        self.members = set()
+        # entries in the day heaps, removed ones included.
+        self.stored = 0
+
+    def __len__(self):
+        return len(self.members)
+
+    def entries(self):
+        """Returns an iterator over all entries, in no particular order."""
+        members = self.members
+        return (entry for heap in self.heaps.values() for entry in heap
+                if entry[2] in members)
+
+    def push(self, entry):
+        day = entry[3].a_ordinal
+        heap = self.heaps.get(day)
+        if heap is None:
+            heap = self.heaps[day] = []
+            insort(self.days, day)
+        heappush(heap, entry)
+        self.stored += 1
+        # entry is [-urgency, requested at, sequence, request], and the
+        # sequence numbers are unique, so the requests are never compared.
+        heappush(self.last, (-entry[0], -entry[1], -entry[2], entry))
+        heappush(self.by_time, (entry[1], entry[2], entry))
+        self.members.add(entry[2])
+        self._compact()
+
+    def pop_first(self, last_day, oldest, forget):
+        """
+        Removes and returns the first entry requested for last_day or an
+        earlier day, or returns None if there is none. Stale entries (made
+        before oldest) met at the top of a heap are dropped and passed to
+        forget.
+        """
+        members = self.members
+        best = None
+        for day in self.days[:bisect_right(self.days, last_day)]:
+            heap = self.heaps[day]
+            while heap and (heap[0][2] not in members or
+                            heap[0][1] < oldest):
+                entry = heappop(heap)
+                self.stored -= 1
+                if entry[2] in members:
+                    members.discard(entry[2])
+                    forget(entry)
+            if not heap:
+                self._drop(day)
+            elif best is None or heap[0] < best[0]:
+                best = heap
+        if best is None:
+            return None
+        entry = heappop(best)
+        self.stored -= 1
+        members.discard(entry[2])
+        if not best:
+            self._drop(entry[3].a_ordinal)
+        self._compact()
+        return entry
+
+    def last_entry(self):
+        """Returns the entry that would be booked last, or None."""
+        last = self.last
+        while last and last[0][3][2] not in self.members:
+            heappop(last)
+        return last[0][3] if last else None
+
+    def remove(self, entry):
+        self.members.discard(entry[2])
+        self._compact()
+
+    def expire(self, oldest):
+        """Removes and returns the entries made before oldest."""
+        stale = []
+        by_time = self.by_time
+        members = self.members
+        while by_time and (by_time[0][1] not in members or
+                           by_time[0][0] < oldest):
+            entry = heappop(by_time)[2]
+            if entry[2] in members:
+                members.discard(entry[2])
+                stale.append(entry)
+        self._compact()
+        return stale
+
+    def _compact(self):
+        limit = 2 * len(self.members) + 16
+        if max(self.stored, len(self.last), len(self.by_time)) <= limit:
+            return
+        live = list(self.entries())
+        self.days = []
+        self.heaps = {}
+        for entry in live:
+            self.heaps.setdefault(entry[3].a_ordinal, []).append(entry)
+        for heap in self.heaps.values():
+            heapify(heap)
+        self.days = sorted(self.heaps)
+        self.stored = len(live)
+        self.last = [(-entry[0], -entry[1], -entry[2], entry)
+                     for entry in live]
+        heapify(self.last)
+        self.by_time = [(entry[1], entry[2], entry) for entry in live]
+        heapify(self.by_time)
+
+    def _drop(self, day):
+        del self.heaps[day]
+        del self.days[bisect_left(self.days, day)]
+
+
+class Preemption:
+    """
+    Record of a consultation moved to make room for an emergency: the
+    emergency, the bumped appointment, the appointment it was moved to and
+    when it happened, for auditing.
+    """
+
+    __slots__ = ('emergency', 'bumped', 'moved', 'at')
+
+    def __init__(self, emergency, bumped, moved):
+        self.emergency = emergency
+        self.bumped = bumped
+        self.moved = moved
+        self.at = datetime.datetime.now()
+
+    def __str__(self):
+        return (f"{self.bumped.patient} moved from {self.bumped.a_date} to "
+                f"{self.moved.a_date} for an emergency of "
+                f"{self.emergency.patient}")
+
+    def __repr__(self):
+        return f"Preemption({self.emergency}, {self.bumped}, {self.moved})"
+
+
+class AppointmentsView(Sequence):
+    """A read-only view of appointments stored in AppointmentSchedule. It
+    behaves like the list the schedule used to expose, but it cannot be
+    modified by callers, so the schedule's indexes stay consistent."""
+
+    def __init__(self, appointments, schedule):
+        self._appointments = appointments
+        self._schedule = schedule
+
+    def __getitem__(self, index):
+        return self._appointments[index]
+
+    def __contains__(self, appointment):
+        return appointment in self._schedule
+
+    def __len__(self):
+        return len(self._appointments)
+
+    def __iter__(self):
+        return iter(self._appointments)
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence):
+            return list(self._appointments) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"AppointmentsView({self._appointments})"
+
+
+class _NextAvailableMemo:
+    """
+    Least recently used results of find_next_available: (emp_num, starting
+    day, starting time) -> next free position (see
+    AppointmentSchedule._position). Every result is stored with the version
+    of the professional's calendar it was found in, so a booking or a
+    cancellation makes stale only the results of that professional, and a
+    stale result is dropped when it is next asked for.
+    """
+
+    def __init__(self, maxsize, concurrent=False):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock() if concurrent else _NO_LOCK
+
+    def get(self, key, calendar):
+        """Returns the position remembered for key, or None."""
+        version = calendar.version if calendar is not None else -1
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                if result[0] == version:
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    return result[1]
+                del self._results[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, calendar, position):
+        if not self.maxsize:
+            return
+        version = calendar.version if calendar is not None else -1
+        with self._lock:
+            self._results[key] = (version, position)
+            self._results.move_to_end(key)
+            if len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._results), 'maxsize': self.maxsize}
+
+
+class _StaffPool:
+    """
+    Healthcare professionals of one kind in a heap ordered by their next
+    free slot, as positions (see AppointmentSchedule._position). An entry
+    [next free position, floor, emp_num, version] says that every slot from
+    floor up to the next free position is taken, as of the given version of
+    the professional's calendar.
+    Bookings only make an entry stale, and a stale entry is recomputed when
+    it reaches the top of the heap. A cancellation can free an earlier slot,
+    so it recomputes the entry straight away (the old one is left in the
+    heap and skipped). Every entry is then at most the professional's real
+    next free slot, so the first valid entry at the top is the earliest.
+    Old entries rarely reach the top, so the heap is rebuilt from the live
+    entries once it holds twice as many entries as professionals.
+    A search costs O(log S) for S professionals only while the starting
+    positions do not go back: a search from before the floor of the pool
+    resets all S entries.
+    """
+
+    def __init__(self, emp_nums, floor):
+        self.floor = floor
+        self.live = {}
+        self.heap = []
+        for emp_num in emp_nums:
+            self.add(emp_num)
+
+    def add(self, emp_num):
+        entry = [self.floor, self.floor, emp_num, -1]
+        self.live[emp_num] = entry
+        heappush(self.heap, entry)
+
+    def refresh(self, emp_num, calendar, search):
+        """Recomputes the entry of a professional whose calendar has had a
+        slot freed."""
+        entry = self.live.get(emp_num)
+        if entry is not None:
+            floor = entry[1]
+            entry = [search(calendar, floor), floor, emp_num, calendar.version]
+            self.live[emp_num] = entry
+            if len(self.heap) >= 2 * len(self.live):
+                self.heap = list(self.live.values())
+                heapify(self.heap)
+            else:
+                heappush(self.heap, entry)
+
+    def earliest(self, position, calendars, search):
+        """Returns (position, emp_num) of the earliest free slot from
+        position on, or None if the pool is empty."""
+        if position < self.floor:
+            self.heap = [[position, position, emp_num, -1]
+                         for emp_num in self.live]
+            heapify(self.heap)
+            self.live = {entry[2]: entry for entry in self.heap}
+        self.floor = position
+        heap = self.heap
+        live = self.live
+        while heap:
+            entry = heap[0]
+            key, floor, emp_num, version = entry
+            calendar = calendars[emp_num]
+            if live[emp_num] is not entry:
+                heappop(heap)
+            elif version == calendar.version and key >= position:
+                return key, emp_num
+            else:
+                entry = [search(calendar, position), position, emp_num,
+                         calendar.version]
+                live[emp_num] = entry
+                heapreplace(heap, entry)
+        return None
+
+
+class _SlotGrid:
+    """
+    Slots of a working day. Without slot_minutes the whole day is a single
+    slot. Otherwise the day from day_start to day_end is cut into slots of
+    slot_minutes, and the booked slots of a staff-day are kept as the bits
+    of an integer (bit i is set when slot i is taken), so the first free
+    slot is found with a bit scan.
+    """
+
+    def __init__(self, slot_minutes=None, day_start='09:00', day_end='17:00'):
+        self.slot_minutes = slot_minutes
+        if slot_minutes is None:
+            self.start = 0
+            self.count = 1
+        else:
+            if slot_minutes <= 0:
+                raise ValueError('Wrong slot length')
+            self.start = _time_minutes(day_start)
+            self.count = (_time_minutes(day_end) - self.start) // slot_minutes
+            if self.count <= 0:
+                raise ValueError('Wrong working hours')
+        self.full = (1 << self.count) - 1
+
+    def bits(self, appointment):
+        """Returns the bitmap of the slots the appointment takes. An
+        appointment without a time takes the whole day."""
+        if appointment.a_minute is None or self.slot_minutes is None:
+            return self.full
+        return 1 << self.slot(appointment.a_minute)
+
+    def slot(self, minute):
+        """Returns the slot starting at minute (after midnight)."""
+        slot, rest = divmod(minute - self.start, self.slot_minutes)
+        if rest or not 0 <= slot < self.count:
+            raise ValueError('Wrong time')
+        return slot
+
+    def check(self, appointments):
+        """Raises ValueError if any of the appointments has a time that is
+        not the start of a slot."""
+        if self.slot_minutes is not None:
+            for appointment in appointments:
+                if appointment.a_minute is not None:
+                    self.slot(appointment.a_minute)
+
+    def first_slot(self, minute):
+        """Returns the first slot starting at or after minute, or count if
+        there is none left that day."""
+        offset = minute - self.start
+        if offset <= 0:
+            return 0
+        return min(-(-offset // self.slot_minutes), self.count)
+
+    def first_free(self, bitmap, first_slot=0):
+        """Returns the first slot from first_slot on that is free in bitmap,
+        or None if they are all taken."""
+        free = ~(bitmap | ((1 << first_slot) - 1)) & self.full
+        if not free:
+            return None
+        # free & -free keeps only the lowest set bit.
+        return (free & -free).bit_length() - 1
+
+    def time(self, slot):
+        """Returns the start of the slot as a '%H:%M' string."""
+        return _minutes_time(self.start + slot * self.slot_minutes)
+
+
+class _StaffCalendar:
+    """
+    Appointments to one healthcare professional indexed by date. days maps
+    an ordinal day to the appointments booked on that day and dates keeps the
+    booked days in sorted order, so a check for a single professional does not
+    have to look at the rest of the clinic. bitmaps maps a day to the bitmap
+    of its taken slots (see _SlotGrid).
+    Fully booked days are also kept as runs of consecutive days
+    (run_starts[i] to run_ends[i]), which is the gap index used to find the
+    next day with a free slot with a binary search.
+    version is increased on every change.
+    """
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.version = 0
+        self.days = {}
+        self.dates = []
+        self.bitmaps = {}
+        self.run_starts = []
+        self.run_ends = []
+
+    def add(self, appointment):
+        self.version += 1
+        day = appointment.a_ordinal
+        bits = self.slots.bits(appointment)
+        full = self.slots.full
+        booked = self.days.get(day)
+        if booked is None:
+            self.days[day] = [appointment]
+            insort(self.dates, day)
+            bitmap = 0
+        else:
+            booked.append(appointment)
+            bitmap = self.bitmaps[day]
+        self.bitmaps[day] = bitmap | bits
+        if bitmap != full and bitmap | bits == full:
+            self._book_day(day)
+
+    def add_sorted(self, appointments):
+        """Adds appointments sorted by date. Those that come after the last
+        booked day are appended to days and runs without any search."""
+        self.version += 1
+        dates = self.dates
+        if dates and appointments[0].a_ordinal <= dates[-1]:
+            split = bisect_right(appointments, dates[-1],
+                                 key=_appointment_date)
+            for appointment in appointments[:split]:
+                self.add(appointment)
+            appointments = appointments[split:]
+        days = self.days
+        bitmaps = self.bitmaps
+        full = self.slots.full
+        starts = self.run_starts
+        ends = self.run_ends
+        new_days = []
+        last_day = None
+        for appointment in appointments:
+            day = appointment.a_ordinal
+            if day == last_day:
+                booked.append(appointment)
+            else:
+                booked = days[day] = [appointment]
+                new_days.append(day)
+                last_day = day
+        dates.extend(new_days)
+        if self.slots.slot_minutes is None:
+            # every appointment takes the whole day.
+            bitmaps.update(dict.fromkeys(new_days, full))
+            full_days = new_days
+        else:
+            bits_of = self.slots.bits
+            # minute -> bits of the slot starting then.
+            slot_bits = {}
+            for day in new_days:
+                bitmap = 0
+                for appointment in days[day]:
+                    bits = slot_bits.get(appointment.a_minute)
+                    if bits is None:
+                        bits = slot_bits[appointment.a_minute] = \
+                            bits_of(appointment)
+                    bitmap |= bits
+                bitmaps[day] = bitmap
+            full_days = [day for day in new_days if bitmaps[day] == full]
+        for day in full_days:
+            if ends and ends[-1] == day - 1:
+                ends[-1] = day
+            else:
+                starts.append(day)
+                ends.append(day)
+
+    def remove(self, appointment):
+        """Removes the given (stored) appointment."""
+        self.version += 1
+        day = appointment.a_ordinal
+        booked = self.days[day]
+        for index, i in enumerate(booked):
+            if i is appointment:
+                del booked[index]
+                break
+        was_full = self.bitmaps[day] == self.slots.full
+        if not booked:
+            del self.days[day]
+            del self.dates[bisect_left(self.dates, day)]
+            del self.bitmaps[day]
+        else:
+            # the slot stays taken if another appointment shares it.
+            bitmap = 0
+            for i in booked:
+                bitmap |= self.slots.bits(i)
+            self.bitmaps[day] = bitmap
+        if was_full and self.bitmaps.get(day) != self.slots.full:
+            self._free_day(day)
+
+    def is_booked(self, day):
+        """Returns True if every slot of the day is taken."""
+        return self.bitmaps.get(day) == self.slots.full
+
+    def bitmap(self, day):
+        return self.bitmaps.get(day, 0)
+
+    def next_free_day(self, day):
+        """Returns the first day (as an ordinal) from day onwards that has a
+        free slot."""
+        index = bisect_right(self.run_starts, day) - 1
+        if index >= 0 and self.run_ends[index] >= day:
+            return self.run_ends[index] + 1
+        return day
+
+    def _book_day(self, day):
+        starts = self.run_starts
+        ends = self.run_ends
+        index = bisect_right(starts, day)
+        joins_previous = index > 0 and ends[index - 1] == day - 1
+        joins_next = index < len(starts) and starts[index] == day + 1
+        if joins_previous and joins_next:
+            ends[index - 1] = ends[index]
+            del starts[index]
+            del ends[index]
+        elif joins_previous:
+            ends[index - 1] = day
+        elif joins_next:
+            starts[index] = day
+        else:
+            starts.insert(index, day)
+            ends.insert(index, day)
+
+    def _free_day(self, day):
+        starts = self.run_starts
+        ends = self.run_ends
+        index = bisect_right(starts, day) - 1
+        start = starts[index]
+        end = ends[index]
+        if start == end:
+            del starts[index]
+            del ends[index]
+        elif day == start:
+            starts[index] = day + 1
+        elif day == end:
+            ends[index] = day - 1
+        else:
+            # the run is split in two around the freed day.
+            ends[index] = day - 1
+            starts.insert(index + 1, day + 1)
+            ends.insert(index + 1, end)
+
+    def appointments(self):
+        return [i for day in self.dates for i in self.days[day]]
+
+    def between(self, first, last):
+        """Yields the appointments from day first to day last."""
+        dates = self.dates
+        for index in range(bisect_left(dates, first),
+                           bisect_right(dates, last)):
+            yield from self.days[dates[index]]
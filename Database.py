@@ -0,0 +1,669 @@
+import datetime
+import queue
+import sqlite3
+import threading
+from collections.abc import Sequence
+from contextlib import contextmanager
+from itertools import islice
+
+from Classes import Appointment, HealthcareProfessional, Patient, \
+    Preemption, _STAFF_CODES, _STAFF_KINDS, _SlotGrid, _TYPES, _date_ordinal, \
+    _minutes_time, _ordinal_date, _time_minutes
+
+# minute is NULL for a whole-day appointment, which takes every slot. The
+# staff index also has minute, so the slots of a staff-day are read from
+# the index alone.
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS staff (
+    emp_num PRIMARY KEY,
+    kind INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    address TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    UNIQUE (name, address, phone)
+);
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY,
+    a_type INTEGER NOT NULL,
+    emp_num NOT NULL REFERENCES staff,
+    patient INTEGER NOT NULL REFERENCES patients,
+    day INTEGER NOT NULL,
+    minute INTEGER
+);
+CREATE INDEX IF NOT EXISTS appointments_staff_day
+    ON appointments (emp_num, day, minute);
+CREATE INDEX IF NOT EXISTS appointments_patient_day
+    ON appointments (patient, day);
+'''
+
+_COLUMNS = 'a_type, emp_num, patient, day, minute'
+
+# The first day from ?3 on that is not fully booked by ?1. It walks the run
+# of fully booked days starting at ?3 one day at a time, each step being an
+# index lookup, so it costs the length of that run rather than all the days
+# booked after ?3. A day is full when it has a whole-day appointment or ?2
+# different slots taken.
+_NEXT_FREE_DAY = '''
+WITH RECURSIVE booked (day) AS (
+    SELECT ?3
+    UNION ALL
+    SELECT day + 1 FROM booked WHERE (
+        SELECT count(minute) < count(*) OR count(DISTINCT minute) >= ?2
+        FROM appointments
+        WHERE emp_num = ?1 AND appointments.day = booked.day
+    )
+)
+SELECT max(day) FROM booked
+'''
+
+
+class AppointmentsQuery(Sequence):
+    """
+    A read-only view of all appointments in a SqliteSchedule, sorted by
+    date. It behaves like the view of AppointmentSchedule, but every use
+    runs a query, so it shows the database as it is at that moment and the
+    appointments do not have to fit in memory. An index reads a single row
+    (with OFFSET), and iterating reads the rows as it goes.
+    """
+
+    _QUERY = f'SELECT {_COLUMNS} FROM appointments ORDER BY day, id'
+
+    def __init__(self, schedule):
+        self._schedule = schedule
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            return list(self._schedule._select(
+                f'{self._QUERY} LIMIT ? OFFSET ?',
+                (max(0, stop - start), start)))
+        if index < 0:
+            index += len(self)
+        if index >= 0:
+            for appointment in self._schedule._select(
+                    f'{self._QUERY} LIMIT 1 OFFSET ?', (index,)):
+                return appointment
+        raise IndexError('appointment index out of range')
+
+    def __contains__(self, appointment):
+        return appointment in self._schedule
+
+    def __len__(self):
+        return len(self._schedule)
+
+    def __iter__(self):
+        return self._schedule._select(self._QUERY)
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"AppointmentsQuery({self._schedule!r})"
+
+
+class SqliteSchedule:
+    """
+    Schedule of appointments kept in a SQLite database file instead of in
+    memory, so it can grow past RAM. It can be passed to Receptionist like
+    AppointmentSchedule, and slot_minutes, day_start and day_end work the
+    same way.
+    Appointments are indexed by (emp_num, day) and by (patient, day), so
+    checking a slot, finding the next free one (with a gap query over the
+    booked days) and canceling are indexed queries. The database is in WAL
+    mode: changes go through one writer connection, one at a time, while up
+    to readers connections answer queries alongside it. Bulk inserts are
+    made in transactions of batch_size appointments. The iterators it
+    returns hold a reader connection until they are used up; a query made
+    while all of them are held opens a connection of its own.
+    Staff and patients in the file are matched to the given staff and
+    patients objects (by class, name and emp_num, or by name, address and
+    phone); others are created when they are first read.
+    """
+
+    def __init__(self, path, staff=(), patients=(), slot_minutes=None,
+                 day_start='09:00', day_end='17:00', readers=4,
+                 batch_size=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self._slots = _SlotGrid(slot_minutes, day_start, day_end)
+        self._given_staff = {(type(i), i.name, i.emp_num): i for i in staff}
+        self._given_patients = {(i.name, i.address, i.phone): i
+                                for i in patients}
+        # emp_num -> staff and patient object <-> patient_id of the rows
+        # seen so far.
+        self._staff = {}
+        self._patient_ids = {}
+        self._patients = {}
+        self._objects_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer = self._connect()
+        self._writer.execute('PRAGMA journal_mode=WAL')
+        self._writer.executescript(_SCHEMA)
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+
+    def __str__(self):
+        return f"SQLite schedule for the clinic in {self.path}"
+
+    def __repr__(self):
+        return f"SqliteSchedule({self.path!r})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Closes the connections. The schedule cannot be used afterwards."""
+        with self._write_lock:
+            self._writer.close()
+        while not self._readers.empty():
+            self._readers.get().close()
+
+    @property
+    def appointments(self):
+        """Read-only view of all appointments in the clinic, sorted by date
+        (and by the order they were added in), see AppointmentsQuery."""
+        return AppointmentsQuery(self)
+
+    def __len__(self):
+        with self._reader() as connection:
+            return connection.execute(
+                'SELECT count(*) FROM appointments').fetchone()[0]
+
+    def __contains__(self, appointment):
+        with self._reader() as connection:
+            return self._find(connection, appointment) is not None
+
+    def add_appointment(self, appointment):
+        """This function adds the appointment to the database."""
+        with self._transaction() as connection:
+            self._insert(connection, [appointment])
+        return appointment
+
+    def add_appointments(self, appointments):
+        """
+        This function adds many appointments to the database, in
+        transactions of batch_size appointments with one executemany()
+        each, so the appointments do not have to be in memory at once.
+        """
+        appointments = iter(appointments)
+        while True:
+            batch = list(islice(appointments, self.batch_size))
+            if not batch:
+                return
+            with self._transaction() as connection:
+                self._insert(connection, batch)
+
+    def cancel_appointment(self, appointment):
+        """
+        This function removes an appointment equal to the given one from the
+        database and returns the stored appointment (made from the deleted
+        row), or returns None if there is none. The row is found through the
+        (emp_num, day) index.
+        """
+        with self._transaction() as connection:
+            row_id = self._find(connection, appointment)
+            if row_id is None:
+                return None
+            row = connection.execute(
+                f'SELECT {_COLUMNS} FROM appointments WHERE id = ?',
+                (row_id,)).fetchone()
+            connection.execute('DELETE FROM appointments WHERE id = ?',
+                               (row_id,))
+            return self._appointment(connection, *row)
+
+    def is_available(self, staff, a_date, a_time=None):
+        """Returns True if the healthcare professional has no appointment on
+        a_date. With time slots, it returns True if the slot at a_time is
+        free, or if any slot of the day is free when a_time is None."""
+        if a_date is None:
+            return True
+        with self._reader() as connection:
+            return self._is_available(connection, staff, _date_ordinal(a_date),
+                                      a_time)
+
+    def book(self, a_type, staff, patient, a_date, a_time=None):
+        """
+        This function books an appointment as AppointmentSchedule.book()
+        does. The check and the booking are made in one transaction, so two
+        receptionists (also in different processes) cannot book the same
+        slot.
+        """
+        if staff is None or isinstance(staff, type):
+            return self.__book_earliest(a_type, staff or HealthcareProfessional,
+                                        patient, a_date, a_time)
+        day = _date_ordinal(a_date)
+        with self._transaction() as connection:
+            if a_type == 'consultation':
+                if not self._is_available(connection, staff, day, a_time):
+                    return self._next_available(connection, a_type, staff,
+                                                patient, day, a_time)
+                if a_time is None and self._slots.slot_minutes:
+                    new_appointment = self._next_available(
+                        connection, a_type, staff, patient, day, None)
+                else:
+                    new_appointment = Appointment(a_type, staff, patient,
+                                                  a_date, a_time)
+            else:
+                new_appointment = self._next_available(
+                    connection, a_type, staff, patient, day, a_time)
+            self._insert(connection, [new_appointment])
+            return new_appointment
+
+    def preempt(self, staff, patient, a_date, a_time=None):
+        """
+        This function books an emergency to the healthcare professional on
+        a_date as AppointmentSchedule.preempt() does, taking the first slot
+        held only by consultations if the day has no free slot left, and
+        moving those patients to the next free slot after it. The check,
+        the emergency and the moves are made in one transaction.
+        It returns the emergency and a list with a Preemption for every
+        patient moved.
+        """
+        day = _date_ordinal(a_date)
+        slots = self._slots
+        with self._transaction() as connection:
+            first = self._position(day, a_time) - day * slots.count
+            free = slots.first_free(self._bitmap(connection, staff, day),
+                                    first) if first < slots.count else None
+            if free is not None:
+                emergency = self._appointment_at('emergency', staff, patient,
+                                                 day * slots.count + free)
+                self._insert(connection, [emergency])
+                return emergency, []
+            rows = connection.execute(
+                f'SELECT id, {_COLUMNS} FROM appointments WHERE emp_num = ? '
+                f'AND day = ? ORDER BY id', (staff.emp_num, day)).fetchall()
+            for slot in range(first, slots.count):
+                holders = [row for row in rows
+                           if row[5] is None or not slots.slot_minutes or
+                           slots.slot(row[5]) == slot]
+                if all(_TYPES[row[1]] == 'consultation' for row in holders):
+                    break
+            else:
+                emergency = self._next_available(connection, 'emergency',
+                                                 staff, patient, day, a_time)
+                self._insert(connection, [emergency])
+                return emergency, []
+            position = day * slots.count + slot
+            emergency = self._appointment_at('emergency', staff, patient,
+                                             position)
+            self._insert(connection, [emergency])
+            connection.executemany('DELETE FROM appointments WHERE id = ?',
+                                   [(row[0],) for row in holders])
+            preemptions = []
+            for row in holders:
+                bumped = self._appointment(connection, *row[1:])
+                moved = self._appointment_at(
+                    bumped.a_type, staff, bumped.patient,
+                    self._next_free_position(connection, staff, position))
+                self._insert(connection, [moved])
+                preemptions.append(Preemption(emergency, bumped, moved))
+            return emergency, preemptions
+
+    def book_many(self, requests, today):
+        """This function books appointments for many requests as book()
+        would book them one by one, and returns the results in the same
+        order. Requests without a date are made from today."""
+        with self._transaction():
+            return [self.book(request.a_type, request.staff, request.patient,
+                              request.a_date or today, request.a_time)
+                    for request in requests]
+
+    def find_next_available(self, a_type, staff, patient, starting_date,
+                            starting_time=None):
+        """
+        This function finds next available slot to make an appointment to
+        a particular healthcare specialist and returns it. It does not add it
+        to the database! The first day that is not fully booked is found with
+        a single gap query walking the run of booked days from starting_date.
+        """
+        with self._reader() as connection:
+            return self._next_available(connection, a_type, staff, patient,
+                                        _date_ordinal(starting_date),
+                                        starting_time)
+
+    def find_earliest_available(self, a_type, kind, patient, starting_date,
+                                starting_time=None):
+        """
+        This function finds the earliest free slot from starting_date (and
+        starting_time) with any healthcare professional of the given kind
+        and returns it as an appointment, or None if the database has no
+        such professional. Every professional is searched with the gap
+        query, so it takes one query per professional.
+        """
+        with self._reader() as connection:
+            return self._earliest_available(connection, a_type, kind, patient,
+                                            _date_ordinal(starting_date),
+                                            starting_time)
+
+    def _earliest_available(self, connection, a_type, kind, patient, day,
+                            a_time):
+        found = None
+        for row in connection.execute('SELECT emp_num, kind, name FROM staff '
+                                      'ORDER BY emp_num').fetchall():
+            staff = self._load_staff(*row)
+            if isinstance(staff, kind):
+                position = self._next_free_position(
+                    connection, staff, self._position(day, a_time))
+                if found is None or position < found[0]:
+                    found = (position, staff)
+        if found is None:
+            return None
+        return self._appointment_at(a_type, found[1], patient, found[0])
+
+    def __book_earliest(self, a_type, kind, patient, a_date, a_time):
+        """
+        It is a helper function of book() for an appointment to any
+        professional of the kind. A consultation is booked only if somebody
+        is free at the requested time (or on the requested day, if a_time is
+        None).
+        """
+        day = _date_ordinal(a_date)
+        requested = self._position(day, a_time)
+        with self._transaction() as connection:
+            found = self._earliest_available(connection, a_type, kind, patient,
+                                             day, a_time)
+            if found is None:
+                return None
+            if a_type == 'consultation':
+                if a_time is None or not self._slots.slot_minutes:
+                    taken = found.a_ordinal != requested // self._slots.count
+                else:
+                    taken = self._position(found.a_ordinal,
+                                           found.a_time) != requested
+                if taken:
+                    return found
+            self._insert(connection, [found])
+            return found
+
+    def sort(self):
+        """Appointments are always read in date order, so there is nothing
+        to sort."""
+
+    def staff_lock(self, staff):
+        """Returns the lock of the writer connection: changes are made one at
+        a time, so it is the lock of every healthcare professional."""
+        return self._write_lock
+
+    def staff_locks(self, staff):
+        return self._write_lock
+
+    def add_staff(self, staff):
+        """Adds healthcare professionals who may have no appointments yet, so
+        that find_earliest_available can choose them."""
+        with self._transaction() as connection:
+            for i in staff:
+                self._staff_emp_num(connection, i)
+
+    def staff_appointments(self, staff):
+        """Returns the appointments to a healthcare professional sorted by
+        date."""
+        return list(self._select(f'SELECT {_COLUMNS} FROM appointments '
+                                 f'WHERE emp_num = ? ORDER BY day, id',
+                                 (staff.emp_num,)))
+
+    def appointments_between(self, staff, start_date, end_date):
+        """Returns an iterator over the appointments to a healthcare
+        professional from start_date to end_date (both included), sorted by
+        date, read with the (emp_num, day) index."""
+        return self._select(f'SELECT {_COLUMNS} FROM appointments '
+                            f'WHERE emp_num = ? AND day BETWEEN ? AND ? '
+                            f'ORDER BY day, id',
+                            (staff.emp_num, _date_ordinal(start_date),
+                             _date_ordinal(end_date)))
+
+    def appointments_on(self, a_date):
+        """Returns an iterator over all appointments in the clinic on a_date
+        (the day sheet)."""
+        return self._select(f'SELECT {_COLUMNS} FROM appointments '
+                            f'WHERE day = ? ORDER BY id',
+                            (_date_ordinal(a_date),))
+
+    def upcoming_appointments(self, patient, from_date=None):
+        """Returns an iterator over the patient's appointments from
+        from_date (today by default) on, sorted by date, read with the
+        (patient, day) index."""
+        if from_date is None:
+            from_date = str(datetime.date.today())
+        with self._reader() as connection:
+            patient_id = self._known_patient_id(connection, patient)
+        if patient_id is None:
+            return iter(())
+        return self._select(f'SELECT {_COLUMNS} FROM appointments '
+                            f'WHERE patient = ? AND day >= ? '
+                            f'ORDER BY day, id',
+                            (patient_id, _date_ordinal(from_date)))
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('PRAGMA cache_size=-65536')
+        return connection
+
+    @contextmanager
+    def _reader(self):
+        """Holds a reader connection in a read transaction, so all the
+        queries made in the block see the same snapshot of the database.
+        When every reader is held (e.g. by open iterators, which may be
+        nested), a connection of its own is opened and closed afterwards
+        instead of waiting for one that may never come back."""
+        try:
+            connection = self._readers.get_nowait()
+            pooled = True
+        except queue.Empty:
+            connection = self._connect()
+            pooled = False
+        try:
+            connection.execute('BEGIN')
+            try:
+                yield connection
+            finally:
+                connection.execute('COMMIT')
+        finally:
+            if pooled:
+                self._readers.put(connection)
+            else:
+                connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Holds the writer connection in a transaction that is committed if
+        the block ends normally. BEGIN IMMEDIATE takes the database's write
+        lock straight away, so checks made in the block stay true."""
+        with self._write_lock:
+            connection = self._writer
+            if connection.in_transaction:
+                yield connection
+                return
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield connection
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+
+    def _select(self, query, parameters=()):
+        """Yields the appointments of the rows the query returns. The reader
+        connection is held until the iterator is used up or closed."""
+        with self._reader() as connection:
+            for row in connection.execute(query, parameters):
+                yield self._appointment(connection, *row)
+
+    def _insert(self, connection, appointments):
+        slots = self._slots
+        known_staff = self._staff
+        patient_ids = self._patient_ids
+        rows = []
+        for appointment in appointments:
+            minute = appointment.a_minute
+            if minute is not None and slots.slot_minutes:
+                slots.slot(minute)
+            staff = appointment.staff
+            if staff.emp_num not in known_staff:
+                self._staff_emp_num(connection, staff)
+            patient_id = patient_ids.get(appointment.patient)
+            if patient_id is None:
+                patient_id = self._patient_id(connection, appointment.patient)
+            rows.append((appointment._type, staff.emp_num, patient_id,
+                         appointment.a_ordinal, minute))
+        connection.executemany(f'INSERT INTO appointments ({_COLUMNS}) '
+                               f'VALUES (?, ?, ?, ?, ?)', rows)
+
+    def _find(self, connection, appointment):
+        """Returns the id of the first row equal to the appointment, or
+        None."""
+        patient_id = self._known_patient_id(connection, appointment.patient)
+        if patient_id is None:
+            return None
+        row = connection.execute(
+            'SELECT id FROM appointments WHERE emp_num = ? AND day = ? AND '
+            'a_type = ? AND patient = ? AND minute IS ? ORDER BY id LIMIT 1',
+            (appointment.staff.emp_num, appointment.a_ordinal,
+             appointment._type, patient_id, appointment.a_minute)).fetchone()
+        return None if row is None else row[0]
+
+    def _is_available(self, connection, staff, day, a_time):
+        bitmap = self._bitmap(connection, staff, day)
+        if a_time is None or not self._slots.slot_minutes:
+            return bitmap != self._slots.full
+        slot = self._slots.slot(_time_minutes(a_time))
+        return not bitmap >> slot & 1
+
+    def _bitmap(self, connection, staff, day):
+        """Returns the bitmap of the slots taken on the ordinal day (see
+        _SlotGrid)."""
+        slots = self._slots
+        bitmap = 0
+        for minute, in connection.execute(
+                'SELECT minute FROM appointments WHERE emp_num = ? AND '
+                'day = ?', (staff.emp_num, day)):
+            if minute is None or not slots.slot_minutes:
+                return slots.full
+            bitmap |= 1 << slots.slot(minute)
+        return bitmap
+
+    def _next_available(self, connection, a_type, staff, patient, day,
+                        a_time):
+        position = self._next_free_position(connection, staff,
+                                            self._position(day, a_time))
+        return self._appointment_at(a_type, staff, patient, position)
+
+    def _next_free_position(self, connection, staff, position):
+        """Returns the first free position (day * slots per day + slot) from
+        position onwards."""
+        slots = self._slots
+        day, slot = divmod(position, slots.count)
+        slot = slots.first_free(self._bitmap(connection, staff, day), slot)
+        if slot is None:
+            day, = connection.execute(
+                _NEXT_FREE_DAY,
+                (staff.emp_num, slots.count, day + 1)).fetchone()
+            slot = slots.first_free(self._bitmap(connection, staff, day))
+        return day * slots.count + slot
+
+    def _position(self, day, a_time):
+        slots = self._slots
+        if a_time is None or not slots.slot_minutes:
+            return day * slots.count
+        return day * slots.count + slots.first_slot(_time_minutes(a_time))
+
+    def _appointment_at(self, a_type, staff, patient, position):
+        slots = self._slots
+        day, slot = divmod(position, slots.count)
+        a_time = slots.time(slot) if slots.slot_minutes else None
+        return Appointment(a_type, staff, patient, _ordinal_date(day), a_time)
+
+    def _appointment(self, connection, a_type, emp_num, patient_id, day,
+                     minute):
+        staff = self._staff.get(emp_num)
+        if staff is None:
+            staff = self._load_staff(*connection.execute(
+                'SELECT emp_num, kind, name FROM staff WHERE emp_num = ?',
+                (emp_num,)).fetchone())
+        patient = self._patients.get(patient_id)
+        if patient is None:
+            patient = self._load_patient(patient_id, *connection.execute(
+                'SELECT name, address, phone FROM patients '
+                'WHERE patient_id = ?', (patient_id,)).fetchone())
+        return Appointment.from_ordinal(
+            _TYPES[a_type], staff, patient, day,
+            None if minute is None else _minutes_time(minute))
+
+    def _staff_emp_num(self, connection, staff):
+        """Returns the emp_num of the professional, adding them to the staff
+        table the first time they are seen."""
+        if staff.emp_num not in self._staff:
+            connection.execute('INSERT OR IGNORE INTO staff (emp_num, kind, '
+                               'name) VALUES (?, ?, ?)',
+                               (staff.emp_num, _STAFF_CODES[type(staff)],
+                                staff.name))
+            with self._objects_lock:
+                self._staff.setdefault(staff.emp_num, staff)
+        return staff.emp_num
+
+    def _patient_id(self, connection, patient):
+        """Returns the patient_id of the patient, adding them to the patients
+        table the first time they are seen."""
+        patient_id = self._patient_ids.get(patient)
+        if patient_id is None:
+            connection.execute('INSERT OR IGNORE INTO patients (name, '
+                               'address, phone) VALUES (?, ?, ?)',
+                               (patient.name, patient.address, patient.phone))
+            patient_id = self._stored_patient_id(connection, patient)
+            with self._objects_lock:
+                self._patient_ids[patient] = patient_id
+                self._patients.setdefault(patient_id, patient)
+        return patient_id
+
+    def _known_patient_id(self, connection, patient):
+        """Returns the patient_id of the patient, or None if the patient is
+        not in the database."""
+        patient_id = self._patient_ids.get(patient)
+        if patient_id is None:
+            patient_id = self._stored_patient_id(connection, patient)
+            if patient_id is not None:
+                with self._objects_lock:
+                    self._patient_ids[patient] = patient_id
+                    self._patients.setdefault(patient_id, patient)
+        return patient_id
+
+    def _stored_patient_id(self, connection, patient):
+        row = connection.execute(
+            'SELECT patient_id FROM patients WHERE name = ? AND address = ? '
+            'AND phone = ?',
+            (patient.name, patient.address, patient.phone)).fetchone()
+        return None if row is None else row[0]
+
+    def _load_staff(self, emp_num, kind, name):
+        staff = self._staff.get(emp_num)
+        if staff is None:
+            staff_class = _STAFF_KINDS[kind]
+            staff = self._given_staff.get((staff_class, name, emp_num))
+            if staff is None:
+                staff = staff_class(name, emp_num)
+            with self._objects_lock:
+                staff = self._staff.setdefault(emp_num, staff)
+        return staff
+
+    def _load_patient(self, patient_id, name, address, phone):
+        patient = self._given_patients.get((name, address, phone))
+        if patient is None:
+            patient = Patient(name, address, phone)
+        with self._objects_lock:
+            patient = self._patients.setdefault(patient_id, patient)
+            self._patient_ids.setdefault(patient, patient_id)
+        return patient
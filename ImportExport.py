@@ -0,0 +1,268 @@
+import csv
+import gc
+import json
+from itertools import islice
+from operator import itemgetter
+
+from Classes import Appointment, Doctor, HealthcareProfessional, Nurse, \
+    PatientRegistry, _TYPE_CODES, _date_ordinal, _time_minutes
+
+# columns of an exported appointment, in the order they are written to CSV.
+FIELDS = ('a_type', 'a_date', 'a_time', 'staff_kind', 'staff_name',
+          'emp_num', 'patient_name', 'address', 'phone')
+
+_STAFF_KINDS = {'doctor': Doctor, 'nurse': Nurse,
+                'staff': HealthcareProfessional}
+_KIND_NAMES = {kind: name for name, kind in _STAFF_KINDS.items()}
+_fields = itemgetter(*FIELDS)
+
+
+def export_rows(appointments):
+    """Yields every appointment as a dict with the FIELDS keys. a_time is
+    None for a whole-day appointment."""
+    for values in _export(appointments):
+        yield dict(zip(FIELDS, values))
+
+
+def _export(appointments):
+    """Yields the FIELDS values of every appointment as a tuple."""
+    for appointment in appointments:
+        staff = appointment.staff
+        patient = appointment.patient
+        yield (appointment.a_type, appointment.a_date, appointment.a_time,
+               _KIND_NAMES[type(staff)], staff.name, staff.emp_num,
+               patient.name, patient.address, patient.phone)
+
+
+def import_rows(rows, staff=(), patients=None):
+    """
+    Yields an appointment for every row (a dict with the FIELDS keys), as
+    it is read. Rows are validated as Appointment validates its arguments
+    and a ValueError gives the number of the row that is wrong.
+    A professional is created once for each staff_kind, staff_name and
+    emp_num, unless one of the given staff matches them. Patients are
+    registered in patients, a PatientRegistry (a new one if None), so each
+    person is one Patient object.
+    """
+    return _import(rows, _fields, staff, patients)
+
+
+def _import(rows, fields, staff, patients, first=1):
+    """Works as import_rows(); fields returns the FIELDS values of a row
+    and the rows are numbered from first."""
+    known_staff = {(_KIND_NAMES[type(i)], i.name, i.emp_num): i
+                   for i in staff}
+    if patients is None:
+        patients = PatientRegistry()
+    # the registry normalises the details of a patient; rows of a patient
+    # usually repeat them exactly, so those are looked up first.
+    known_patients = {}
+    new_appointment = Appointment
+    for number, row in enumerate(rows, first):
+        try:
+            a_type, a_date, a_time, staff_kind, staff_name, emp_num, \
+                patient_name, address, phone = fields(row)
+            staff_key = (staff_kind, staff_name, emp_num)
+            professional = known_staff.get(staff_key)
+            if professional is None:
+                kind = _STAFF_KINDS.get(staff_kind)
+                if kind is None:
+                    raise ValueError('Wrong staff kind')
+                professional = known_staff[staff_key] = kind(staff_name,
+                                                             emp_num)
+            patient_key = (patient_name, address, phone)
+            patient = known_patients.get(patient_key)
+            if patient is None:
+                patient = known_patients[patient_key] = patients.register(
+                    patient_name, address, phone)
+            yield new_appointment(a_type, professional, patient, a_date,
+                                  a_time or None)
+        except (KeyError, IndexError, TypeError, ValueError) as error:
+            raise ValueError(f'Row {number}: {error!r}') from error
+
+
+def load(schedule, appointments, batch_size=65536):
+    """Adds the appointments to the schedule in batches of batch_size with
+    add_appointments(), so only one batch is held in memory at a time. It
+    returns the number of appointments added."""
+    appointments = iter(appointments)
+    count = 0
+    # loading creates objects that are all kept, so the garbage collector
+    # would only slow it down.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while True:
+            batch = list(islice(appointments, batch_size))
+            if not batch:
+                return count
+            schedule.add_appointments(batch)
+            count += len(batch)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def load_columns(schedule, rows, fields, staff=(), patients=None,
+                 batch_size=65536):
+    """
+    Adds the rows to the schedule as import_rows() and load() would, but
+    without making and checking an Appointment for every row on the way:
+    each batch of batch_size rows is turned into columns of numbers (every
+    distinct date, time, professional and patient is parsed once) and
+    added with the schedule's add_columns(). fields returns the FIELDS
+    values of a row. It returns the number of appointments added.
+    """
+    rows = iter(rows)
+    known_staff = {(_KIND_NAMES[type(i)], i.name, i.emp_num): i
+                   for i in staff}
+    if patients is None:
+        patients = PatientRegistry()
+    known_patients = {}
+    days = {}
+    minutes = {}
+    count = 0
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return count
+            try:
+                columns = _columns(batch, fields, known_staff,
+                                   known_patients, patients, days, minutes)
+            except (KeyError, IndexError, TypeError, ValueError):
+                # the rows are read one by one to tell which one is wrong.
+                for _ in _import(batch, fields, staff, PatientRegistry(),
+                                 count + 1):
+                    pass
+                raise
+            schedule.add_columns(*columns)
+            count += len(batch)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _columns(batch, fields, known_staff, known_patients, patients, days,
+             minutes):
+    """Returns the arguments of AppointmentSchedule.add_columns() for a
+    batch of rows. known_staff, known_patients, days and minutes are the
+    professionals, patients, ordinal days and minutes found so far."""
+    types = []
+    staff_ids = []
+    patient_ids = []
+    ordinals = []
+    times = []
+    # the professionals and patients of the batch and their numbers in it.
+    staff = []
+    staff_numbers = {}
+    batch_patients = []
+    patient_numbers = {}
+    for a_type, a_date, a_time, staff_kind, staff_name, emp_num, \
+            patient_name, address, phone in map(fields, batch):
+        types.append(_TYPE_CODES[a_type])
+        day = days.get(a_date)
+        if day is None:
+            day = days[a_date] = _date_ordinal(a_date)
+        ordinals.append(day)
+        minute = minutes.get(a_time)
+        if minute is None:
+            minute = minutes[a_time] = _time_minutes(a_time) if a_time \
+                else -1
+        times.append(minute)
+        staff_key = (staff_kind, staff_name, emp_num)
+        number = staff_numbers.get(staff_key)
+        if number is None:
+            number = staff_numbers[staff_key] = len(staff)
+            professional = known_staff.get(staff_key)
+            if professional is None:
+                kind = _STAFF_KINDS.get(staff_kind)
+                if kind is None:
+                    raise ValueError('Wrong staff kind')
+                professional = known_staff[staff_key] = kind(staff_name,
+                                                             emp_num)
+            staff.append(professional)
+        staff_ids.append(number)
+        patient_key = (patient_name, address, phone)
+        number = patient_numbers.get(patient_key)
+        if number is None:
+            number = patient_numbers[patient_key] = len(batch_patients)
+            patient = known_patients.get(patient_key)
+            if patient is None:
+                patient = known_patients[patient_key] = patients.register(
+                    patient_name, address, phone)
+            batch_patients.append(patient)
+        patient_ids.append(number)
+    return (staff, batch_patients, types, staff_ids, patient_ids, ordinals,
+            times)
+
+
+def read_csv(file):
+    """Yields the rows of a CSV file written by write_csv()."""
+    reader = csv.reader(file)
+    header = next(reader, None)
+    if header is None:
+        return
+    for values in reader:
+        yield dict(zip(header, values))
+
+
+def _csv_fields(file):
+    """Returns the lines of a CSV file as lists and a function returning
+    the FIELDS values of such a line, for loading without making a dict of
+    every line."""
+    reader = csv.reader(file)
+    header = next(reader, [])
+    missing = [i for i in FIELDS if i not in header]
+    if missing:
+        raise ValueError(f'Missing columns {missing}')
+    return reader, itemgetter(*[header.index(i) for i in FIELDS])
+
+
+def write_csv(rows, file):
+    """Writes the rows to a CSV file with a header line."""
+    writer = csv.writer(file)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow([row[i] for i in FIELDS])
+
+
+def read_jsonl(file):
+    """Yields the rows of a JSON Lines file, skipping blank lines."""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_jsonl(rows, file):
+    """Writes every row as a JSON object on its own line."""
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    for row in rows:
+        file.write(encode(row))
+        file.write('\n')
+
+
+def load_file(schedule, path, staff=(), patients=None, batch_size=65536):
+    """Loads a .csv or a .jsonl file into the schedule with
+    load_columns(). It returns the number of appointments added."""
+    with open(path, newline='', encoding='utf-8') as file:
+        if path.endswith('.csv'):
+            rows, fields = _csv_fields(file)
+        else:
+            rows, fields = read_jsonl(file), _fields
+        return load_columns(schedule, rows, fields, staff, patients,
+                            batch_size)
+
+
+def dump_file(schedule, path):
+    """Writes the schedule's appointments in date order to a .csv or a
+    .jsonl file. The schedule's list is read as it is written, not copied."""
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        if path.endswith('.csv'):
+            writer = csv.writer(file)
+            writer.writerow(FIELDS)
+            writer.writerows(_export(schedule.appointments))
+        else:
+            write_jsonl(export_rows(schedule.appointments), file)
@@ -0,0 +1,212 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+import Classes
+from Classes import AppointmentSchedule, Receptionist
+
+# upper bounds of the latency histogram buckets, in microseconds.
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+                   10000, 100000)
+# upper bounds of the scan length histogram buckets, in entries examined.
+SCAN_BUCKETS = tuple(2 ** i for i in range(0, 25, 2))
+
+
+class Metrics:
+    """
+    Call counts, latency histograms and scan length histograms of the
+    instrumented operations. A scan length is the number of entries an
+    operation looked at, e.g. appointments sorted or runs of booked days
+    searched for a gap.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def __repr__(self):
+        return f"Metrics({sorted(self._operations)})"
+
+    def observe(self, name, nanoseconds, scanned=None):
+        """Records one call of the operation name."""
+        with self._lock:
+            operation = self._operations.get(name)
+            if operation is None:
+                operation = self._operations[name] = {
+                    'calls': 0,
+                    'seconds': 0.0,
+                    'latency': [0] * (len(LATENCY_BUCKETS) + 1),
+                    'scanned': 0,
+                    'scans': [0] * (len(SCAN_BUCKETS) + 1),
+                }
+            operation['calls'] += 1
+            operation['seconds'] += nanoseconds / 1e9
+            operation['latency'][bisect_left(LATENCY_BUCKETS,
+                                             nanoseconds / 1000)] += 1
+            if scanned is not None:
+                operation['scanned'] += scanned
+                operation['scans'][bisect_left(SCAN_BUCKETS, scanned)] += 1
+
+    def snapshot(self):
+        """Returns a copy of the metrics: operation name -> calls, total
+        seconds, latency bucket counts, entries scanned and scan bucket
+        counts. The last bucket of each histogram has no upper bound."""
+        with self._lock:
+            return {name: {key: list(value) if isinstance(value, list)
+                           else value for key, value in operation.items()}
+                    for name, operation in self._operations.items()}
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+    def export(self, exporter):
+        """Passes a snapshot to the exporter and returns what it returns."""
+        return exporter(self.snapshot())
+
+
+class MemoryExporter:
+    """Exporter keeping every snapshot it is given in snapshots."""
+
+    def __init__(self):
+        self.snapshots = []
+
+    def __call__(self, snapshot):
+        self.snapshots.append(snapshot)
+        return snapshot
+
+
+class PrometheusExporter:
+    """Exporter returning the snapshot in the Prometheus text format, with
+    metric names starting with prefix."""
+
+    def __init__(self, prefix='schedule'):
+        self.prefix = prefix
+
+    def __call__(self, snapshot):
+        lines = []
+        calls = f"{self.prefix}_calls_total"
+        latency = f"{self.prefix}_latency_seconds"
+        scanned = f"{self.prefix}_scanned_entries"
+        lines.append(f"# TYPE {calls} counter")
+        for name, operation in sorted(snapshot.items()):
+            lines.append(f'{calls}{{operation="{name}"}} '
+                         f'{operation["calls"]}')
+        lines.append(f"# TYPE {latency} histogram")
+        for name, operation in sorted(snapshot.items()):
+            lines.extend(_histogram(latency, name, operation['latency'],
+                                    [i / 1e6 for i in LATENCY_BUCKETS],
+                                    operation['seconds'],
+                                    operation['calls']))
+        lines.append(f"# TYPE {scanned} histogram")
+        for name, operation in sorted(snapshot.items()):
+            scans = sum(operation['scans'])
+            if scans:
+                lines.extend(_histogram(scanned, name, operation['scans'],
+                                        SCAN_BUCKETS, operation['scanned'],
+                                        scans))
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram(metric, name, counts, bounds, total, count):
+    lines = []
+    cumulative = 0
+    for bound, bucket in zip(list(bounds) + ['+Inf'], counts):
+        cumulative += bucket
+        lines.append(f'{metric}_bucket{{operation="{name}",le="{bound}"}} '
+                     f'{cumulative}')
+    lines.append(f'{metric}_sum{{operation="{name}"}} {total}')
+    lines.append(f'{metric}_count{{operation="{name}"}} {count}')
+    return lines
+
+
+def _gap_search(calendar):
+    """Runs of booked days a binary search over the calendar looks at."""
+    return len(calendar.run_starts).bit_length() if calendar else 0
+
+
+def _find_scan(schedule, a_type, staff, patient, starting_date,
+               starting_time=None):
+    return _gap_search(schedule._staff.get(staff.emp_num))
+
+
+def _busy_scan(schedule, a_type, staff, patient, calendar, starting_day):
+    return _gap_search(calendar)
+
+
+def _sort_scan(schedule):
+    return len(schedule.appointments)
+
+
+def _check_scan(appointment, schedule):
+    return 1
+
+
+# (owner, attribute, operation name, scan length function)
+_HOT_PATHS = (
+    (Receptionist, 'make_appointment', 'make_appointment', None),
+    (Receptionist, 'cancel_appointment', 'cancel_appointment', None),
+    (AppointmentSchedule, 'find_next_available', 'find_next_available',
+     _find_scan),
+    (AppointmentSchedule, '_AppointmentSchedule__next_available_busy_schedule',
+     'next_available_busy_schedule', _busy_scan),
+    (AppointmentSchedule, 'sort', 'sort', _sort_scan),
+    (Classes, 'check_availability', 'check_availability', _check_scan),
+)
+
+_originals = {}
+_metrics = None
+
+
+def enable(metrics=None):
+    """
+    Starts instrumenting Receptionist.make_appointment and
+    cancel_appointment, AppointmentSchedule.find_next_available, its busy
+    schedule helper and sort, and check_availability. It returns the
+    Metrics they record to. Instrumentation replaces the functions with
+    timed wrappers and disable() puts the originals back, so it costs
+    nothing while it is off. Code that imported check_availability by name
+    before enable() keeps calling the original.
+    """
+    global _metrics
+    if _metrics is not None:
+        return _metrics
+    _metrics = metrics if metrics is not None else Metrics()
+    for owner, attribute, name, scan in _HOT_PATHS:
+        original = owner.__dict__[attribute]
+        _originals[owner, attribute] = original
+        if isinstance(original, staticmethod):
+            timed = staticmethod(_timed(original.__func__, name, scan,
+                                        _metrics))
+        else:
+            timed = _timed(original, name, scan, _metrics)
+        setattr(owner, attribute, timed)
+    return _metrics
+
+
+def disable():
+    """Stops instrumenting and returns the Metrics that were recorded, or
+    None if instrumentation was not on."""
+    global _metrics
+    for (owner, attribute), original in _originals.items():
+        setattr(owner, attribute, original)
+    _originals.clear()
+    metrics, _metrics = _metrics, None
+    return metrics
+
+
+def _timed(function, name, scan, metrics):
+    clock = time.perf_counter_ns
+    observe = metrics.observe
+
+    @wraps(function)
+    def timed(*args, **kwargs):
+        scanned = scan(*args, **kwargs) if scan is not None else None
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            observe(name, clock() - start, scanned)
+
+    return timed
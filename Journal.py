@@ -0,0 +1,380 @@
+import gc
+import json
+import os
+import struct
+import sys
+from array import array
+from operator import attrgetter
+
+from Classes import Appointment, AppointmentSchedule, Patient, \
+    _STAFF_CODES, _STAFF_KINDS, _TYPE_CODES, _TYPES, _minutes_time
+
+# Every add and cancel is written to the journal as one fixed-size record:
+# record kind, appointment type code, staff id, patient id, ordinal day and
+# the time as minutes after midnight (-1 for a whole-day appointment).
+# Staff and patients get small ids the first time they are seen, and a
+# definition record with their details is written before they are used.
+_RECORD = struct.Struct('<cBIIih')
+_STAFF = struct.Struct('<cIB')
+_PATIENT = struct.Struct('<cI')
+_LENGTH = struct.Struct('<H')
+_HEADER = struct.Struct('<8sII')
+_MAGIC = b'APSNAP2\n'
+
+_ordinal = attrgetter('a_ordinal')
+
+
+class DurableSchedule(AppointmentSchedule):
+    """
+    AppointmentSchedule that survives a restart. Each add and cancel is
+    appended to a journal file in the given directory. From time to time the
+    whole schedule is written to a binary snapshot and a new, empty journal
+    is started, so opening the schedule loads the latest snapshot and
+    replays only the records written after it.
+    The journal is fsync-ed after every group_size records (group commit),
+    so up to group_size - 1 of the latest changes can be lost if the machine
+    goes down; group_size=1 syncs every change and None leaves it to the
+    operating system. A snapshot is taken every snapshot_every records.
+    options (concurrent, slot_minutes, ...) work as in AppointmentSchedule;
+    journal writes are done under the schedule lock.
+    Staff and patients found in the files are matched to the given staff and
+    patients objects (by class, name and emp_num, or by name, address and
+    phone); others are created. All of them are in known_staff and
+    known_patients.
+    """
+
+    def __init__(self, directory, staff=(), patients=(), group_size=64,
+                 snapshot_every=100000, **options):
+        super().__init__(**options)
+        self.directory = directory
+        self.group_size = group_size
+        self.snapshot_every = snapshot_every
+        self.known_staff = []
+        self.known_patients = []
+        # id() of a staff or patient object -> its id in the journal.
+        self._staff_ids = {}
+        self._patient_ids = {}
+        self._given_staff = {(type(i), i.name, i.emp_num): i for i in staff}
+        self._given_patients = {(i.name, i.address, i.phone): i
+                                for i in patients}
+        self._unsynced = 0
+        self._since_snapshot = 0
+        self._replaying = True
+        os.makedirs(directory, exist_ok=True)
+        self._generation = self._recover()
+        self._log = open(self._path('journal', self._generation), 'ab')
+        self._replaying = False
+
+    def __str__(self):
+        return f"Durable schedule for the clinic in {self.directory}"
+
+    def __repr__(self):
+        return f"DurableSchedule({self.directory!r})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_appointment(self, appointment):
+        super().add_appointment(appointment)
+        self._maybe_snapshot()
+        return appointment
+
+    # A snapshot is made of the appointments in the list and the index, so
+    # a change to the index and its journal record are made together under
+    # the schedule lock (staff locks are always taken before it).
+
+    def reserve_appointment(self, appointment):
+        with self._lock:
+            super().reserve_appointment(appointment)
+            self._write(b'A', appointment)
+
+    def merge_reserved(self, appointments):
+        super().merge_reserved(appointments)
+        self._maybe_snapshot()
+
+    def add_appointments(self, appointments):
+        appointments = list(appointments)
+        self._slots.check(appointments)
+        with self.staff_locks([i.staff for i in appointments]):
+            with self._lock:
+                # the records are written first: a snapshot can be taken
+                # when the appointments are merged, and it has to come after
+                # them.
+                for appointment in appointments:
+                    self._write(b'A', appointment)
+                return super().add_appointments(appointments)
+
+    def add_columns(self, staff, patients, types, staff_ids, patient_ids,
+                    days, minutes):
+        # every appointment gets its own journal record, so they are added
+        # as objects.
+        return self.add_appointments(
+            Appointment.from_ordinal(_TYPES[a_type], staff[staff_id],
+                                     patients[patient_id], day, _time(minute))
+            for a_type, staff_id, patient_id, day, minute in zip(
+                types, staff_ids, patient_ids, days, minutes))
+
+    def cancel_appointment(self, appointment):
+        with self.staff_lock(appointment.staff):
+            with self._lock:
+                canceled_appointment = super().cancel_appointment(appointment)
+                if canceled_appointment is not None:
+                    self._write(b'C', canceled_appointment)
+        if canceled_appointment is not None:
+            self._maybe_snapshot()
+        return canceled_appointment
+
+    def sync(self):
+        """Writes buffered records to the journal file and fsync-s it."""
+        with self._lock:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        """Syncs and closes the journal. The schedule cannot be changed
+        afterwards."""
+        if not self._log.closed:
+            self.sync()
+            self._log.close()
+
+    def snapshot(self):
+        """
+        Writes the whole schedule to a new snapshot and starts a new journal.
+        The snapshot is written to a temporary file and renamed, so a crash
+        leaves either the old snapshot and journal or the new ones.
+        """
+        with self._lock:
+            self._snapshot()
+
+    def _snapshot(self):
+        self.sync()
+        generation = self._generation + 1
+        # the schedule's list, and the reserved appointments that are only
+        # in the index yet, after the others of their day (as
+        # merge_reserved() puts them).
+        listed = set(map(id, self._appointments))
+        appointments = sorted(
+            self._appointments + [i for stored in self._index.values()
+                                  for i in stored if id(i) not in listed],
+            key=_ordinal)
+        types = array('B', [_TYPE_CODES[i.a_type] for i in appointments])
+        staff_ids = array('I', [self._staff_id(i.staff)
+                                for i in appointments])
+        patient_ids = array('I', [self._patient_id(i.patient)
+                                  for i in appointments])
+        days = array('i', [i.a_ordinal for i in appointments])
+        minutes = array('h', [_minute(i) for i in appointments])
+        tables = json.dumps({
+            'staff': [[_STAFF_CODES[type(i)], i.name, i.emp_num]
+                      for i in self.known_staff],
+            'patients': [[i.name, i.address, i.phone]
+                         for i in self.known_patients],
+        }).encode()
+        path = self._path('snapshot', generation)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(_HEADER.pack(_MAGIC, len(tables), len(appointments)))
+            file.write(tables)
+            for column in (types, staff_ids, patient_ids, days, minutes):
+                file.write(_little_endian(column).tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+        self._log.close()
+        self._log = open(self._path('journal', generation), 'ab')
+        for kind in ('snapshot', 'journal'):
+            old_path = self._path(kind, self._generation)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+        self._generation = generation
+        self._since_snapshot = 0
+
+    def _write(self, kind, appointment):
+        if self._replaying:
+            return
+        with self._lock:
+            self._write_record(kind, appointment)
+
+    def _write_record(self, kind, appointment):
+        staff_id = self._staff_id(appointment.staff)
+        patient_id = self._patient_id(appointment.patient)
+        self._log.write(_RECORD.pack(kind, _TYPE_CODES[appointment.a_type],
+                                     staff_id, patient_id,
+                                     appointment.a_ordinal,
+                                     _minute(appointment)))
+        self._unsynced += 1
+        self._since_snapshot += 1
+        if self.group_size is not None and self._unsynced >= self.group_size:
+            self.sync()
+
+    def _maybe_snapshot(self):
+        if not self._replaying and self.snapshot_every is not None and \
+                self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def _staff_id(self, staff):
+        staff_id = self._staff_ids.get(id(staff))
+        if staff_id is None:
+            staff_id = self._remember_staff(staff)
+            if not self._replaying:
+                self._log.write(_STAFF.pack(b'S', staff_id,
+                                            _STAFF_CODES[type(staff)]) +
+                                _pack_strings(staff.name, staff.emp_num))
+        return staff_id
+
+    def _patient_id(self, patient):
+        patient_id = self._patient_ids.get(id(patient))
+        if patient_id is None:
+            patient_id = self._remember_patient(patient)
+            if not self._replaying:
+                self._log.write(_PATIENT.pack(b'P', patient_id) +
+                                _pack_strings(patient.name, patient.address,
+                                              patient.phone))
+        return patient_id
+
+    def _remember_staff(self, staff):
+        self._staff_ids[id(staff)] = len(self.known_staff)
+        self.known_staff.append(staff)
+        return len(self.known_staff) - 1
+
+    def _remember_patient(self, patient):
+        self._patient_ids[id(patient)] = len(self.known_patients)
+        self.known_patients.append(patient)
+        return len(self.known_patients) - 1
+
+    def _load_staff(self, kind, name, emp_num):
+        staff_class = _STAFF_KINDS[kind]
+        staff = self._given_staff.get((staff_class, name, emp_num))
+        if staff is None:
+            staff = staff_class(name, emp_num)
+        return self._remember_staff(staff)
+
+    def _load_patient(self, name, address, phone):
+        patient = self._given_patients.get((name, address, phone))
+        if patient is None:
+            patient = Patient(name, address, phone)
+        return self._remember_patient(patient)
+
+    def _path(self, kind, generation):
+        extension = 'bin' if kind == 'snapshot' else 'log'
+        return os.path.join(self.directory,
+                            f"{kind}-{generation:08d}.{extension}")
+
+    def _recover(self):
+        """Loads the latest snapshot and replays its journal. Returns the
+        generation of the snapshot."""
+        generations = [int(name[9:17]) for name in os.listdir(self.directory)
+                       if name.startswith('snapshot-') and
+                       name.endswith('.bin')]
+        generation = max(generations, default=0)
+        # loading creates an object per appointment and nothing that can be
+        # collected, so the garbage collector would only slow it down.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if generations:
+                self._load_snapshot(self._path('snapshot', generation))
+            journal = self._path('journal', generation)
+            if os.path.exists(journal):
+                self._replay(journal)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return generation
+
+    def _load_snapshot(self, path):
+        with open(path, 'rb') as file:
+            magic, tables_size, count = _HEADER.unpack(
+                file.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f'{path} is not a schedule snapshot')
+            tables = json.loads(file.read(tables_size))
+            columns = []
+            for typecode in 'BIIih':
+                column = array(typecode)
+                column.frombytes(file.read(count * column.itemsize))
+                columns.append(_little_endian(column))
+        for kind, name, emp_num in tables['staff']:
+            self._load_staff(kind, name, emp_num)
+        for name, address, phone in tables['patients']:
+            self._load_patient(name, address, phone)
+        super().add_columns(self.known_staff, self.known_patients, *columns)
+
+    def _replay(self, path):
+        """Applies the journal records. Runs of adds are applied in bulk. A
+        record cut short by a crash is dropped from the file."""
+        with open(path, 'rb') as file:
+            data = file.read()
+        offset = 0
+        added = []
+        try:
+            while offset < len(data):
+                kind = data[offset:offset + 1]
+                if kind in (b'A', b'C'):
+                    _, a_type, staff_id, patient_id, day, minute = \
+                        _RECORD.unpack_from(data, offset)
+                    offset += _RECORD.size
+                    appointment = Appointment.from_ordinal(
+                        _TYPES[a_type], self.known_staff[staff_id],
+                        self.known_patients[patient_id], day, _time(minute))
+                    if kind == b'A':
+                        added.append(appointment)
+                    else:
+                        if added:
+                            super().add_appointments(added)
+                            added = []
+                        super().cancel_appointment(appointment)
+                elif kind == b'S':
+                    _, _, staff_kind = _STAFF.unpack_from(data, offset)
+                    (name, emp_num), end = _unpack_strings(
+                        data, offset + _STAFF.size, 2)
+                    self._load_staff(staff_kind, name, emp_num)
+                    offset = end
+                elif kind == b'P':
+                    (name, address, phone), end = _unpack_strings(
+                        data, offset + _PATIENT.size, 3)
+                    self._load_patient(name, address, phone)
+                    offset = end
+                else:
+                    raise ValueError(f'Unknown journal record {kind!r}')
+        except (struct.error, UnicodeDecodeError):
+            with open(path, 'r+b') as file:
+                file.truncate(offset)
+        super().add_appointments(added)
+
+
+def _minute(appointment):
+    return -1 if appointment.a_minute is None else appointment.a_minute
+
+
+def _time(minute):
+    return None if minute < 0 else _minutes_time(minute)
+
+
+def _pack_strings(*strings):
+    output = b''
+    for string in strings:
+        encoded = string.encode()
+        output += _LENGTH.pack(len(encoded)) + encoded
+    return output
+
+
+def _unpack_strings(data, offset, count):
+    strings = []
+    for _ in range(count):
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        if offset + length > len(data):
+            raise struct.error('string cut short')
+        strings.append(data[offset:offset + length].decode())
+        offset += length
+    return strings, offset
+
+
+def _little_endian(column):
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
@@ -0,0 +1,145 @@
+import asyncio
+
+from Classes import Appointment, Receptionist
+
+
+class BookingService:
+    """
+    asyncio front-end to an AppointmentSchedule. Many coroutines can book,
+    cancel and look up appointments at the same time from one event loop.
+    Requests to the same healthcare professional that arrive within window
+    seconds of the first one are coalesced: they are handled together, in
+    arrival order, when the window closes. Runs of bookings in a batch go
+    through Receptionist.make_appointments_bulk, so the batch pays for one
+    merge of the schedule's list instead of one per request.
+    """
+
+    def __init__(self, schedule, receptionist=None, window=0.001):
+        self.schedule = schedule
+        self.receptionist = receptionist or Receptionist('Service', 'r000')
+        self.window = window
+        self.requests = 0
+        self.batches = 0
+        # staff emp_num -> list of (operation, future) waiting for a batch.
+        self._pending = {}
+        self._flushed = None
+
+    def __str__(self):
+        return f"Booking service for {self.schedule}"
+
+    def __repr__(self):
+        return f"BookingService({self.schedule!r}, {self.receptionist!r}, " \
+               f"{self.window})"
+
+    async def make_appointment(self, a_type, staff, patient, a_date=None,
+                               a_time=None):
+        """Works as Receptionist.make_appointment. A request to whichever
+        professional is free first (staff is None, Doctor or Nurse) belongs
+        to no professional's batch, so it is made straight away."""
+        if staff is None or isinstance(staff, type):
+            self.requests += 1
+            return self.receptionist.make_appointment(
+                a_type, staff, patient, self.schedule, a_date, a_time)
+        return await self._submit(staff, ('make', a_type, staff, patient,
+                                          a_date, a_time))
+
+    async def cancel_appointment(self, a_type, staff, patient, a_date=None,
+                                 a_time=None):
+        """Works as Receptionist.cancel_appointment."""
+        return await self._submit(staff, ('cancel', a_type, staff, patient,
+                                          a_date, a_time))
+
+    async def find_next_available(self, a_type, staff, patient,
+                                  starting_date, starting_time=None):
+        """Works as AppointmentSchedule.find_next_available."""
+        return await self._submit(staff, ('find', a_type, staff, patient,
+                                          starting_date, starting_time))
+
+    async def drain(self):
+        """Waits until every request submitted so far has been handled."""
+        while self._pending:
+            if self._flushed is None:
+                self._flushed = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._flushed)
+
+    def _submit(self, staff, operation):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._pending.get(staff.emp_num)
+        if queue is None:
+            queue = self._pending[staff.emp_num] = []
+            loop.call_later(self.window, self._flush, staff.emp_num)
+        queue.append((operation, future))
+        self.requests += 1
+        return future
+
+    def _flush(self, emp_num):
+        queue = self._pending.pop(emp_num)
+        self.batches += 1
+        run = []
+        for operation, future in queue:
+            if operation[0] == 'make':
+                run.append((operation, future))
+                continue
+            self._make(run)
+            run = []
+            kind, a_type, staff, patient, a_date, a_time = operation
+            try:
+                if kind == 'cancel':
+                    result = self.receptionist.cancel_appointment(
+                        a_type, staff, patient, self.schedule, a_date, a_time)
+                else:
+                    result = self.schedule.find_next_available(
+                        a_type, staff, patient, a_date, a_time)
+            except Exception as error:
+                _set_exception(future, error)
+            else:
+                _set_result(future, result)
+        self._make(run)
+        if not self._pending and self._flushed is not None:
+            self._flushed.set_result(None)
+            self._flushed = None
+
+    def _make(self, run):
+        """Books a run of consecutive make requests in one bulk call."""
+        requests = []
+        futures = []
+        for (_, a_type, staff, patient, a_date, a_time), future in run:
+            try:
+                requests.append(Appointment(a_type, staff, patient, a_date,
+                                            a_time))
+            except ValueError as error:
+                _set_exception(future, error)
+            else:
+                futures.append(future)
+        if not requests:
+            return
+        try:
+            results = self.receptionist.make_appointments_bulk(requests,
+                                                               self.schedule)
+        except Exception:
+            # a failed bulk call books nothing, so the requests are made one
+            # by one and only the bad ones fail.
+            for request, future in zip(requests, futures):
+                try:
+                    result = self.receptionist.make_appointment(
+                        request.a_type, request.staff, request.patient,
+                        self.schedule, request.a_date, request.a_time)
+                except Exception as error:
+                    _set_exception(future, error)
+                else:
+                    _set_result(future, result)
+        else:
+            for future, result in zip(futures, results):
+                _set_result(future, result)
+
+
+def _set_result(future, result):
+    # the waiting coroutine may have been cancelled in the meantime.
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future, error):
+    if not future.done():
+        future.set_exception(error)
@@ -0,0 +1,420 @@
+import heapq
+import multiprocessing
+import os
+import threading
+import zlib
+
+from Classes import Appointment, AppointmentSchedule, \
+    HealthcareProfessional, Patient, Preemption, _STAFF_CODES, \
+    _STAFF_KINDS, _SlotGrid
+
+
+class ShardedSchedule:
+    """
+    Schedule split across worker processes by healthcare professional. Each
+    shard owns the AppointmentSchedule of the professionals whose emp_num
+    hashes to it, so bookings to different shards run on different cores.
+    It can be passed to Receptionist like AppointmentSchedule: booking and
+    canceling are sent to the owning shard, and clinic-wide queries are sent
+    to all the shards at once and their answers merged. Bulk booking sends
+    every shard its part of the requests before waiting for any of them.
+    Staff and patients are sent to a shard once and then referred to by
+    small ids; appointments coming back are made of the caller's objects.
+    options (e.g. slot_minutes) are passed to the shards'
+    AppointmentSchedule.
+    """
+
+    def __init__(self, shards=None, **options):
+        self.shards = shards or os.cpu_count() or 1
+        self._slots = _SlotGrid(options.get('slot_minutes'),
+                                options.get('day_start', '09:00'),
+                                options.get('day_end', '17:00'))
+        self._staff_ids = {}
+        self._patient_ids = {}
+        self._staff = []
+        self._patients = []
+        # how many staff and patients (by id) each shard has been sent.
+        self._sent = [[0, 0] for _ in range(self.shards)]
+        self._locks = [threading.RLock() for _ in range(self.shards)]
+        self._ids_lock = threading.Lock()
+        self._connections = []
+        self._processes = []
+        for _ in range(self.shards):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve,
+                                              args=(worker_connection,
+                                                    options),
+                                              daemon=True)
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def __str__(self):
+        return f"Schedule for the clinic in {self.shards} shards"
+
+    def __repr__(self):
+        return f"ShardedSchedule({self.shards})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Stops the worker processes."""
+        for shard, connection in enumerate(self._connections):
+            if not connection.closed:
+                with self._locks[shard]:
+                    connection.send(((), [('stop',)]))
+                    connection.close()
+        for process in self._processes:
+            process.join()
+
+    @property
+    def appointments(self):
+        """All appointments in the clinic sorted by date, gathered from the
+        shards."""
+        answers = self._scatter({shard: [('appointments',)]
+                                 for shard in range(self.shards)})
+        return list(heapq.merge(*(self._appointments(i) for i in answers),
+                                key=lambda appointment: appointment.a_ordinal))
+
+    def __contains__(self, appointment):
+        return self._call(appointment.staff,
+                          ('contains', self._message(appointment)))
+
+    def book(self, a_type, staff, patient, a_date, a_time=None):
+        """Works as AppointmentSchedule.book, in the professional's shard.
+        To book any professional (staff is None or a kind), the earliest
+        slot is found across the shards first."""
+        if staff is None or isinstance(staff, type):
+            found = self.find_earliest_available(
+                a_type, staff or HealthcareProfessional, patient, a_date,
+                a_time)
+            if found is None:
+                return None
+            if a_type == 'consultation' and (
+                    found.a_date != a_date or
+                    a_time not in (None, found.a_time)):
+                return found
+            return self.book(a_type, found.staff, patient, found.a_date,
+                             found.a_time)
+        return self._appointment(self._call(
+            staff, ('book', a_type, self._staff_id(staff),
+                    self._patient_id(patient), a_date, a_time)))
+
+    def book_many(self, requests, today):
+        """Works as AppointmentSchedule.book_many. The shards book their
+        requests in parallel."""
+        requests = list(requests)
+        # checked here, as the shards cannot undo each other's bookings.
+        self._slots.check(requests)
+        positions = {}
+        operations = {}
+        for position, request in enumerate(requests):
+            shard = self._shard(request.staff)
+            positions.setdefault(shard, []).append(position)
+            operations.setdefault(shard, []).append((
+                request.a_type, self._staff_id(request.staff),
+                self._patient_id(request.patient), request.a_date,
+                request.a_time))
+        answers = self._scatter({shard: [('book_many', shard_requests, today)]
+                                 for shard, shard_requests in
+                                 operations.items()})
+        output = [None] * len(requests)
+        for shard, answer in zip(operations, answers):
+            for position, message in zip(positions[shard], answer):
+                output[position] = self._appointment(message)
+        return output
+
+    def preempt(self, staff, patient, a_date, a_time=None):
+        """Works as AppointmentSchedule.preempt, in the professional's
+        shard. The Preemption records keep the time they were made at in
+        the shard."""
+        answer, moves = self._call(staff, ('preempt', self._staff_id(staff),
+                                           self._patient_id(patient), a_date,
+                                           a_time))
+        emergency = self._appointment(answer)
+        preemptions = []
+        for bumped, moved, at in moves:
+            preemption = Preemption(emergency, self._appointment(bumped),
+                                    self._appointment(moved))
+            preemption.at = at
+            preemptions.append(preemption)
+        return emergency, preemptions
+
+    def add_appointment(self, appointment):
+        self._call(appointment.staff, ('add', self._message(appointment)))
+        return appointment
+
+    def cancel_appointment(self, appointment):
+        return self._appointment(self._call(
+            appointment.staff, ('cancel', self._message(appointment))))
+
+    def is_available(self, staff, a_date, a_time=None):
+        return self._call(staff, ('available', self._staff_id(staff),
+                                  a_date, a_time))
+
+    def find_next_available(self, a_type, staff, patient, starting_date,
+                            starting_time=None):
+        return self._appointment(self._call(
+            staff, ('find', a_type, self._staff_id(staff),
+                    self._patient_id(patient), starting_date,
+                    starting_time)))
+
+    def find_earliest_available(self, a_type, kind, patient, starting_date,
+                                starting_time=None):
+        """Works as AppointmentSchedule.find_earliest_available. Every shard
+        finds its earliest professional of the kind and the earliest of
+        their answers is returned."""
+        patient_id = self._patient_id(patient)
+        answers = self._scatter({shard: [('earliest', a_type,
+                                          _STAFF_CODES[kind], patient_id,
+                                          starting_date, starting_time)]
+                                 for shard in range(self.shards)})
+        found = [self._appointment(i) for i in answers if i is not None]
+        if not found:
+            return None
+        return min(found, key=lambda appointment: (appointment.a_ordinal,
+                                                   appointment.a_minute or 0))
+
+    def add_staff(self, staff):
+        for i in staff:
+            self._call(i, ('add_staff', self._staff_id(i)))
+
+    def staff_appointments(self, staff):
+        return self._appointments(self._call(
+            staff, ('staff_appointments', self._staff_id(staff))))
+
+    def appointments_between(self, staff, start_date, end_date):
+        return iter(self._appointments(self._call(
+            staff, ('between', self._staff_id(staff), start_date,
+                    end_date))))
+
+    def appointments_on(self, a_date):
+        answers = self._scatter({shard: [('on', a_date)]
+                                 for shard in range(self.shards)})
+        return (self._appointment(i) for answer in answers for i in answer)
+
+    def upcoming_appointments(self, patient, from_date=None):
+        patient_id = self._patient_id(patient)
+        answers = self._scatter({shard: [('upcoming', patient_id, from_date)]
+                                 for shard in range(self.shards)})
+        return heapq.merge(*(self._appointments(i) for i in answers),
+                           key=lambda appointment: appointment.a_ordinal)
+
+    def sort(self):
+        """The shards keep their appointments sorted, so there is nothing to
+        do."""
+
+    def staff_lock(self, staff):
+        """Returns the lock of the professional's shard. Every request to the
+        shard takes it, so holding it makes several requests atomic."""
+        return self._locks[self._shard(staff)]
+
+    def _shard(self, staff):
+        return zlib.crc32(staff.emp_num.encode()) % self.shards
+
+    def _staff_id(self, staff):
+        staff_id = self._staff_ids.get(id(staff))
+        if staff_id is None:
+            with self._ids_lock:
+                staff_id = self._staff_ids.setdefault(id(staff),
+                                                      len(self._staff))
+                if staff_id == len(self._staff):
+                    self._staff.append(staff)
+        return staff_id
+
+    def _patient_id(self, patient):
+        patient_id = self._patient_ids.get(id(patient))
+        if patient_id is None:
+            with self._ids_lock:
+                patient_id = self._patient_ids.setdefault(
+                    id(patient), len(self._patients))
+                if patient_id == len(self._patients):
+                    self._patients.append(patient)
+        return patient_id
+
+    def _message(self, appointment):
+        return (appointment.a_type, self._staff_id(appointment.staff),
+                self._patient_id(appointment.patient), appointment.a_ordinal,
+                appointment.a_time)
+
+    def _appointment(self, message):
+        if message is None:
+            return None
+        a_type, staff_id, patient_id, day, a_time = message
+        return Appointment.from_ordinal(a_type, self._staff[staff_id],
+                                        self._patients[patient_id], day,
+                                        a_time)
+
+    def _appointments(self, messages):
+        return [self._appointment(i) for i in messages]
+
+    def _definitions(self, shard):
+        """Returns the staff and patients the shard has not been sent yet."""
+        sent = self._sent[shard]
+        staff_count = len(self._staff)
+        patient_count = len(self._patients)
+        definitions = []
+        for staff_id in range(sent[0], staff_count):
+            staff = self._staff[staff_id]
+            definitions.append(('staff', staff_id, _STAFF_CODES[type(staff)],
+                                staff.name, staff.emp_num))
+        for patient_id in range(sent[1], patient_count):
+            patient = self._patients[patient_id]
+            definitions.append(('patient', patient_id, patient.name,
+                                patient.address, patient.phone))
+        sent[:] = staff_count, patient_count
+        return definitions
+
+    def _call(self, staff, operation):
+        shard = self._shard(staff)
+        with self._locks[shard]:
+            self._connections[shard].send((self._definitions(shard),
+                                           [operation]))
+            return _answer(self._connections[shard].recv())[0]
+
+    def _scatter(self, operations):
+        """Sends operations to several shards, then waits for all of them.
+        Returns the first answer of each shard, in the order of
+        operations."""
+        shards = sorted(operations)
+        for shard in shards:
+            self._locks[shard].acquire()
+        try:
+            for shard in shards:
+                self._connections[shard].send((self._definitions(shard),
+                                               operations[shard]))
+            # every reply is read before an error is raised, or the replies
+            # left in the pipes would be taken as answers to later calls.
+            replies = {shard: self._connections[shard].recv()
+                       for shard in shards}
+            answers = {shard: _answer(replies[shard])[0] for shard in shards}
+        finally:
+            for shard in shards:
+                self._locks[shard].release()
+        return [answers[shard] for shard in operations]
+
+
+def _answer(reply):
+    error, answers = reply
+    if error is not None:
+        raise error
+    return answers
+
+
+def _serve(connection, options):
+    """Runs in a worker process: owns one shard's AppointmentSchedule and
+    answers the requests sent through connection."""
+    schedule = AppointmentSchedule(**options)
+    staff = {}
+    patients = {}
+    # id() of a staff or patient object -> its id in the calling process.
+    staff_ids = {}
+    patient_ids = {}
+
+    def appointment(message):
+        a_type, staff_id, patient_id, day, a_time = message
+        return Appointment.from_ordinal(a_type, staff[staff_id],
+                                        patients[patient_id], day, a_time)
+
+    def message(appointment):
+        if appointment is None:
+            return None
+        return (appointment.a_type, staff_ids[id(appointment.staff)],
+                patient_ids[id(appointment.patient)], appointment.a_ordinal,
+                appointment.a_time)
+
+    def request(a_type, staff_id, patient_id, a_date, a_time):
+        return Appointment(a_type, staff[staff_id], patients[patient_id],
+                           a_date, a_time)
+
+    while True:
+        definitions, operations = connection.recv()
+        for definition in definitions:
+            if definition[0] == 'staff':
+                _, staff_id, kind, name, emp_num = definition
+                staff[staff_id] = _STAFF_KINDS[kind](name, emp_num)
+                staff_ids[id(staff[staff_id])] = staff_id
+            else:
+                _, patient_id, name, address, phone = definition
+                patients[patient_id] = Patient(name, address, phone)
+                patient_ids[id(patients[patient_id])] = patient_id
+        answers = []
+        try:
+            for operation in operations:
+                kind = operation[0]
+                if kind == 'stop':
+                    return
+                elif kind == 'book':
+                    _, a_type, staff_id, patient_id, a_date, a_time = \
+                        operation
+                    answers.append(message(schedule.book(
+                        a_type, staff[staff_id], patients[patient_id],
+                        a_date, a_time)))
+                elif kind == 'book_many':
+                    _, requests, today = operation
+                    answers.append([message(i) for i in schedule.book_many(
+                        [request(*i) for i in requests], today)])
+                elif kind == 'preempt':
+                    _, staff_id, patient_id, a_date, a_time = operation
+                    emergency, moves = schedule.preempt(
+                        staff[staff_id], patients[patient_id], a_date, a_time)
+                    answers.append((message(emergency),
+                                    [(message(i.bumped), message(i.moved),
+                                      i.at) for i in moves]))
+                elif kind == 'add':
+                    schedule.add_appointment(appointment(operation[1]))
+                    answers.append(None)
+                elif kind == 'cancel':
+                    answers.append(message(schedule.cancel_appointment(
+                        appointment(operation[1]))))
+                elif kind == 'contains':
+                    answers.append(appointment(operation[1]) in schedule)
+                elif kind == 'available':
+                    _, staff_id, a_date, a_time = operation
+                    answers.append(schedule.is_available(staff[staff_id],
+                                                         a_date, a_time))
+                elif kind == 'find':
+                    _, a_type, staff_id, patient_id, a_date, a_time = \
+                        operation
+                    answers.append(message(schedule.find_next_available(
+                        a_type, staff[staff_id], patients[patient_id],
+                        a_date, a_time)))
+                elif kind == 'earliest':
+                    _, a_type, staff_kind, patient_id, a_date, a_time = \
+                        operation
+                    answers.append(message(schedule.find_earliest_available(
+                        a_type, _STAFF_KINDS[staff_kind],
+                        patients[patient_id], a_date, a_time)))
+                elif kind == 'add_staff':
+                    schedule.add_staff([staff[operation[1]]])
+                    answers.append(None)
+                elif kind == 'staff_appointments':
+                    answers.append([message(i) for i in
+                                    schedule.staff_appointments(
+                                        staff[operation[1]])])
+                elif kind == 'between':
+                    _, staff_id, start_date, end_date = operation
+                    answers.append([message(i) for i in
+                                    schedule.appointments_between(
+                                        staff[staff_id], start_date,
+                                        end_date)])
+                elif kind == 'on':
+                    answers.append([message(i) for i in
+                                    schedule.appointments_on(operation[1])])
+                elif kind == 'upcoming':
+                    _, patient_id, from_date = operation
+                    answers.append([message(i) for i in
+                                    schedule.upcoming_appointments(
+                                        patients[patient_id], from_date)])
+                elif kind == 'appointments':
+                    answers.append([message(i) for i in
+                                    schedule.appointments])
+        except Exception as error:
+            connection.send((error, None))
+        else:
+            connection.send((None, answers))
@@ -1,8 +1,25 @@
 import unittest
+import asyncio
 import datetime
+import os
+import tempfile
 from datetime import timedelta
-from Classes import Appointment, AppointmentSchedule, Prescription, \
+from Classes import Appointment, AppointmentSchedule, Doctor, Nurse, \
+    Patient, PatientRegistry, Prescription, PrescriptionRegistry, Waitlist, \
     check_availability
+from Database import SqliteSchedule
+from ImportExport import dump_file, export_rows, import_rows, load_file
+from Journal import DurableSchedule
+import Classes
+import Instrumentation
+try:
+    import Analytics
+except ImportError:
+    Analytics = None
+from Benchmarks import appointment_memory, compare_results, \
+    differential_fuzz, generate_clinic, run_suite, stress_concurrent_booking
+from Service import BookingService
+from Sharding import ShardedSchedule
 import Unittests_data as Ud
 
 
@@ -76,6 +93,33 @@ class AppointmentTests(unittest.TestCase):
             Ud.recep1.make_appointment('normal', Ud.nurse1, Ud.pat7, schedule,
                                        "2022-06-02")
 
+    def test_make_appointments_bulk(self):
+        """
+        The test checks if bulk booking gives the same appointments, in the
+        same order, as making the appointments one by one, and if the
+        schedules end up the same.
+        """
+        requests = [
+            Ud.pat7.request_appointment('consultation', Ud.doctor1,
+                                        "2022-06-15"),
+            Ud.pat8.request_appointment('emergency', Ud.doctor1, "2022-06-15"),
+            Ud.pat9.request_appointment('consultation', Ud.doctor2,
+                                        "2022-06-20"),
+            Ud.pat9.request_appointment('emergency', Ud.doctor2, "2022-06-20"),
+            Ud.pat7.request_appointment('consultation', Ud.nurse1,
+                                        "2022-06-01"),
+            Ud.pat8.request_appointment('emergency', Ud.doctor1, "2022-06-13"),
+        ]
+        one_by_one = build_schedule()
+        expected = [Ud.recep1.make_appointment(i.a_type, i.staff, i.patient,
+                                               one_by_one, i.a_date)
+                    for i in requests]
+        bulk = build_schedule()
+        output = Ud.recep1.make_appointments_bulk(requests, bulk)
+        self.assertEqual(output, expected)
+        self.assertEqual(list(bulk.appointments),
+                         list(one_by_one.appointments))
+
     def test_cancel_appointment(self):
         """The test checks if an appointment is removed form the schedule.
         The number of objects in the list of appointments (schedule.appointment)
@@ -100,6 +144,18 @@ class AppointmentTests(unittest.TestCase):
         expected_cancel = None
         self.assertEqual(cancel_test, expected_cancel)
 
+    def test_appointment_ordinal(self):
+        """The test checks if an appointment keeps its date as given and as an
+        ordinal day, and if both change together."""
+        appointment = Appointment('consultation', Ud.doctor1, Ud.pat7,
+                                  "2022-06-17")
+        self.assertEqual(appointment.a_date, "2022-06-17")
+        self.assertEqual(appointment.a_ordinal,
+                         datetime.date(2022, 6, 17).toordinal())
+        appointment.a_date = "2022-06-18"
+        self.assertEqual(appointment.a_ordinal,
+                         datetime.date(2022, 6, 18).toordinal())
+
 
 class PrescriptionTest(unittest.TestCase):
 
@@ -130,6 +186,79 @@ class PrescriptionTest(unittest.TestCase):
         return rq1
 
 
+class PrescriptionRegistryTest(unittest.TestCase):
+
+    def test_indexes(self):
+        """The test checks if prescriptions are found by patient, doctor and
+        type, and if removed prescriptions are not."""
+        registry = PrescriptionRegistry()
+        normal = Ud.doctor1.issue_prescription('normal', Ud.pat1, 10, 2.0,
+                                               registry)
+        repeat = Ud.pat1.request_repeat(Ud.doctor2, registry)
+        other = Ud.pat2.request_repeat(Ud.doctor1, registry)
+        self.assertEqual(len(registry), 3)
+        self.assertEqual(registry.for_patient(Ud.pat1), [normal, repeat])
+        self.assertEqual(registry.for_doctor(Ud.doctor1), [normal, other])
+        self.assertEqual(registry.of_type('repeat'), [repeat, other])
+        self.assertIs(registry.remove(other), other)
+        self.assertIsNone(registry.remove(other))
+        self.assertEqual(registry.for_doctor(Ud.doctor1), [normal])
+        self.assertEqual(registry.pending_repeats(), [repeat])
+
+    def test_accept_requests(self):
+        """The test checks if pending repeats accepted in one call get their
+        quantity and dosage and move to the accepting doctor."""
+        registry = PrescriptionRegistry()
+        requests = [Ud.pat1.request_repeat(Ud.doctor1, registry),
+                    Ud.pat2.request_repeat(Ud.doctor1, registry),
+                    Ud.pat3.request_repeat(Ud.doctor2, registry)]
+        self.assertEqual(registry.pending_repeats(Ud.doctor1), requests[:2])
+        accepted = Ud.doctor2.accept_requests(
+            [(i, 30, 1.5) for i in registry.pending_repeats(Ud.doctor1)],
+            registry)
+        self.assertEqual(accepted, requests[:2])
+        self.assertEqual(accepted[0], Prescription('repeat', Ud.pat1,
+                                                   Ud.doctor2, 30, 1.5))
+        self.assertEqual(registry.pending_repeats(Ud.doctor1), [])
+        self.assertEqual(registry.pending_repeats(), [requests[2]])
+        self.assertEqual(registry.for_doctor(Ud.doctor2),
+                         [requests[2]] + requests[:2])
+
+
+class PatientRegistryTest(unittest.TestCase):
+
+    def test_intern(self):
+        """The test checks if the same person is registered once, with a
+        stable id, and if appointments of interned patients are equal."""
+        registry = PatientRegistry()
+        first = registry.register('Josh  Stevens',
+                                  '12 Brown Street X17 9XY London',
+                                  '07246 123985')
+        copy = Patient('josh stevens', '12 Brown Street X17 9XY London',
+                       '07246123985')
+        self.assertIs(registry.intern(copy), first)
+        self.assertIsNone(copy.patient_id)
+        self.assertIs(registry[first.patient_id], first)
+        self.assertIn(first, registry)
+        self.assertNotIn(copy, registry)
+        self.assertEqual(
+            Appointment('consultation', Ud.doctor1, registry.intern(copy),
+                        "2022-06-14"),
+            Appointment('consultation', Ud.doctor1, first, "2022-06-14"))
+
+    def test_lookup(self):
+        """The test checks if patients are found by phone and by name."""
+        registry = PatientRegistry()
+        patients = [registry.intern(Patient(i.name, i.address, i.phone))
+                    for i in (Ud.pat1, Ud.pat3, Ud.pat4)]
+        self.assertEqual([i.patient_id for i in patients], [0, 1, 2])
+        self.assertEqual(registry.find_by_phone('07254 692138'),
+                         patients[1:])
+        self.assertEqual(registry.find_by_name(' MIA osborne'),
+                         [patients[2]])
+        self.assertEqual(registry.find_by_name('Nobody'), [])
+
+
 class ScheduleAppointmentTest(unittest.TestCase):
 
     def test_add_appointment(self):
@@ -209,6 +338,26 @@ class ScheduleAppointmentTest(unittest.TestCase):
                                               Ud.pat7, "2022-06-17")
         self.assertEqual(next_available, expected_next_available)
 
+    def test_find_next_available_after_cancel(self):
+        """
+        The test checks if the next available slot follows the bookings: a
+        day freed in the middle of a fully booked month is found, and after
+        it is booked again the search moves to the end of the month.
+        """
+        schedule = AppointmentSchedule()
+        june = [Appointment('consultation', Ud.nurse1, Ud.pat7,
+                            f"2022-06-{day:02d}") for day in range(1, 31)]
+        for appointment in june:
+            schedule.add_appointment(appointment)
+        schedule.cancel_appointment(june[9])
+        next_available = schedule.find_next_available(
+            'emergency', Ud.nurse1, Ud.pat8, "2022-06-02")
+        self.assertEqual(next_available.a_date, "2022-06-10")
+        schedule.add_appointment(next_available)
+        next_available = schedule.find_next_available(
+            'emergency', Ud.nurse1, Ud.pat9, "2022-06-02")
+        self.assertEqual(next_available.a_date, "2022-07-01")
+
     def test_sort(self):
         """It tests if sorting method works correctly."""
         schedule = build_schedule()
@@ -222,6 +371,153 @@ class ScheduleAppointmentTest(unittest.TestCase):
                               "2022-06-17", "2022-06-18", "2022-06-19"]
         self.assertEqual(date_list, expected_date_list)
 
+    def test_add_appointment_keeps_order(self):
+        """The test checks if appointments added in random order are stored
+        sorted by date, and that an appointment on an already used day is
+        placed after the appointments on that day."""
+        schedule = AppointmentSchedule()
+        for a_date in ["2022-07-03", "2022-07-01", "2022-07-02"]:
+            schedule.add_appointment(Appointment('consultation', Ud.doctor1,
+                                                 Ud.pat7, a_date))
+        same_day = schedule.add_appointment(Appointment(
+            'consultation', Ud.doctor2, Ud.pat8, "2022-07-02"))
+        dates = [i.a_date for i in schedule.appointments]
+        self.assertEqual(dates, ["2022-07-01", "2022-07-02", "2022-07-02",
+                                 "2022-07-03"])
+        self.assertIs(schedule.appointments[2], same_day)
+
+    def test_cancel_appointment_index(self):
+        """
+        The test checks if an appointment equal to a stored one is found in
+        the schedule, and if after cancellation it is no longer there while
+        the rest of the schedule stays sorted.
+        """
+        schedule = build_schedule()
+        appointment = Appointment('consultation', Ud.doctor2, Ud.pat5,
+                                  "2022-06-18")
+        self.assertIn(appointment, schedule.appointments)
+        self.assertEqual(hash(appointment), hash(schedule.appointments[4]))
+        self.assertIsNotNone(schedule.cancel_appointment(appointment))
+        self.assertNotIn(appointment, schedule.appointments)
+        self.assertIsNone(schedule.cancel_appointment(appointment))
+        dates = [i.a_date for i in schedule.appointments]
+        self.assertEqual(dates, sorted(dates))
+        self.assertEqual(len(dates), 5)
+
+    def test_add_columns(self):
+        """
+        The test checks if appointments given as columns, not sorted by
+        date, build the same schedule as adding them one by one, if they are
+        found and canceled through the index built on first use, and if
+        columns added to a schedule that is not empty are merged into it.
+        """
+        expected = build_schedule()
+        given = list(reversed(expected.appointments))
+        staff = [Ud.doctor1, Ud.doctor2]
+        patients = sorted({i.patient for i in given}, key=id)
+        schedule = AppointmentSchedule()
+        schedule.add_columns(
+            staff, patients, [i._type for i in given],
+            [staff.index(i.staff) for i in given],
+            [patients.index(i.patient) for i in given],
+            [i.a_ordinal for i in given], [-1] * len(given))
+        self.assertEqual([i.key() for i in schedule.appointments],
+                         [i.key() for i in expected.appointments])
+        self.assertEqual(schedule.staff_appointments(Ud.doctor2),
+                         expected.staff_appointments(Ud.doctor2))
+        self.assertFalse(schedule.is_available(Ud.doctor2, "2022-06-18"))
+        appointment = Appointment('consultation', Ud.doctor2, Ud.pat5,
+                                  "2022-06-18")
+        self.assertIn(appointment, schedule.appointments)
+        self.assertIsNotNone(schedule.cancel_appointment(appointment))
+        self.assertNotIn(appointment, schedule)
+        self.assertTrue(schedule.is_available(Ud.doctor2, "2022-06-18"))
+        day = datetime.date(2022, 6, 16).toordinal()
+        schedule.add_columns([Ud.doctor1], [Ud.pat7], [0], [0], [0], [day],
+                             [-1])
+        self.assertEqual([i.a_date for i in schedule.upcoming_appointments(
+            Ud.pat7, "2022-06-01")], ["2022-06-16"])
+        self.assertEqual(len(schedule.appointments), 6)
+        self.assertEqual([i.a_date for i in schedule.appointments],
+                         sorted(i.a_date for i in schedule.appointments))
+        with self.assertRaises(ValueError):
+            schedule.add_columns([Ud.doctor1], [Ud.pat7], [2], [0], [0],
+                                 [day], [-1])
+
+    def test_appointments_view(self):
+        """The test checks if schedule.appointments is a read-only view that
+        behaves like a sorted list."""
+        schedule = build_schedule()
+        view = schedule.appointments
+        self.assertEqual(len(view), 6)
+        self.assertEqual(view[0].a_date, "2022-06-14")
+        self.assertIn(Appointment('consultation', Ud.doctor2, Ud.pat4,
+                                  "2022-06-17"), view)
+        with self.assertRaises(TypeError):
+            view[0] = None
+
+    def test_staff_appointments(self):
+        """The test checks if the schedule returns only the appointments to
+        the given healthcare professional, sorted by date."""
+        schedule = build_schedule()
+        dates = [i.a_date for i in schedule.staff_appointments(Ud.doctor2)]
+        self.assertEqual(dates, ["2022-06-17", "2022-06-18", "2022-06-19"])
+        self.assertEqual(schedule.staff_appointments(Ud.nurse1), [])
+
+    def test_range_queries(self):
+        """The test checks if the schedule returns a professional's
+        appointments between two dates, the appointments on a day and a
+        patient's upcoming appointments, also after a cancellation."""
+        schedule = build_schedule()
+        Ud.recep1.make_appointment('consultation', Ud.doctor2, Ud.pat1,
+                                   schedule, "2022-06-20")
+        between = schedule.appointments_between(Ud.doctor2, "2022-06-18",
+                                                "2022-06-19")
+        self.assertNotIsInstance(between, list)
+        self.assertEqual([i.a_date for i in between],
+                         ["2022-06-18", "2022-06-19"])
+        self.assertEqual(list(schedule.appointments_between(
+            Ud.nurse1, "2022-06-01", "2022-06-30")), [])
+        self.assertEqual([i.patient for i in
+                          schedule.appointments_on("2022-06-17")], [Ud.pat4])
+        self.assertEqual(list(schedule.appointments_on("2022-06-30")), [])
+        self.assertEqual([i.a_date for i in schedule.upcoming_appointments(
+            Ud.pat1, "2022-06-01")], ["2022-06-14", "2022-06-20"])
+        self.assertEqual([i.a_date for i in schedule.upcoming_appointments(
+            Ud.pat1, "2022-06-15")], ["2022-06-20"])
+        schedule.cancel_appointment(Ud.p1_ar)
+        self.assertEqual([i.a_date for i in schedule.upcoming_appointments(
+            Ud.pat1, "2022-06-01")], ["2022-06-20"])
+        self.assertEqual(list(schedule.upcoming_appointments(Ud.pat7)), [])
+
+    def test_next_available_memo(self):
+        """The test checks if repeated searches are answered from the memo
+        and if a booking or a cancellation only invalidates the results of
+        the professional it is for."""
+        schedule = build_schedule()
+        for _ in range(2):
+            found = schedule.find_next_available('consultation', Ud.doctor1,
+                                                 Ud.pat7, "2022-06-14")
+            self.assertEqual(found.a_date, "2022-06-17")
+            schedule.find_next_available('consultation', Ud.doctor2,
+                                         Ud.pat7, "2022-06-14")
+        self.assertEqual(schedule.memo_info(),
+                         {'hits': 2, 'misses': 2, 'size': 2, 'maxsize': 1024})
+        schedule.add_appointment(Appointment('consultation', Ud.doctor1,
+                                             Ud.pat7, "2022-06-17"))
+        found = schedule.find_next_available('consultation', Ud.doctor1,
+                                             Ud.pat7, "2022-06-14")
+        self.assertEqual(found.a_date, "2022-06-18")
+        schedule.find_next_available('consultation', Ud.doctor2, Ud.pat7,
+                                     "2022-06-14")
+        self.assertEqual(schedule.memo_info()['hits'], 3)
+        schedule.cancel_appointment(Appointment(
+            'consultation', Ud.doctor1, Ud.pat2, "2022-06-15"))
+        found = schedule.find_next_available('consultation', Ud.doctor1,
+                                             Ud.pat7, "2022-06-14")
+        self.assertEqual(found.a_date, "2022-06-15")
+        self.assertEqual(schedule.memo_info()['misses'], 4)
+
 
 class CheckAvailabilityTest(unittest.TestCase):
 
@@ -237,6 +533,937 @@ class CheckAvailabilityTest(unittest.TestCase):
         self.assertEqual(output_True, True)
 
 
+class DurableScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def open_schedule(self, **kwargs):
+        return DurableSchedule(self.directory.name, staff=[Ud.doctor1,
+                                                           Ud.doctor2],
+                               patients=[Ud.pat1, Ud.pat2], **kwargs)
+
+    def test_recover_from_journal(self):
+        """The test checks if appointments made and canceled before a restart
+        are recovered form the journal, with the given staff and patient
+        objects."""
+        with self.open_schedule() as schedule:
+            build_into(schedule)
+            Ud.recep1.cancel_appointment('consultation', Ud.doctor1, Ud.pat2,
+                                         schedule, "2022-06-15")
+            expected = [i.key()[::3] for i in schedule.appointments]
+        with self.open_schedule() as schedule:
+            self.assertEqual([i.key()[::3] for i in schedule.appointments],
+                             expected)
+            self.assertIs(schedule.appointments[0].staff, Ud.doctor1)
+            self.assertIs(schedule.appointments[0].patient, Ud.pat1)
+            self.assertEqual(schedule.appointments[1].patient.name,
+                             Ud.pat3.name)
+
+    def test_recover_from_snapshot(self):
+        """The test checks if a schedule is recovered from a snapshot and the
+        journal written after it, and that old files are removed."""
+        with self.open_schedule(snapshot_every=4) as schedule:
+            build_into(schedule)
+            schedule.cancel_appointment(Appointment(
+                'consultation', Ud.doctor2, Ud.pat6, "2022-06-19"))
+            expected = [i.key()[::3] for i in schedule.appointments]
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                         ['journal-00000001.log', 'snapshot-00000001.bin'])
+        with self.open_schedule() as schedule:
+            self.assertEqual([i.key()[::3] for i in schedule.appointments],
+                             expected)
+            self.assertFalse(schedule.is_available(Ud.doctor2, "2022-06-18"))
+
+    def test_snapshot_after_recovery(self):
+        """The test checks if a schedule loaded from a snapshot can cancel
+        its appointments and be written to a new snapshot, including the
+        appointments that were not looked up since it was loaded."""
+        with self.open_schedule() as schedule:
+            build_into(schedule)
+            schedule.snapshot()
+        with self.open_schedule() as schedule:
+            canceled = schedule.cancel_appointment(Appointment(
+                'consultation', Ud.doctor1, Ud.pat2, "2022-06-15"))
+            self.assertIs(canceled.patient, Ud.pat2)
+            schedule.snapshot()
+            expected = [i.key()[::3] for i in schedule.appointments]
+        with self.open_schedule() as schedule:
+            self.assertEqual([i.key()[::3] for i in schedule.appointments],
+                             expected)
+            self.assertEqual(len(expected), 5)
+            self.assertIn(Ud.p1_ar, schedule)
+
+    def test_torn_record(self):
+        """The test checks if a record cut short by a crash is dropped and
+        the records before it are recovered."""
+        with self.open_schedule() as schedule:
+            build_into(schedule)
+        journal = os.path.join(self.directory.name, 'journal-00000000.log')
+        with open(journal, 'r+b') as file:
+            file.truncate(os.path.getsize(journal) - 3)
+        with self.open_schedule() as schedule:
+            self.assertEqual(len(schedule.appointments), 5)
+            schedule.add_appointment(Appointment('emergency', Ud.doctor1,
+                                                 Ud.pat1, "2022-07-01"))
+        with self.open_schedule() as schedule:
+            self.assertEqual(len(schedule.appointments), 6)
+
+
+class ConcurrentScheduleTest(unittest.TestCase):
+
+    def test_no_double_booking(self):
+        """The test checks if receptionists booking from several threads
+        never book the same professional twice on the same day."""
+        result = stress_concurrent_booking(threads=4, staff_count=4,
+                                           requests_per_thread=300, days=10)
+        self.assertEqual(result['double_bookings'], 0)
+
+    def test_staff_lock(self):
+        """The test checks if a concurrent schedule gives one re-entrant lock
+        per professional."""
+        schedule = AppointmentSchedule(concurrent=True)
+        lock = schedule.staff_lock(Ud.doctor1)
+        self.assertIs(schedule.staff_lock(Ud.doctor1), lock)
+        self.assertIsNot(schedule.staff_lock(Ud.doctor2), lock)
+        with lock:
+            Ud.recep1.make_appointment('consultation', Ud.doctor1, Ud.pat1,
+                                       schedule, "2022-06-14")
+        self.assertEqual(len(schedule.appointments), 1)
+
+
+class BookingServiceTest(unittest.TestCase):
+
+    def test_coalesced_requests(self):
+        """
+        The test checks if requests to one doctor sent at the same time are
+        handled in one batch, in the order they were sent, with the same
+        results as making them one by one.
+        """
+        schedule = build_schedule()
+        service = BookingService(schedule)
+
+        async def requests():
+            return await asyncio.gather(
+                service.make_appointment('consultation', Ud.doctor1, Ud.pat7,
+                                         "2022-06-14"),
+                service.make_appointment('emergency', Ud.doctor1, Ud.pat8,
+                                         "2022-06-14"),
+                service.cancel_appointment('consultation', Ud.doctor1,
+                                           Ud.pat2, "2022-06-15"),
+                service.find_next_available('consultation', Ud.doctor1,
+                                            Ud.pat9, "2022-06-14"))
+
+        output = asyncio.run(requests())
+        self.assertEqual(service.batches, 1)
+        self.assertEqual([i.a_date for i in output if i is not None],
+                         ["2022-06-17", "2022-06-17", "2022-06-15",
+                          "2022-06-15"])
+        self.assertEqual(len(schedule.appointments), 6)
+
+    def test_wrong_type(self):
+        """The test checks if a request with a wrong type fails on its own
+        while the rest of the batch is booked."""
+        schedule = AppointmentSchedule()
+        service = BookingService(schedule)
+
+        async def requests():
+            return await asyncio.gather(
+                service.make_appointment('normal', Ud.doctor1, Ud.pat7,
+                                         "2022-06-14"),
+                service.make_appointment('consultation', Ud.doctor1, Ud.pat8,
+                                         "2022-06-14"),
+                return_exceptions=True)
+
+        wrong, booked = asyncio.run(requests())
+        self.assertIsInstance(wrong, ValueError)
+        self.assertIn(booked, schedule.appointments)
+
+    def test_any_staff(self):
+        """The test checks if requests to any professional, or to any
+        doctor, are booked to the professional free first and leave no kind
+        of professional in the schedule's roster."""
+        schedule = AppointmentSchedule()
+        schedule.add_staff([Ud.nurse1])
+        schedule.add_appointment(Appointment('consultation', Ud.doctor1,
+                                             Ud.pat4, "2022-06-14"))
+        service = BookingService(schedule)
+
+        async def requests():
+            return await asyncio.gather(
+                service.make_appointment('consultation', None, Ud.pat1,
+                                         "2022-06-14"),
+                service.make_appointment('consultation', Doctor, Ud.pat2,
+                                         "2022-06-14"),
+                service.make_appointment('emergency', Doctor, Ud.pat3,
+                                         "2022-06-14"))
+
+        anyone, doctor, emergency = asyncio.run(requests())
+        self.assertEqual((anyone.staff, anyone.a_date),
+                         (Ud.nurse1, "2022-06-14"))
+        self.assertIn(anyone, schedule)
+        self.assertEqual((doctor.staff, doctor.a_date),
+                         (Ud.doctor1, "2022-06-15"))
+        self.assertEqual((emergency.staff, emergency.a_date),
+                         (Ud.doctor1, "2022-06-15"))
+        self.assertEqual(service.requests, 3)
+        self.assertEqual(set(schedule._roster),
+                         {Ud.doctor1.emp_num, Ud.nurse1.emp_num})
+
+
+class ShardedScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.schedule = ShardedSchedule(2)
+        self.addCleanup(self.schedule.close)
+        build_into(self.schedule)
+
+    def test_error_then_query(self):
+        """The test checks if a query that fails in every shard does not
+        leave replies behind for the next query."""
+        with self.assertRaises(ValueError):
+            list(self.schedule.appointments_on("2022-13-01"))
+        self.assertFalse(self.schedule.is_available(Ud.doctor1,
+                                                    "2022-06-14"))
+        self.assertEqual(len(self.schedule.appointments), 6)
+
+    def test_receptionist(self):
+        """The test checks if a receptionist makes and cancels appointments in
+        a sharded schedule as in AppointmentSchedule, and if the appointments
+        returned are made of the same objects."""
+        expected = build_schedule()
+        for schedule in (expected, self.schedule):
+            Ud.recep1.make_appointment('emergency', Ud.doctor2, Ud.pat7,
+                                       schedule, "2022-06-18")
+            Ud.recep1.cancel_appointment('consultation', Ud.doctor1, Ud.pat2,
+                                         schedule, "2022-06-15")
+        appointments = self.schedule.appointments
+        self.assertEqual(appointments, list(expected.appointments))
+        self.assertIs(appointments[0].patient, Ud.pat1)
+        self.assertNotIn(Ud.p2_ar, self.schedule)
+        self.assertIn(Ud.p3_ar, self.schedule)
+        self.assertEqual(list(self.schedule.appointments_on("2022-06-18")),
+                         list(expected.appointments_on("2022-06-18")))
+        self.assertEqual(list(self.schedule.upcoming_appointments(
+            Ud.pat7, "2022-06-01")), [Appointment(
+                'emergency', Ud.doctor2, Ud.pat7, "2022-06-20")])
+
+    def test_bulk(self):
+        """The test checks if bulk booking across shards returns the results
+        in the order of the requests."""
+        requests = [
+            Ud.pat7.request_appointment('emergency', Ud.doctor1, "2022-06-14"),
+            Ud.pat8.request_appointment('emergency', Ud.doctor2, "2022-06-17"),
+            Ud.pat9.request_appointment('consultation', Ud.nurse1,
+                                        "2022-06-14"),
+        ]
+        output = Ud.recep1.make_appointments_bulk(requests, self.schedule)
+        self.assertEqual([i.a_date for i in output],
+                         ["2022-06-17", "2022-06-20", "2022-06-14"])
+        self.assertEqual(len(self.schedule.appointments), 9)
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_generate_clinic(self):
+        """The test checks if a synthetic clinic has the requested size, no
+        double bookings and is the same for the same seed."""
+        clinic = generate_clinic(1000, staff_count=5, emergency_share=0.5)
+        again = generate_clinic(1000, staff_count=5, emergency_share=0.5)
+        self.assertEqual(len(clinic.appointments), 1000)
+        self.assertEqual(clinic.days, 250)
+        self.assertEqual(len({(i.staff.emp_num, i.a_ordinal)
+                              for i in clinic.appointments}), 1000)
+        self.assertEqual([(i.a_type, i.a_date) for i in clinic.appointments],
+                         [(i.a_type, i.a_date) for i in again.appointments])
+
+    def test_generate_clinic_density(self):
+        """The test checks if a synthetic clinic has the requested share of
+        staff-days booked, also for sizes that do not divide evenly."""
+        for appointments, staff_count, density in ((100, 2, 0.8),
+                                                   (1000, 2, 0.8),
+                                                   (30, 3, 0.5),
+                                                   (10, 1, 0.8)):
+            clinic = generate_clinic(appointments, staff_count=staff_count,
+                                     density=density)
+            self.assertAlmostEqual(
+                appointments / (staff_count * clinic.days), density,
+                delta=staff_count / appointments * density)
+
+    def test_appointment_memory(self):
+        """The test checks if an appointment has no __dict__ and takes less
+        than 100 bytes."""
+        self.assertFalse(hasattr(Appointment('consultation', Ud.doctor1,
+                                             Ud.pat1, "2022-06-14"),
+                                 '__dict__'))
+        result = appointment_memory(count=10000)
+        self.assertLess(result['bytes_per_appointment'], 100)
+
+    def test_differential_fuzz(self):
+        """The test checks if the fuzzer finds no divergence between the
+        linear-scan reference and AppointmentSchedule, with and without time
+        slots, and finds the call where a broken schedule goes wrong."""
+        for options in ({}, {'slot_minutes': 60}):
+            result = differential_fuzz(AppointmentSchedule, 500, **options)
+            self.assertEqual(result['calls'], 500)
+            self.assertIsNone(result['divergence'])
+            self.assertGreater(result['speedup'], 0)
+
+        class NoGapSearch(AppointmentSchedule):
+            def find_next_available(self, a_type, staff, patient,
+                                    starting_date, starting_time=None):
+                return Appointment(a_type, staff, patient, starting_date)
+
+        result = differential_fuzz(NoGapSearch, 500)
+        divergence = result['divergence']
+        self.assertEqual(result['calls'], divergence['call'])
+        self.assertIn(divergence['operation'][0], ('make', 'find'))
+        self.assertNotEqual(divergence['expected'], divergence['actual'])
+
+    def test_run_suite(self):
+        """The test checks if the suite writes its results as JSON that can
+        be compared with another run."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            results = run_suite(sizes=(100, 200), operations=20,
+                                output=output)
+            self.assertEqual([i['appointments'] for i in results['sizes']],
+                             [100, 200])
+            comparison = compare_results(output, output)
+        self.assertEqual(len(comparison), 8)
+        self.assertEqual({i['p50_ratio'] for i in comparison}, {1.0})
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def tearDown(self):
+        Instrumentation.disable()
+
+    def test_metrics(self):
+        """
+        The test checks if instrumented operations are counted, if the gap
+        search records how many runs of booked days it looked at and if the
+        metrics can be exported.
+        """
+        metrics = Instrumentation.enable()
+        schedule = build_schedule()
+        Ud.recep1.make_appointment('emergency', Ud.doctor1, Ud.pat7, schedule,
+                                   "2022-06-14")
+        snapshot = metrics.export(Instrumentation.MemoryExporter())
+        self.assertEqual(snapshot['make_appointment']['calls'], 7)
+        self.assertEqual(snapshot['check_availability']['calls'], 6)
+        self.assertEqual(snapshot['next_available_busy_schedule']['calls'], 1)
+        self.assertEqual(
+            snapshot['next_available_busy_schedule']['scanned'], 1)
+        self.assertEqual(sum(snapshot['sort']['latency']), 1)
+        text = metrics.export(Instrumentation.PrometheusExporter())
+        self.assertIn('schedule_calls_total{operation="make_appointment"} 7',
+                      text)
+        self.assertIn('schedule_latency_seconds_count'
+                      '{operation="sort"} 1', text)
+
+    def test_disable(self):
+        """The test checks if disabling puts the original functions back and
+        stops recording."""
+        original = Classes.AppointmentSchedule.__dict__['find_next_available']
+        metrics = Instrumentation.enable()
+        self.assertIsNot(
+            Classes.AppointmentSchedule.__dict__['find_next_available'],
+            original)
+        self.assertIs(Instrumentation.disable(), metrics)
+        self.assertIs(
+            Classes.AppointmentSchedule.__dict__['find_next_available'],
+            original)
+        build_schedule()
+        self.assertNotIn('make_appointment', metrics.snapshot())
+
+
+class TimeSlotTest(unittest.TestCase):
+
+    def test_make_appointment_slots(self):
+        """The test checks if consultations without a time get the first
+        free slot of the day and if a taken slot gives the next free one
+        without booking it."""
+        schedule = AppointmentSchedule(slot_minutes=10, day_start='09:00',
+                                       day_end='09:30')
+        first = Ud.recep1.make_appointment('consultation', Ud.doctor1, Ud.pat1,
+                                           schedule, "2022-06-14")
+        second = Ud.recep1.make_appointment('consultation', Ud.doctor1,
+                                            Ud.pat2, schedule, "2022-06-14")
+        self.assertEqual((first.a_time, second.a_time), ('09:00', '09:10'))
+        taken = Ud.recep1.make_appointment('consultation', Ud.doctor1, Ud.pat3,
+                                           schedule, "2022-06-14", '09:00')
+        self.assertEqual((taken.a_date, taken.a_time), ("2022-06-14", '09:20'))
+        self.assertEqual(len(schedule.appointments), 2)
+        self.assertIn(Appointment('consultation', Ud.doctor1, Ud.pat2,
+                                  "2022-06-14", '09:10'), schedule)
+
+    def test_add_appointments_batches(self):
+        """The test checks if a batch starting on the last booked day of a
+        professional fills that day's slots and books the days after it."""
+        schedule = AppointmentSchedule(slot_minutes=10, day_start='09:00',
+                                       day_end='09:20')
+        schedule.add_appointments([Appointment(
+            'consultation', Ud.doctor1, Ud.pat1, "2022-06-14", '09:00')])
+        schedule.add_appointments([
+            Appointment('consultation', Ud.doctor1, Ud.pat2, "2022-06-14",
+                        '09:10'),
+            Appointment('consultation', Ud.doctor1, Ud.pat3, "2022-06-15",
+                        '09:00'),
+            Appointment('consultation', Ud.doctor1, Ud.pat3, "2022-06-15",
+                        '09:10')])
+        self.assertFalse(schedule.is_available(Ud.doctor1, "2022-06-14"))
+        self.assertFalse(schedule.is_available(Ud.doctor1, "2022-06-15"))
+        found = schedule.find_next_available('consultation', Ud.doctor1,
+                                             Ud.pat4, "2022-06-14")
+        self.assertEqual((found.a_date, found.a_time), ("2022-06-16", '09:00'))
+        self.assertEqual([i.patient for i in schedule.staff_appointments(
+            Ud.doctor1)], [Ud.pat1, Ud.pat2, Ud.pat3, Ud.pat3])
+
+    def test_find_next_available_slots(self):
+        """The test checks if the search starts from the given time and
+        moves to the next day that is not fully booked."""
+        schedule = AppointmentSchedule(slot_minutes=10, day_start='09:00',
+                                       day_end='09:30')
+        for a_date in ("2022-06-14", "2022-06-15"):
+            for a_time in ('09:00', '09:10', '09:20'):
+                schedule.add_appointment(Appointment(
+                    'consultation', Ud.doctor1, Ud.pat1, a_date, a_time))
+        schedule.add_appointment(Appointment('consultation', Ud.doctor1,
+                                             Ud.pat1, "2022-06-16", '09:00'))
+        found = schedule.find_next_available('emergency', Ud.doctor1, Ud.pat2,
+                                             "2022-06-14", '09:05')
+        self.assertEqual((found.a_date, found.a_time), ("2022-06-16", '09:10'))
+        schedule.cancel_appointment(Appointment('consultation', Ud.doctor1,
+                                                Ud.pat1, "2022-06-15", '09:10'))
+        found = schedule.find_next_available('emergency', Ud.doctor1, Ud.pat2,
+                                             "2022-06-14", '09:25')
+        self.assertEqual((found.a_date, found.a_time), ("2022-06-15", '09:10'))
+        self.assertTrue(schedule.is_available(Ud.doctor1, "2022-06-16",
+                                              '09:20'))
+        self.assertFalse(schedule.is_available(Ud.doctor1, "2022-06-16",
+                                               '09:00'))
+        self.assertRaises(ValueError, schedule.is_available, Ud.doctor1,
+                          "2022-06-16", '09:05')
+
+    def test_bulk_slots(self):
+        """The test checks if bulk booking fills slots as one by one booking
+        would."""
+        requests = [Ud.pat1.request_appointment('consultation', Ud.doctor1,
+                                                "2022-06-14")
+                    for _ in range(4)]
+        schedule = AppointmentSchedule(slot_minutes=15, day_start='09:00',
+                                       day_end='09:45')
+        output = Ud.recep1.make_appointments_bulk(requests, schedule)
+        self.assertEqual([i.a_time for i in output],
+                         ['09:00', '09:15', '09:30', '09:00'])
+        self.assertEqual(output[3].a_date, "2022-06-15")
+        self.assertEqual(len(schedule.appointments), 3)
+
+    def test_wrong_time_first_booking(self):
+        """The test checks if a time off the slots is refused also for a
+        professional with no appointments yet, and leaves nothing behind."""
+        schedule = AppointmentSchedule(slot_minutes=60)
+        wrong = Appointment('consultation', Ud.doctor1, Ud.pat1, "2022-06-14",
+                            '10:30')
+        self.assertRaises(ValueError, schedule.is_available, Ud.doctor1,
+                          "2022-06-14", '10:30')
+        self.assertRaises(ValueError, schedule.add_appointment, wrong)
+        self.assertRaises(ValueError, schedule.add_appointments, [wrong])
+        self.assertEqual(schedule.appointments, [])
+        self.assertNotIn(wrong, schedule)
+
+    def test_bulk_wrong_time(self):
+        """The test checks if a bulk batch with a time off the slots books
+        nothing, also after a restart, and if through the booking service
+        only the wrong request fails."""
+        requests = [Ud.pat1.request_appointment('consultation', Ud.doctor1,
+                                                "2022-06-14", '09:00'),
+                    Ud.pat2.request_appointment('consultation', Ud.doctor1,
+                                                "2022-06-14", '09:05')]
+        with tempfile.TemporaryDirectory() as directory:
+            with DurableSchedule(directory, slot_minutes=30) as schedule:
+                self.assertRaises(ValueError,
+                                  Ud.recep1.make_appointments_bulk, requests,
+                                  schedule)
+                self.assertEqual(schedule.appointments, [])
+                self.assertTrue(schedule.is_available(Ud.doctor1,
+                                                      "2022-06-14", '09:00'))
+                self.assertNotIn(requests[0], schedule)
+            with DurableSchedule(directory, slot_minutes=30) as schedule:
+                self.assertEqual(schedule.appointments, [])
+        schedule = AppointmentSchedule(slot_minutes=30)
+        service = BookingService(schedule)
+
+        async def make():
+            return await asyncio.gather(
+                *(service.make_appointment(i.a_type, i.staff, i.patient,
+                                           i.a_date, i.a_time)
+                  for i in requests),
+                return_exceptions=True)
+
+        booked, wrong = asyncio.run(make())
+        self.assertEqual(service.batches, 1)
+        self.assertIsInstance(wrong, ValueError)
+        self.assertEqual(schedule.appointments, [booked])
+        self.assertEqual(booked.a_time, '09:00')
+
+
+class EarliestAvailableTest(unittest.TestCase):
+
+    def test_find_earliest_available(self):
+        """The test checks if the earliest free professional of a kind is
+        found, also after a cancellation frees an earlier day."""
+        schedule = build_schedule()
+        schedule.add_staff([Ud.nurse1])
+        found = schedule.find_earliest_available('emergency', Doctor, Ud.pat7,
+                                                 "2022-06-14")
+        self.assertEqual((found.staff, found.a_date),
+                         (Ud.doctor2, "2022-06-14"))
+        found = schedule.find_earliest_available('emergency', Doctor, Ud.pat7,
+                                                 "2022-06-17")
+        self.assertEqual((found.staff, found.a_date),
+                         (Ud.doctor1, "2022-06-17"))
+        for _ in range(2):
+            Ud.recep1.make_appointment('emergency', Ud.doctor1, Ud.pat7,
+                                       schedule, "2022-06-17")
+        schedule.cancel_appointment(Appointment('consultation', Ud.doctor2,
+                                                Ud.pat5, "2022-06-18"))
+        found = schedule.find_earliest_available('emergency', Doctor, Ud.pat7,
+                                                 "2022-06-17")
+        self.assertEqual((found.staff, found.a_date),
+                         (Ud.doctor2, "2022-06-18"))
+        found = schedule.find_earliest_available('emergency', Nurse, Ud.pat7,
+                                                 "2022-06-17")
+        self.assertIs(found.staff, Ud.nurse1)
+        self.assertIsNone(AppointmentSchedule().find_earliest_available(
+            'emergency', Doctor, Ud.pat7, "2022-06-17"))
+
+    def test_pool_size(self):
+        """The test checks if canceling and rebooking many times does not
+        grow the heap of professionals."""
+        schedule = build_schedule()
+        appointment = Appointment('consultation', Ud.doctor1, Ud.pat1,
+                                  "2022-06-14")
+        for _ in range(1000):
+            schedule.find_earliest_available('emergency', Doctor, Ud.pat7,
+                                             "2022-06-14")
+            schedule.cancel_appointment(appointment)
+            schedule.add_appointment(appointment)
+        pool = schedule._pools[Doctor]
+        self.assertLessEqual(len(pool.heap), 2 * len(pool.live))
+        found = schedule.find_earliest_available('emergency', Doctor, Ud.pat7,
+                                                 "2022-06-14")
+        self.assertEqual((found.staff, found.a_date),
+                         (Ud.doctor2, "2022-06-14"))
+
+    def test_make_appointment_any_staff(self):
+        """The test checks if the receptionist books the earliest free
+        professional when no staff is given, and only returns the
+        alternative of a consultation that cannot be made on the day."""
+        schedule = AppointmentSchedule()
+        schedule.add_staff([Ud.doctor1, Ud.doctor2])
+        first = Ud.recep1.make_appointment('consultation', None, Ud.pat1,
+                                           schedule, "2022-06-14")
+        second = Ud.recep1.make_appointment('consultation', Doctor, Ud.pat2,
+                                            schedule, "2022-06-14")
+        self.assertEqual({first.staff, second.staff},
+                         {Ud.doctor1, Ud.doctor2})
+        third = Ud.recep1.make_appointment('consultation', Doctor, Ud.pat3,
+                                           schedule, "2022-06-14")
+        self.assertEqual(third.a_date, "2022-06-15")
+        self.assertEqual(len(schedule.appointments), 2)
+        emergency = Ud.recep1.make_appointment('emergency', None, Ud.pat3,
+                                               schedule, "2022-06-14")
+        self.assertEqual(emergency.a_date, "2022-06-15")
+        self.assertIn(emergency, schedule)
+
+
+class ImportExportTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        """The test checks if a schedule written to a CSV and a JSON Lines
+        file is loaded back with the same appointments, with one Patient
+        object for each person."""
+        schedule = build_schedule()
+        schedule.add_appointment(Appointment('consultation', Ud.nurse1,
+                                             Ud.pat7, "2022-06-20", "10:30"))
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ('schedule.csv', 'schedule.jsonl'):
+                path = os.path.join(directory, name)
+                dump_file(schedule, path)
+                loaded = AppointmentSchedule()
+                patients = PatientRegistry()
+                self.assertEqual(load_file(loaded, path, [Ud.doctor1],
+                                           patients, batch_size=2), 7)
+                self.assertEqual(list(export_rows(loaded.appointments)),
+                                 list(export_rows(schedule.appointments)))
+                self.assertIs(loaded.appointments[0].staff, Ud.doctor1)
+                self.assertEqual(len({id(i.patient)
+                                      for i in loaded.appointments}),
+                                 len(patients._patients))
+
+    def test_wrong_row(self):
+        """The test checks if a wrong row is reported with its number."""
+        rows = list(export_rows(build_schedule().appointments))
+        rows[2]['a_date'] = "2022-13-01"
+        with self.assertRaisesRegex(ValueError, 'Row 3'):
+            list(import_rows(rows))
+        rows[2]['a_date'] = "2022-12-01"
+        rows[1]['staff_kind'] = 'surgeon'
+        with self.assertRaisesRegex(ValueError, 'Row 2'):
+            list(import_rows(rows))
+
+    def test_load_file_wrong_row(self):
+        """The test checks if a wrong row in a later batch of a file is
+        reported with its number in the file."""
+        schedule = build_schedule()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'schedule.csv')
+            dump_file(schedule, path)
+            with open(path, encoding='utf-8') as file:
+                lines = file.readlines()
+            lines[3] = lines[3].replace(schedule.appointments[2].a_date,
+                                        "2022-13-01")
+            with open(path, 'w', encoding='utf-8') as file:
+                file.writelines(lines)
+            with self.assertRaisesRegex(ValueError, 'Row 3'):
+                load_file(AppointmentSchedule(), path, batch_size=2)
+
+
+class SqliteScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'schedule.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_booking(self):
+        """The test checks if the receptionist books, finds the next free day
+        and cancels with the SQLite schedule as with AppointmentSchedule."""
+        with SqliteSchedule(self.path) as schedule:
+            build_into(schedule)
+            self.assertEqual(len(schedule), 6)
+            found = Ud.recep1.make_appointment('consultation', Ud.doctor1,
+                                               Ud.pat7, schedule,
+                                               "2022-06-15")
+            self.assertEqual(found.a_date, "2022-06-17")
+            self.assertNotIn(found, schedule)
+            emergency = Ud.recep1.make_appointment('emergency', Ud.doctor1,
+                                                   Ud.pat7, schedule,
+                                                   "2022-06-14")
+            self.assertEqual(emergency.a_date, "2022-06-17")
+            self.assertIn(emergency, schedule)
+            self.assertEqual(Ud.recep1.cancel_appointment(
+                'consultation', Ud.doctor1, Ud.pat2, schedule, "2022-06-15"),
+                Ud.p2_ar)
+            self.assertIsNone(Ud.recep1.cancel_appointment(
+                'consultation', Ud.doctor1, Ud.pat2, schedule, "2022-06-15"))
+            self.assertEqual(schedule.find_next_available(
+                'consultation', Ud.doctor1, Ud.pat7, "2022-06-14").a_date,
+                "2022-06-15")
+            self.assertEqual(
+                [i.a_date for i in schedule.appointments_between(
+                    Ud.doctor1, "2022-06-15", "2022-06-30")],
+                ["2022-06-16", "2022-06-17"])
+
+    def test_reopen(self):
+        """The test checks if appointments added in bulk are read back after
+        the database is reopened, made of the given staff and patients."""
+        with SqliteSchedule(self.path, slot_minutes=30,
+                            batch_size=2) as schedule:
+            schedule.add_appointments(
+                Appointment('consultation', Ud.nurse1, patient, "2022-06-20",
+                            a_time)
+                for patient, a_time in ((Ud.pat1, "09:00"),
+                                        (Ud.pat2, "09:30"),
+                                        (Ud.pat1, "10:30")))
+        with SqliteSchedule(self.path, [Ud.nurse1], [Ud.pat1],
+                            slot_minutes=30) as schedule:
+            self.assertFalse(schedule.is_available(Ud.nurse1, "2022-06-20",
+                                                   "09:30"))
+            found = schedule.find_next_available('consultation', Ud.nurse1,
+                                                 Ud.pat3, "2022-06-20")
+            self.assertEqual(found.a_time, "10:00")
+            upcoming = list(schedule.upcoming_appointments(Ud.pat1,
+                                                           "2022-06-01"))
+            self.assertEqual([i.a_time for i in upcoming],
+                             ["09:00", "10:30"])
+            self.assertIs(upcoming[0].patient, Ud.pat1)
+            self.assertIs(upcoming[0].staff, Ud.nurse1)
+
+    def test_appointments_view(self):
+        """The test checks if the appointments of the SQLite schedule can be
+        counted, indexed and iterated more than once like those of
+        AppointmentSchedule."""
+        expected = build_schedule()
+        with SqliteSchedule(self.path) as schedule:
+            build_into(schedule)
+            appointments = schedule.appointments
+            self.assertEqual(len(appointments), 6)
+            self.assertEqual(list(appointments), list(expected.appointments))
+            self.assertEqual(appointments, expected.appointments)
+            self.assertEqual(appointments[0], expected.appointments[0])
+            self.assertEqual(appointments[-1], expected.appointments[-1])
+            self.assertEqual(appointments[1:3], expected.appointments[1:3])
+            self.assertEqual(appointments[::2],
+                             list(expected.appointments)[::2])
+            self.assertIn(expected.appointments[2], appointments)
+            with self.assertRaises(IndexError):
+                appointments[6]
+            schedule.cancel_appointment(expected.appointments[0])
+            self.assertEqual(len(appointments), 5)
+
+    def test_nested_iterators(self):
+        """The test checks if queries made while open iterators hold every
+        reader connection are answered instead of waiting."""
+        def nested(schedule):
+            return [(i.a_date, j.a_date, j.staff.emp_num)
+                    for i in schedule.appointments_on("2022-06-14")
+                    for j in schedule.upcoming_appointments(i.patient,
+                                                            "2022-06-01")
+                    if schedule.is_available(i.staff, "2022-06-20")]
+
+        with SqliteSchedule(self.path, readers=1) as schedule:
+            build_into(schedule)
+            self.assertEqual(nested(schedule), nested(build_schedule()))
+
+    def test_cancel_returns_stored(self):
+        """The test checks if canceling returns the appointment read from
+        the deleted row, not the one given."""
+        with SqliteSchedule(self.path, [Ud.doctor1], [Ud.pat1]) as schedule:
+            schedule.add_appointment(Appointment('consultation', Ud.doctor1,
+                                                 Ud.pat1, "2022-06-14"))
+            given = Appointment('consultation', Ud.doctor1, Ud.pat1,
+                                "2022-06-14")
+            canceled = schedule.cancel_appointment(given)
+            self.assertEqual(canceled, given)
+            self.assertIsNot(canceled, given)
+            self.assertIs(canceled.patient, Ud.pat1)
+            self.assertEqual(len(schedule), 0)
+
+
+@unittest.skipIf(Analytics is None, 'NumPy is not installed')
+class AnalyticsTest(unittest.TestCase):
+
+    def test_reports(self):
+        """The test checks the weekly utilisation, the emergency share and
+        the lead times computed from the columns of a schedule."""
+        schedule = build_schedule()
+        Ud.recep1.make_appointment('emergency', Ud.doctor2, Ud.pat7,
+                                   schedule, "2022-06-17")
+        columns = Analytics.to_columns(
+            schedule.appointments,
+            ["2022-06-10", "2022-06-10", "2022-06-15", "2022-06-16",
+             "2022-06-18", "2022-06-19", "2022-06-19"])
+        self.assertEqual(len(columns), 7)
+        self.assertEqual(columns.staff_list, [Ud.doctor1, Ud.doctor2])
+        report = Analytics.utilisation(columns)
+        self.assertEqual(
+            [(columns.staff_list[staff].emp_num,
+              datetime.date.fromordinal(int(week)).isoformat(), booked)
+             for staff, week, booked in zip(report['staff'], report['week'],
+                                            report['booked'])],
+            [(Ud.doctor1.emp_num, "2022-06-13", 3),
+             (Ud.doctor2.emp_num, "2022-06-13", 3),
+             (Ud.doctor2.emp_num, "2022-06-20", 1)])
+        self.assertAlmostEqual(report['utilisation'][0], 3 / 7)
+        share = Analytics.emergency_share(columns)
+        self.assertEqual(list(share['emergencies']), [0, 1])
+        self.assertAlmostEqual(share['share'][1], 1 / 4)
+        lead = Analytics.lead_time(columns)
+        self.assertEqual(lead[Analytics.CONSULTATION]['count'], 6)
+        self.assertEqual(lead[Analytics.CONSULTATION]['median'], 1)
+        self.assertEqual(lead[Analytics.EMERGENCY]['median'], 1)
+        with self.assertRaises(ValueError):
+            Analytics.lead_time(Analytics.to_columns(schedule.appointments))
+
+    def test_lead_time_wide_span(self):
+        """The test checks the lead times when they span more days than the
+        type column can count to."""
+        schedule = AppointmentSchedule()
+        schedule.add_appointments(
+            [Appointment('consultation', Ud.doctor1, Ud.pat1, "2022-06-15"),
+             Appointment('emergency', Ud.doctor1, Ud.pat2, "2022-12-15")])
+        lead = Analytics.lead_time(Analytics.to_columns(
+            schedule.appointments, ["2022-06-15", "2022-06-15"]))
+        self.assertEqual(lead[Analytics.CONSULTATION]['median'], 0)
+        self.assertEqual(lead[Analytics.EMERGENCY]['median'], 183)
+        self.assertEqual(lead[Analytics.EMERGENCY]['mean'], 183)
+
+
+class WaitlistTest(unittest.TestCase):
+
+    def test_fill_on_cancellation(self):
+        """The test checks if a patient who got an alternative is waitlisted
+        and booked into a canceled day, the most urgent patient first."""
+        schedule = build_schedule()
+        booked = []
+        waitlist = Waitlist(notify=booked.append)
+        alternative = Ud.recep1.make_appointment(
+            'consultation', Ud.doctor1, Ud.pat7, schedule, "2022-06-15",
+            waitlist=waitlist)
+        self.assertEqual(alternative.a_date, "2022-06-17")
+        self.assertTrue(waitlist.add(Ud.pat4.request_appointment(
+            'consultation', Ud.doctor1, "2022-06-16"), urgency=1))
+        self.assertFalse(waitlist.add(Ud.pat7.request_appointment(
+            'consultation', Ud.doctor1, "2022-06-14")))
+        self.assertEqual([i.patient for i in waitlist.waiting(Ud.doctor1)],
+                         [Ud.pat4, Ud.pat7])
+        Ud.recep1.cancel_appointment('consultation', Ud.doctor1, Ud.pat1,
+                                     schedule, "2022-06-14",
+                                     waitlist=waitlist)
+        self.assertEqual(booked, [])
+        Ud.recep1.cancel_appointment('consultation', Ud.doctor1, Ud.pat3,
+                                     schedule, "2022-06-16",
+                                     waitlist=waitlist)
+        Ud.recep1.cancel_appointment('consultation', Ud.doctor1, Ud.pat2,
+                                     schedule, "2022-06-15",
+                                     waitlist=waitlist)
+        self.assertEqual(booked, [
+            Appointment('consultation', Ud.doctor1, Ud.pat4, "2022-06-16"),
+            Appointment('consultation', Ud.doctor1, Ud.pat7, "2022-06-15")])
+        self.assertTrue(all(i in schedule for i in booked))
+        self.assertEqual(len(waitlist), 0)
+
+    def test_bounded_and_stale(self):
+        """The test checks if a full waitlist only takes a more urgent
+        request and if stale requests are dropped."""
+        now = [0]
+        waitlist = Waitlist(capacity=2, max_age=60, clock=lambda: now[0])
+        requests = [patient.request_appointment('consultation', Ud.nurse1,
+                                                "2022-06-14")
+                    for patient in (Ud.pat1, Ud.pat2, Ud.pat3)]
+        self.assertTrue(waitlist.add(requests[0]))
+        self.assertTrue(waitlist.add(requests[1]))
+        self.assertFalse(waitlist.add(requests[2]))
+        self.assertTrue(waitlist.add(requests[2], urgency=2))
+        self.assertEqual(waitlist.waiting(Ud.nurse1),
+                         [requests[2], requests[0]])
+        now[0] = 61
+        self.assertTrue(waitlist.add(requests[1]))
+        self.assertEqual(waitlist.waiting(Ud.nurse1), [requests[1]])
+        now[0] = 200
+        freed = Appointment('consultation', Ud.nurse1, Ud.pat5, "2022-06-20")
+        self.assertIsNone(waitlist.fill(AppointmentSchedule(), freed))
+        self.assertEqual(len(waitlist), 0)
+
+    def test_eviction_bounded(self):
+        """The test checks if a full waitlist evicts the last request again
+        and again without keeping the evicted ones."""
+        waitlist = Waitlist(capacity=3)
+        patients = [Patient(f"patient{i}", "address", "phone")
+                    for i in range(100)]
+        for urgency, patient in enumerate(patients):
+            self.assertTrue(waitlist.add(patient.request_appointment(
+                'consultation', Ud.doctor1, "2022-06-14"), urgency))
+        self.assertEqual([i.patient for i in waitlist.waiting(Ud.doctor1)],
+                         patients[:-4:-1])
+        queue = waitlist._queues[Ud.doctor1.emp_num]
+        self.assertLessEqual(max(queue.stored, len(queue.last),
+                                 len(queue.by_time)), 2 * 3 + 16)
+
+    def test_fill_across_days(self):
+        """The test checks if the most urgent request for the freed day or
+        an earlier one is booked, and if requests for later days wait."""
+        waitlist = Waitlist()
+        for patient, a_date, urgency in ((Ud.pat1, "2022-06-20", 3),
+                                         (Ud.pat2, "2022-06-14", 0),
+                                         (Ud.pat3, "2022-06-15", 1),
+                                         (Ud.pat4, "2022-06-16", 2)):
+            waitlist.add(patient.request_appointment(
+                'consultation', Ud.doctor1, a_date), urgency=urgency)
+        schedule = AppointmentSchedule()
+        filled = [waitlist.fill(schedule, Appointment(
+                      'consultation', Ud.doctor1, Ud.pat5, a_date)).patient
+                  for a_date in ("2022-06-15", "2022-06-14", "2022-06-16")]
+        self.assertEqual(filled, [Ud.pat3, Ud.pat2, Ud.pat4])
+        self.assertEqual([i.patient for i in waitlist.waiting(Ud.doctor1)],
+                         [Ud.pat1])
+
+
+class PreemptionTest(unittest.TestCase):
+
+    def test_preempt_consultation(self):
+        """The test checks if an emergency takes the day of a consultation,
+        which is moved to the next free day and reported, and if a day
+        taken by an emergency is not preempted."""
+        schedule = build_schedule()
+        preemptions = []
+        emergency = Ud.recep1.make_appointment(
+            'emergency', Ud.doctor1, Ud.pat7, schedule, "2022-06-15",
+            preemptions=preemptions)
+        self.assertEqual(emergency.a_date, "2022-06-15")
+        self.assertEqual(len(preemptions), 1)
+        self.assertIs(preemptions[0].emergency, emergency)
+        self.assertEqual(preemptions[0].bumped, Ud.p2_ar)
+        self.assertEqual(preemptions[0].moved, Appointment(
+            'consultation', Ud.doctor1, Ud.pat2, "2022-06-17"))
+        self.assertNotIn(Ud.p2_ar, schedule)
+        self.assertEqual([i.a_date for i in
+                          schedule.staff_appointments(Ud.doctor1)],
+                         ["2022-06-14", "2022-06-15", "2022-06-16",
+                          "2022-06-17"])
+        again = Ud.recep1.make_appointment(
+            'emergency', Ud.doctor1, Ud.pat6, schedule, "2022-06-15",
+            preemptions=preemptions)
+        self.assertEqual(again.a_date, "2022-06-18")
+        self.assertEqual(len(preemptions), 1)
+
+    def test_preempt_slot(self):
+        """The test checks if an emergency takes a free slot of the day
+        before it preempts, and then takes the first consultation's slot
+        from the requested time."""
+        schedule = AppointmentSchedule(slot_minutes=60, day_end='12:00')
+        for patient, a_time in ((Ud.pat1, "09:00"), (Ud.pat2, "10:00")):
+            schedule.add_appointment(Appointment(
+                'consultation', Ud.nurse1, patient, "2022-06-14", a_time))
+        emergency, preemptions = schedule.preempt(Ud.nurse1, Ud.pat7,
+                                                  "2022-06-14", "09:00")
+        self.assertEqual((emergency.a_time, preemptions), ("11:00", []))
+        emergency, preemptions = schedule.preempt(Ud.nurse1, Ud.pat5,
+                                                  "2022-06-14", "09:30")
+        self.assertEqual(emergency.a_time, "10:00")
+        self.assertEqual((preemptions[0].moved.a_date,
+                          preemptions[0].moved.a_time),
+                         ("2022-06-15", "09:00"))
+
+    def test_preempt_other_schedules(self):
+        """The test checks if a sharded and a SQLite schedule preempt as
+        AppointmentSchedule does when given to the receptionist."""
+        with tempfile.TemporaryDirectory() as directory, \
+                ShardedSchedule(2) as sharded, \
+                SqliteSchedule(os.path.join(directory, 'schedule.db'),
+                               slot_minutes=60, day_end='11:00') as sqlite:
+            for schedule, expected in (
+                    (sharded, build_schedule()),
+                    (sqlite, AppointmentSchedule(slot_minutes=60,
+                                                 day_end='11:00'))):
+                build_into(schedule)
+                build_into(expected)
+                for patient, a_date in ((Ud.pat7, "2022-06-15"),
+                                        (Ud.pat8, "2022-06-15"),
+                                        (Ud.pat6, "2022-06-15")):
+                    preemptions = []
+                    emergency = Ud.recep1.make_appointment(
+                        'emergency', Ud.doctor1, patient, schedule, a_date,
+                        preemptions=preemptions)
+                    expected_preemptions = []
+                    self.assertEqual(emergency, Ud.recep1.make_appointment(
+                        'emergency', Ud.doctor1, patient, expected, a_date,
+                        preemptions=expected_preemptions))
+                    self.assertEqual(
+                        [(i.emergency, i.bumped, i.moved)
+                         for i in preemptions],
+                        [(i.emergency, i.bumped, i.moved)
+                         for i in expected_preemptions])
+                self.assertEqual(list(schedule.appointments),
+                                 list(expected.appointments))
+
+
 class HealthcareProfessionalTest(unittest.TestCase):
 
     def test_consultation(self):
@@ -249,6 +1476,12 @@ class HealthcareProfessionalTest(unittest.TestCase):
 def build_schedule():
     """This function create AppointmentSchedule's object for tests."""
     schedule = AppointmentSchedule()
+    build_into(schedule)
+    return schedule
+
+
+def build_into(schedule):
+    """This function adds the test appointments to the given schedule."""
 
     Ud.recep1.make_appointment(Ud.p3_ar.a_type, Ud.p3_ar.staff,
                                Ud.p3_ar.patient, schedule, Ud.p3_ar.a_date)
@@ -264,7 +1497,5 @@ def build_schedule():
                                Ud.p4_ar.patient, schedule, Ud.p4_ar.a_date)
     schedule.sort()
 
-    return schedule
-
 if __name__ == '__main__':
     unittest.main()